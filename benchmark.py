@@ -0,0 +1,241 @@
+"""
+===== Module Description =====
+
+This module measures how long the main parts of the parcel delivery system
+take on random data made by module generator: the priority queue, the random
+scheduler, every configuration of the greedy scheduler, the bin-packing and
+destination-clustering schedulers, the statistics of a fleet, and the
+functions that read the data files.
+
+The results are written to a JSON file. They can also be compared with the
+results of an earlier run, which flags every benchmark that became slower.
+
+For example, to record a baseline and later check for regressions:
+
+    python benchmark.py --parcels 1000 100000 --trucks 10 1000 \
+        --output data/baseline.json
+    python benchmark.py --parcels 1000 100000 --trucks 10 1000 \
+        --compare data/baseline.json
+"""
+from typing import Any, Callable, Dict, List, Optional
+import argparse
+import json
+import os
+import platform
+import tempfile
+from itertools import product
+from time import perf_counter
+from container import PriorityQueue, _shorter
+from scheduler import BinPackingScheduler, ClusterScheduler, GreedyScheduler, \
+    RandomScheduler
+from experiment import read_distance_map, read_parcel_table, read_parcels, \
+    read_trucks
+from generator import generate
+
+# The map file used by every benchmark. It has the distances between all of
+# the cities that module generator uses.
+MAP_FILE = 'data/map-data.txt'
+
+# The depot of the trucks in every benchmark.
+DEPOT = 'Toronto'
+
+# A benchmark is only flagged as a regression if it became slower by at
+# least this many seconds, so that timer noise on tiny inputs is ignored.
+NOISE_FLOOR = 0.001
+
+
+def _best_time(action: Callable[[Any], Any], setup: Callable[[], Any],
+               repeat: int) -> float:
+    """Return the least number of seconds taken by <repeat> calls to
+    <action>, each on a fresh argument returned by <setup>.
+
+    Only the call to <action> is timed.
+    """
+    best = None
+    for dummy in range(repeat):
+        arg = setup()
+        start = perf_counter()
+        action(arg)
+        elapsed = perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def _fill_and_drain(pq: PriorityQueue, items: List[Any]) -> None:
+    """Add every item in <items> to <pq> one at a time, then remove them all.
+    """
+    for item in items:
+        pq.add(item)
+    while not pq.is_empty():
+        pq.remove()
+
+
+def _benchmark_size(num_parcels: int, num_trucks: int, repeat: int,
+                    directory: str) -> Dict[str, float]:
+    """Return the time taken by each benchmark on <num_parcels> random parcels
+    and <num_trucks> random trucks, whose files are written to <directory>.
+
+    Each time is the best of <repeat> runs.
+    """
+    parcel_file = os.path.join(directory, f'parcels-{num_parcels}.txt')
+    truck_file = os.path.join(directory, f'trucks-{num_trucks}.txt')
+    generate(parcel_file, truck_file, num_parcels, num_trucks, seed=0)
+
+    def nothing() -> None:
+        """Return None, for benchmarks which need no fresh argument."""
+        return None
+
+    def fresh_trucks() -> list:
+        """Return a fleet of empty trucks read from the truck file."""
+        return read_trucks(truck_file, DEPOT).trucks
+
+    times = {
+        'read_parcels': _best_time(lambda dummy: read_parcels(parcel_file),
+                                   nothing, repeat),
+        'read_parcel_table': _best_time(
+            lambda dummy: read_parcel_table(parcel_file), nothing, repeat),
+        'read_trucks': _best_time(lambda dummy: read_trucks(truck_file, DEPOT),
+                                  nothing, repeat),
+        'read_distance_map': _best_time(
+            lambda dummy: read_distance_map(MAP_FILE), nothing, repeat)
+    }
+
+    parcels = read_parcels(parcel_file)
+    dmap = read_distance_map(MAP_FILE)
+    names = [parcel.destination for parcel in parcels]
+    volumes = [parcel.volume for parcel in parcels]
+    times['priority_queue_comparator'] = _best_time(
+        lambda pq: _fill_and_drain(pq, names),
+        lambda: PriorityQueue(_shorter), repeat)
+    times['priority_queue_key'] = _best_time(
+        lambda pq: _fill_and_drain(pq, volumes),
+        lambda: PriorityQueue(key=abs), repeat)
+
+    times['random'] = _best_time(
+        lambda trucks: RandomScheduler(0).schedule(parcels, trucks),
+        fresh_trucks, repeat)
+    for priority, par_order, truck_order in product(
+            ['volume', 'destination'], ['non-decreasing', 'non-increasing'],
+            ['non-decreasing', 'non-increasing']):
+        scheduler = GreedyScheduler({'parcel_priority': priority,
+                                     'parcel_order': par_order,
+                                     'truck_order': truck_order})
+        name = f'greedy_{priority}_{par_order}_{truck_order}'
+        times[name] = _best_time(
+            lambda trucks, s=scheduler: s.schedule(parcels, trucks),
+            fresh_trucks, repeat)
+    for algorithm in ['best-fit', 'first-fit']:
+        scheduler = BinPackingScheduler({'algorithm': algorithm})
+        times[algorithm] = _best_time(
+            lambda trucks, s=scheduler: s.schedule(parcels, trucks),
+            fresh_trucks, repeat)
+    times['cluster'] = _best_time(
+        lambda trucks: ClusterScheduler(dmap).schedule(parcels, trucks),
+        fresh_trucks, repeat)
+
+    fleet = read_trucks(truck_file, DEPOT)
+    GreedyScheduler({'parcel_priority': 'destination',
+                     'parcel_order': 'non-decreasing',
+                     'truck_order': 'non-decreasing'}).schedule(parcels,
+                                                                fleet.trucks)
+    times['fleet_stats'] = _best_time(lambda dummy: fleet.stats(dmap),
+                                      nothing, repeat)
+    return times
+
+
+def run_benchmarks(parcel_counts: List[int], truck_counts: List[int],
+                   repeat: int = 3) -> Dict[str, Any]:
+    """Run every benchmark on every combination of a number of parcels in
+    <parcel_counts> and a number of trucks in <truck_counts>, and return the
+    results in a form that can be written as JSON.
+
+    The times are in seconds, and are the best of <repeat> runs. They are
+    stored under 'results', with keys of the form
+    '<benchmark>/parcels=<number>/trucks=<number>'.
+
+    >>> results = run_benchmarks([20], [3], repeat=1)
+    >>> results['results']['fleet_stats/parcels=20/trucks=3'] >= 0
+    True
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for num_parcels, num_trucks in product(parcel_counts, truck_counts):
+            times = _benchmark_size(num_parcels, num_trucks, repeat, directory)
+            for name, seconds in times.items():
+                results[f'{name}/parcels={num_parcels}/trucks={num_trucks}'] \
+                    = seconds
+    return {'python': platform.python_version(),
+            'repeat': repeat,
+            'results': results}
+
+
+def find_regressions(current: Dict[str, Any], baseline: Dict[str, Any],
+                     tolerance: float = 0.2) -> List[str]:
+    """Return a description of every benchmark in both <current> and
+    <baseline> whose time in <current> is more than (1 + <tolerance>) times
+    its time in <baseline>, and more than NOISE_FLOOR seconds slower.
+
+    <current> and <baseline> are in the form returned by run_benchmarks.
+
+    >>> old = {'results': {'random/parcels=10/trucks=2': 1.0,
+    ...                    'fleet_stats/parcels=10/trucks=2': 1.0}}
+    >>> new = {'results': {'random/parcels=10/trucks=2': 1.5,
+    ...                    'fleet_stats/parcels=10/trucks=2': 1.1}}
+    >>> find_regressions(new, old)
+    ['random/parcels=10/trucks=2: 1.0000s -> 1.5000s (+50%)']
+    """
+    regressions = []
+    for name, seconds in current['results'].items():
+        before = baseline['results'].get(name)
+        if before is None:
+            continue
+        if seconds > before * (1 + tolerance) \
+                and seconds - before > NOISE_FLOOR:
+            change = (seconds - before) / before if before > 0 else 0.0
+            regressions.append(f'{name}: {before:.4f}s -> {seconds:.4f}s '
+                               f'(+{change:.0%})')
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Run the benchmarks with the command-line arguments <argv>, and return
+    the exit status: 1 if a regression was found, and 0 otherwise.
+    """
+    parser = argparse.ArgumentParser(
+        description='Time the parcel delivery system on random data.')
+    parser.add_argument('--parcels', type=int, nargs='+', default=[1000],
+                        help='numbers of parcels to benchmark')
+    parser.add_argument('--trucks', type=int, nargs='+', default=[10],
+                        help='numbers of trucks to benchmark')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='runs of each benchmark; the best is kept')
+    parser.add_argument('--output', help='write the results to this file')
+    parser.add_argument('--compare',
+                        help='flag regressions against the results in '
+                             'this file')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='slowdown allowed before a regression is '
+                             'flagged, as a fraction')
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.parcels, args.trucks, args.repeat)
+    for name, seconds in results['results'].items():
+        print(f'{name:<72} {seconds:.4f}s')
+    if args.output is not None:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+
+    if args.compare is None:
+        return 0
+    with open(args.compare, 'r') as file:
+        baseline = json.load(file)
+    regressions = find_regressions(results, baseline, args.tolerance)
+    for regression in regressions:
+        print(f'REGRESSION {regression}')
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(main())
@@ -4,7 +4,8 @@
 This module contains the Container and PriorityQueue classes.
 """
 
-from typing import Any, List, Callable
+from typing import Any, List, Callable, Iterable, Optional
+from heapq import heapify, heappop, heappush
 
 
 class Container:
@@ -37,6 +38,74 @@ def _shorter(a: str, b: str) -> bool:
     return len(a) < len(b)
 
 
+class _Entry:
+    """A wrapper that orders the items of a comparator-based PriorityQueue on
+    a heap.
+
+    === Public Attributes ===
+    item: the wrapped item.
+    order: the number of items added to the queue before <item>.
+    higher_priority: the comparator of the PriorityQueue holding this entry.
+    """
+    __slots__ = ('item', 'order', 'higher_priority')
+    item: Any
+    order: int
+    higher_priority: Callable[[Any, Any], bool]
+
+    def __init__(self, item: Any, order: int,
+                 higher_priority: Callable[[Any, Any], bool]) -> None:
+        """Initialize a new entry for <item>, the <order>-th item added.
+        """
+        self.item = item
+        self.order = order
+        self.higher_priority = higher_priority
+
+    def __lt__(self, other: '_Entry') -> bool:
+        """Return True iff <self> must be removed before <other>.
+
+        >>> _Entry('hat', 1, _shorter) < _Entry('fred', 0, _shorter)
+        True
+        >>> _Entry('arju', 1, _shorter) < _Entry('fred', 0, _shorter)
+        False
+        """
+        if self.higher_priority(self.item, other.item):
+            return True
+        if self.higher_priority(other.item, self.item):
+            return False
+        return self.order < other.order
+
+
+class _Reversed:
+    """A key wrapper which reverses the natural ordering of <value>.
+
+    === Public Attributes ===
+    value: the wrapped key.
+    """
+    __slots__ = ('value',)
+    value: Any
+
+    def __init__(self, value: Any) -> None:
+        """Initialize a new reversed key for <value>.
+        """
+        self.value = value
+
+    def __lt__(self, other: '_Reversed') -> bool:
+        """Return True iff <self>'s value is larger than <other>'s.
+
+        >>> _Reversed('b') < _Reversed('a')
+        True
+        """
+        return other.value < self.value
+
+    def __eq__(self, other: Any) -> bool:
+        """Return True iff <self> and <other> wrap equal values.
+
+        >>> _Reversed('a') == _Reversed('a')
+        True
+        """
+        return isinstance(other, _Reversed) and self.value == other.value
+
+
 class PriorityQueue(Container):
     """A queue of items that operates in FIFO-priority order.
 
@@ -45,41 +114,91 @@ class PriorityQueue(Container):
     (FIFO) order, meaning the item which was inserted *earlier* is the first one
     to be removed.
 
-    Priority is defined by the <higher_priority> function that is provided at
-    time of initialization.
+    Priority is defined either by the <higher_priority> function or by the
+    <key> function that is provided at time of initialization. With a <key>,
+    the item with the smallest key has the highest priority (the largest, if
+    <reverse> is True). Keys are computed once per item, so no Python-level
+    function is called when two items are compared; prefer a key over a
+    comparator on large inputs.
+
+    The items are kept in a binary heap, so add and remove take O(log n) time
+    and add_all loads a batch of n items in O(n) time.
 
     All objects in the container must be of the same type.
 
     === Private Attributes ===
     _queue:
-      The end of the list represents the *front* of the queue, that is,
-      the next item to be removed.
+      A binary heap of entries, one per item. The entry at index 0 wraps the
+      next item to be removed.
     _higher_priority:
-      A function that compares two items by their priority.
+      A function that compares two items by their priority, or None if this
+      queue orders its items by <_key>.
       If <_higher_priority>(x, y) is true, then x has higher priority than y
       and should be removed from the queue before y.
+    _key:
+      A function mapping an item to the value it is ordered by, or None if
+      this queue orders its items by <_higher_priority>.
+    _reverse:
+      True iff larger keys have higher priority.
+    _count:
+      The number of items ever added to this queue. It is used to break ties
+      in FIFO order.
 
     === Representation Invariants ===
-    - all elements of <_queue> are of the same type.
-    - the elements of <_queue> are appropriate arguments for the
-      function <_higher_priority>.
-    - the elements of <_queue> are in order according to the
-      function <_higher_priority>.
+    - exactly one of <_higher_priority> and <_key> is None.
+    - all elements of <_queue> wrap items of the same type.
+    - the items of <_queue> are appropriate arguments for the
+      function <_higher_priority> or <_key>.
+    - <_queue> satisfies the heap property: no entry is smaller than the entry
+      at the front of it.
     """
     _queue: List[Any]
-    _higher_priority: Callable[[Any, Any], bool]
+    _higher_priority: Optional[Callable[[Any, Any], bool]]
+    _key: Optional[Callable[[Any], Any]]
+    _reverse: bool
+    _count: int
+
+    def __init__(self,
+                 higher_priority: Optional[Callable[[Any, Any], bool]] = None,
+                 key: Optional[Callable[[Any], Any]] = None,
+                 reverse: bool = False,
+                 items: Optional[Iterable[Any]] = None) -> None:
+        """Initialize this to a PriorityQueue holding the items of <items>, or
+        an empty PriorityQueue if <items> is None.
+
+        For any two elements x and y of the queue, if <higher_priority>(x, y)
+        is true, then x has higher priority than y. If <key> is given instead,
+        x has higher priority than y if <key>(x) < <key>(y), or if
+        <key>(x) > <key>(y) when <reverse> is True.
 
-    def __init__(self, higher_priority: Callable[[Any, Any], bool]) -> None:
-        """Initialize this to an empty PriorityQueue. For any two elements x
-        and y of the queue, if <higher_priority>(x, y) is true, then x has
-        higher priority than y.
+        Precondition: exactly one of <higher_priority> and <key> is not None.
 
         >>> pq = PriorityQueue(str.__lt__)
         >>> pq.is_empty()
         True
+        >>> pq = PriorityQueue(key=len, items=['fred', 'arju', 'hat'])
+        >>> pq.remove()
+        'hat'
         """
         self._queue = []
         self._higher_priority = higher_priority
+        self._key = key
+        self._reverse = reverse
+        self._count = 0
+        if items is not None:
+            self.add_all(items)
+
+    def _entry(self, item: Any) -> Any:
+        """Return the heap entry for <item>, the next item added to this
+        PriorityQueue.
+        """
+        order = self._count
+        self._count += 1
+        if self._key is None:
+            return _Entry(item, order, self._higher_priority)
+        if self._reverse:
+            return _Reversed(self._key(item)), order, item
+        return self._key(item), order, item
 
     def add(self, item: Any) -> None:
         """Add <item> to this PriorityQueue.
@@ -93,20 +212,33 @@ class PriorityQueue(Container):
         >>> pq.add('hat')
         >>> # 'arju' and fred have the same priority, but 'arju' is behind
         >>> # 'fred' in the queue because it was added later.
-        >>> pq._queue
-        ['monalisa', 'arju', 'fred', 'hat']
         >>> pq.remove()
         'hat'
-        >>> pq._queue
-        ['monalisa', 'arju', 'fred']
+        >>> pq.remove()
+        'fred'
         """
-        c = len(self._queue)
-        for k in range(len(self._queue)):
-            if not self._higher_priority(item, self._queue[k]):
-                c = k
-                break
+        heappush(self._queue, self._entry(item))
+
+    def add_all(self, items: Iterable[Any]) -> None:
+        """Add every item of <items> to this PriorityQueue, in order.
 
-        self._queue.insert(c, item)
+        A batch that is at least as large as this PriorityQueue is loaded in
+        linear time.
+
+        >>> pq = PriorityQueue(key=len, reverse=True)
+        >>> pq.add_all(['fred', 'arju', 'monalisa', 'hat'])
+        >>> pq.remove()
+        'monalisa'
+        >>> pq.remove()
+        'fred'
+        """
+        entries = [self._entry(item) for item in items]
+        if len(entries) < len(self._queue):
+            for entry in entries:
+                heappush(self._queue, entry)
+        else:
+            self._queue.extend(entries)
+            heapify(self._queue)
 
     def remove(self) -> Any:
         """Remove and return the next item from this PriorityQueue.
@@ -129,7 +261,10 @@ class PriorityQueue(Container):
         >>> pq.remove()
         'monalisa'
         """
-        return self._queue.pop()
+        entry = heappop(self._queue)
+        if self._key is None:
+            return entry.item
+        return entry[2]
 
     def is_empty(self) -> bool:
         """Return True iff this PriorityQueue is empty.
@@ -143,11 +278,21 @@ class PriorityQueue(Container):
         """
         return not self._queue
 
+    def __len__(self) -> int:
+        """Return the number of items in this PriorityQueue.
+
+        >>> pq = PriorityQueue(key=len, items=['fred', 'hat'])
+        >>> len(pq)
+        2
+        """
+        return len(self._queue)
+
 
 if __name__ == '__main__':
     import python_ta
     python_ta.check_all(config={
-        'allowed-import-modules': ['doctest', 'python_ta', 'typing'],
+        'allowed-import-modules': ['doctest', 'python_ta', 'typing',
+                                   'heapq'],
         'disable': ['E1136'],
         'max-attributes': 15,
     })
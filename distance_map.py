@@ -6,18 +6,137 @@ and look up distances between cities. This class does not read distances
 from the map file. (All reading from files is done in module experiment.)
 Instead, it provides public methods that can be called to store and look up
 distances.
+
+It also contains the class CityRegistry, which interns city names as small
+integer ids. A DistanceMap can look up distances by city id in a dense
+array instead of hashing a pair of names, and can fill that array with the
+shortest distance between every pair of cities.
 """
-from typing import Dict, Tuple
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+from array import array
+from heapq import heappop, heappush
+from time import perf_counter
+import hashlib
+import json
+import os
+
+# A city is referred to either by its name or by its id in a CityRegistry.
+City = Union[str, int]
+
+
+class CityRegistry:
+    """A registry which assigns each city name a unique integer id. Ids are
+    assigned in the order in which cities are first seen, starting at 0.
+
+    === Private Attributes ===
+    _ids: Maps the name of each registered city to its id.
+    _names: The name of each registered city, indexed by id.
+
+    === Representation Invariants ===
+    - _ids[_names[i]] == i for every id i
+    """
+    # Attribute types
+    _ids: Dict[str, int]
+    _names: List[str]
+
+    def __init__(self) -> None:
+        """Initialize a new CityRegistry with no cities.
+
+        >>> len(CityRegistry())
+        0
+        """
+        self._ids = {}
+        self._names = []
+
+    def __len__(self) -> int:
+        """Return the number of cities in this CityRegistry.
+        """
+        return len(self._names)
+
+    def __contains__(self, name: str) -> bool:
+        """Return True iff the city <name> is in this CityRegistry.
+        """
+        return name in self._ids
+
+    def intern(self, name: str) -> int:
+        """Return the id of the city <name>, registering it first if it is not
+        in this CityRegistry yet.
+
+        >>> r = CityRegistry()
+        >>> r.intern('Toronto')
+        0
+        >>> r.intern('Hamilton')
+        1
+        >>> r.intern('Toronto')
+        0
+        """
+        i = self._ids.get(name)
+        if i is None:
+            i = len(self._names)
+            self._ids[name] = i
+            self._names.append(name)
+        return i
+
+    def id_of(self, name: str) -> Optional[int]:
+        """Return the id of the city <name>, or None if it is not in this
+        CityRegistry.
+
+        >>> r = CityRegistry()
+        >>> r.intern('Toronto')
+        0
+        >>> r.id_of('Toronto')
+        0
+        >>> print(r.id_of('Hamilton'))
+        None
+        """
+        return self._ids.get(name)
+
+    def name_of(self, city_id: int) -> str:
+        """Return the name of the city with id <city_id>.
+
+        Precondition: 0 <= city_id < len(self)
+
+        >>> r = CityRegistry()
+        >>> r.intern('Toronto')
+        0
+        >>> r.name_of(0)
+        'Toronto'
+        """
+        return self._names[city_id]
 
 
 class DistanceMap:
     """A distance map which records distance between pairs of cities
 
+    Cities can be given either by name or by their id in <cities>. Lookups by
+    id are answered from a dense array, which is built the first time it is
+    needed.
+
+    After precompute_shortest_paths, every lookup gives the length of the
+    shortest path between the two cities over the recorded distances, until
+    another distance is recorded.
+
+    === Public Attributes ===
+    cities: Interns the name of every city which has a recorded distance.
+
     === Private Attributes ===
     _rec: Records the distance between pairs of cities
+    _matrix: The distance from the city with id i to the city with id j is
+    stored at index i * <_size> + j, and is -1 if it is not recorded. None if
+    the array has not been built since the last city was added.
+    _size: The number of cities when <_matrix> was built.
+    _shortest: True iff <_matrix> holds shortest-path distances, which are
+    then used for lookups by name as well as by id.
+    _version: The number of times a distance has been recorded. It changes
+    whenever a distance may have changed.
     """
     # Attribute types
+    cities: CityRegistry
     _rec: Dict[Tuple[str, str], int]
+    _matrix: Optional[array]
+    _size: int
+    _shortest: bool
+    _version: int
 
     def __init__(self) -> None:
         """Initialize a new DistanceMap
@@ -27,7 +146,121 @@ class DistanceMap:
         {}
         """
 
+        self.cities = CityRegistry()
         self._rec = {}
+        self._matrix = None
+        self._size = 0
+        self._shortest = False
+        self._version = 0
+
+    def city_id(self, name: str) -> int:
+        """Return the id of the city <name>, registering it if this DistanceMap
+        has not seen it before.
+
+        >>> d = DistanceMap()
+        >>> d.add_distance('Toronto', 'Vancouver', 1000)
+        >>> d.city_id('Vancouver')
+        1
+        """
+        return self.cities.intern(name)
+
+    def build_matrix(self) -> None:
+        """Build the dense array used to look up distances by city id.
+
+        >>> d = DistanceMap()
+        >>> d.add_distance('Toronto', 'Vancouver', 1000, 1001)
+        >>> d.build_matrix()
+        >>> d._matrix.tolist()
+        [-1, 1000, 1001, -1]
+        """
+        n = len(self.cities)
+        matrix = array('q', [-1]) * (n * n)
+        for (a, b), dist in self._rec.items():
+            matrix[self.cities.id_of(a) * n + self.cities.id_of(b)] = dist
+        self._matrix = matrix
+        self._size = n
+        self._shortest = False
+
+    def precompute_shortest_paths(self, cache_file: Optional[str] = None) \
+            -> float:
+        """Replace the distance between every pair of cities by the length of
+        the shortest path between them over the recorded distances, and
+        return the number of seconds this took.
+
+        The distance from a city to itself becomes 0, and the distance between
+        two cities which no path connects stays -1. A distance recorded after
+        this call undoes it.
+
+        If <cache_file> is not None, the distances are loaded from it if it was
+        written for the same recorded distances, and are computed and written
+        to it otherwise.
+
+        Precondition: every recorded distance is >= 0.
+
+        >>> d = DistanceMap()
+        >>> d.add_distance('Toronto', 'Hamilton', 60)
+        >>> d.add_distance('Hamilton', 'London', 120)
+        >>> d.add_distance('Toronto', 'London', 200)
+        >>> seconds = d.precompute_shortest_paths()
+        >>> d.distance('Toronto', 'London'), d.distance('London', 'London')
+        (180, 0)
+        >>> d.add_distance('Toronto', 'Guelph', 90)
+        >>> d.distance('Toronto', 'London'), d.distance('Hamilton', 'Guelph')
+        (200, -1)
+        """
+        start = perf_counter()
+        signature = self._signature()
+        names = [self.cities.name_of(k) for k in range(len(self.cities))]
+        matrix = None
+        if cache_file is not None and os.path.exists(cache_file):
+            matrix = _read_matrix(cache_file, signature, names)
+        if matrix is None:
+            matrix = self._shortest_paths()
+            if cache_file is not None:
+                _write_matrix(cache_file, signature, names, matrix)
+
+        self._matrix = matrix
+        self._size = len(names)
+        self._shortest = True
+        self._version += 1
+        return perf_counter() - start
+
+    def _shortest_paths(self) -> array:
+        """Return a dense array of the shortest-path distances between every
+        pair of cities, in the layout of <_matrix>, by running Dijkstra's
+        algorithm from every city.
+        """
+        n = len(self.cities)
+        adjacent = [[] for dummy in range(n)]
+        for (a, b), dist in self._rec.items():
+            adjacent[self.cities.id_of(a)].append((self.cities.id_of(b), dist))
+
+        matrix = array('q', [-1]) * (n * n)
+        for source in range(n):
+            row = source * n
+            heap = [(0, source)]
+            while heap:
+                dist, city = heappop(heap)
+                if matrix[row + city] != -1:
+                    continue
+                matrix[row + city] = dist
+                for other, leg in adjacent[city]:
+                    if matrix[row + other] == -1:
+                        heappush(heap, (dist + leg, other))
+        return matrix
+
+    def _signature(self) -> str:
+        """Return a digest of the distances recorded in this DistanceMap.
+
+        >>> d = DistanceMap()
+        >>> d.add_distance('Toronto', 'Hamilton', 60)
+        >>> d2 = DistanceMap()
+        >>> d2.add_distance('Hamilton', 'Toronto', 60)
+        >>> d._signature() == d2._signature()
+        True
+        """
+        records = sorted(self._rec.items())
+        return hashlib.sha256(repr(records).encode()).hexdigest()
 
     def add_distance(self, a: str, b: str, di1: int, di2: int = None) -> None:
         """Record that the distance from city a to city b is di1, and the
@@ -49,16 +282,28 @@ class DistanceMap:
         {('Toronto', 'Vancouver'): 1000, ('Vancouver', 'Toronto'): 1000}
         """
 
-        self._rec[(a, b)] = di1
         if di2 is None:
-            self._rec[(b, a)] = di1
+            di2 = di1
+        self._version += 1
+        self._rec[(a, b)] = di1
+        self._rec[(b, a)] = di2
+
+        i = self.cities.intern(a)
+        j = self.cities.intern(b)
+        if self._matrix is not None and max(i, j) < self._size \
+                and not self._shortest:
+            self._matrix[i * self._size + j] = di1
+            self._matrix[j * self._size + i] = di2
         else:
-            self._rec[(b, a)] = di2
+            self._matrix = None
+            self._shortest = False
 
-    def distance(self, a: str, b: str) -> int:
+    def distance(self, a: City, b: City) -> int:
         """Return the distance from city a and city b. If this distance is not
         recorded, return -1
 
+        <a> and <b> are either both names or both ids of cities.
+
         >>> d = DistanceMap()
         >>> d.add_distance('Toronto', 'Vancouver', 1000, 1001)
         >>> print(d.distance('Toronto', 'Vancouver'))
@@ -68,17 +313,94 @@ class DistanceMap:
         >>> d.add_distance('Toronto', 'Hamilton', 900)
         >>> print(d.distance('Toronto', 'Hamilton'))
         900
+        >>> print(d.distance(d.city_id('Toronto'), d.city_id('Hamilton')))
+        900
+        """
+
+        if isinstance(a, str):
+            if not self._shortest:
+                return self._rec.get((a, b), -1)
+            a = self.cities.id_of(a)
+            b = self.cities.id_of(b)
+            if a is None or b is None:
+                return -1
+        elif self._matrix is None:
+            self.build_matrix()
+        if a >= self._size or b >= self._size:
+            return -1
+        return self._matrix[a * self._size + b]
+
+    def version(self) -> int:
+        """Return a number which changes whenever a distance recorded in this
+        DistanceMap may have changed, so that distances computed from it can
+        be cached until then.
+
+        >>> d = DistanceMap()
+        >>> v = d.version()
+        >>> d.add_distance('Toronto', 'Hamilton', 100)
+        >>> d.version() == v
+        False
+        """
+        return self._version
+
+    def route_distance(self, route: Sequence[City]) -> int:
+        """Return the sum of the distances between consecutive cities of
+        <route>, counting -1 for each distance that is not recorded.
+
+        >>> d = DistanceMap()
+        >>> d.add_distance('Toronto', 'Hamilton', 100)
+        >>> d.route_distance(['Toronto', 'Hamilton', 'Toronto'])
+        200
         """
+        dist = 0
+        for k in range(len(route) - 1):
+            dist += self.distance(route[k], route[k + 1])
+        return dist
+
+
+def _write_matrix(cache_file: str, signature: str, names: List[str],
+                  matrix: array) -> None:
+    """Write <matrix>, the shortest-path distances between the cities <names>
+    computed from the recorded distances with digest <signature>, to
+    <cache_file>.
 
-        if (a, b) in self._rec:
-            return self._rec[(a, b)]
-        return -1
+    The file holds one line of JSON describing the matrix, followed by the
+    matrix itself in binary.
+    """
+    header = {'signature': signature, 'cities': names,
+              'itemsize': matrix.itemsize}
+    with open(cache_file, 'wb') as file:
+        file.write(json.dumps(header).encode() + b'\n')
+        matrix.tofile(file)
+
+
+def _read_matrix(cache_file: str, signature: str,
+                 names: List[str]) -> Optional[array]:
+    """Return the shortest-path distances stored in <cache_file>, or None if
+    it was not written for the cities <names> and the recorded distances with
+    digest <signature>.
+    """
+    with open(cache_file, 'rb') as file:
+        header = json.loads(file.readline())
+        if header.get('signature') != signature \
+                or header.get('cities') != names \
+                or header.get('itemsize') != array('q').itemsize:
+            return None
+        matrix = array('q')
+        try:
+            matrix.fromfile(file, len(names) * len(names))
+        except EOFError:
+            return None
+    return matrix
 
 
 if __name__ == '__main__':
     import python_ta
     python_ta.check_all(config={
-        'allowed-import-modules': ['doctest', 'python_ta', 'typing'],
+        'allowed-import-modules': ['doctest', 'python_ta', 'typing',
+                                   'array', 'heapq', 'time',
+                                   'hashlib', 'json', 'os'],
+        'allowed-io': ['_write_matrix', '_read_matrix'],
         'disable': ['E1136'],
         'max-attributes': 15,
     })
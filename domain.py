@@ -2,10 +2,25 @@
 ===== Module Description =====
 
 This module contains the classes required to represent the entities
-in the simulation: Parcel, Truck and Fleet.
+in the simulation: Parcel, Truck and Fleet, as well as ParcelTable, which
+stores a large number of parcels compactly.
 """
-from typing import List, Dict
-from distance_map import DistanceMap
+from typing import List, Dict, Iterable, Iterator, Optional, Tuple, Union
+from array import array
+import json
+import mmap
+import sys
+from distance_map import DistanceMap, City, CityRegistry
+
+# If True, every call to Truck.sum_vol checks the Truck's running load against
+# a full recount of its parcels. This is meant for debugging only.
+CHECK_LOAD = False
+
+# The format named in the header of a fleet snapshot written by Fleet.save.
+_SNAPSHOT_FORMAT = 'fleet-snapshot/1'
+
+# The number of 64-bit integers of a fleet snapshot written at a time.
+_SNAPSHOT_CHUNK = 1 << 16
 
 
 class Parcel:
@@ -16,14 +31,19 @@ class Parcel:
     volume: volume of the parcel, measured in units of cubic centimetres (cc).
     source: the name of the city the parcel came from.
     destination: the name of the city where the parcel must be delivered to.
+
+    Cities may also be given by their ids in the CityRegistry of a
+    DistanceMap, as long as every Parcel and Truck in a Fleet does the same.
     """
+    __slots__ = ('par_id', 'volume', 'source', 'destination')
     # Attribute types
     par_id: int
     volume: int
-    source: str
-    destination: str
+    source: City
+    destination: City
 
-    def __init__(self, par_id: int, volume: int, source: str, des: str) -> None:
+    def __init__(self, par_id: int, volume: int, source: City,
+                 des: City) -> None:
         """Initialize a new parcel.
 
         Precondition: volume > 0.
@@ -45,30 +65,162 @@ class Parcel:
         self.volume = volume
 
 
+class ParcelTable:
+    """A table of parcels, stored compactly column by column.
+
+    Millions of parcels can be held without creating a Parcel object for
+    each: a Parcel is only created when one is looked up or iterated over.
+    These Parcels name their cities, and are equal in value but not identical
+    to the Parcels produced by earlier lookups.
+
+    A ParcelTable can be given to a Scheduler wherever a list of Parcels is
+    expected.
+
+    === Public Attributes ===
+    cities: interns the name of the source and destination of every parcel.
+
+    === Private Attributes ===
+    _ids: The id of each parcel.
+    _volumes: The volume of each parcel.
+    _sources: The id in <cities> of the source of each parcel.
+    _destinations: The id in <cities> of the destination of each parcel.
+
+    === Representation Invariants ===
+    - <_ids>, <_volumes>, <_sources> and <_destinations> have equal lengths.
+    """
+    # Attribute types
+    cities: CityRegistry
+    _ids: array
+    _volumes: array
+    _sources: array
+    _destinations: array
+
+    def __init__(self, cities: Optional[CityRegistry] = None) -> None:
+        """Initialize an empty ParcelTable which interns city names in
+        <cities>, or in a new CityRegistry if <cities> is None.
+
+        >>> len(ParcelTable())
+        0
+        """
+        self.cities = CityRegistry() if cities is None else cities
+        self._ids = array('i')
+        self._volumes = array('i')
+        self._sources = array('i')
+        self._destinations = array('i')
+
+    def append(self, parcel: Parcel) -> None:
+        """Append the id, volume, source and destination of <parcel> to this
+        ParcelTable.
+
+        >>> table = ParcelTable()
+        >>> table.append(Parcel(27, 5, 'Toronto', 'Hamilton'))
+        >>> len(table)
+        1
+        """
+        self.extend([parcel.par_id], [parcel.volume], [parcel.source],
+                    [parcel.destination])
+
+    def extend(self, ids: Iterable[int], volumes: Iterable[int],
+               sources: Iterable[str], destinations: Iterable[str]) -> None:
+        """Append the parcels whose ids, volumes, sources and destinations
+        are given, in order, by <ids>, <volumes>, <sources> and <destinations>.
+
+        Precondition: the four iterables have equal lengths.
+
+        >>> table = ParcelTable()
+        >>> table.extend([27, 28], [5, 6], ['Toronto'] * 2, ['York', 'Guelph'])
+        >>> [p.destination for p in table]
+        ['York', 'Guelph']
+        """
+        self._ids.extend(ids)
+        self._volumes.extend(volumes)
+        self._sources.extend(map(self.cities.intern, sources))
+        self._destinations.extend(map(self.cities.intern, destinations))
+
+    def __len__(self) -> int:
+        """Return the number of parcels in this ParcelTable.
+        """
+        return len(self._ids)
+
+    def __getitem__(self, k: int) -> Parcel:
+        """Return a Parcel with the values of the parcel at index <k> of this
+        ParcelTable.
+
+        >>> table = ParcelTable()
+        >>> table.append(Parcel(27, 5, 'Toronto', 'Hamilton'))
+        >>> p = table[0]
+        >>> p.par_id, p.volume, p.source, p.destination
+        (27, 5, 'Toronto', 'Hamilton')
+        """
+        name_of = self.cities.name_of
+        return Parcel(self._ids[k], self._volumes[k],
+                      name_of(self._sources[k]),
+                      name_of(self._destinations[k]))
+
+    def __iter__(self) -> Iterator[Parcel]:
+        """Return an iterator which creates the Parcels of this ParcelTable, in
+        order, one at a time.
+        """
+        name_of = self.cities.name_of
+        return map(Parcel, self._ids, self._volumes,
+                   map(name_of, self._sources),
+                   map(name_of, self._destinations))
+
+
 class Truck:
     """A Truck which delivers Parcels.
 
     === Public Attributes ===
     truck_id: the Truck's unique id
-    all_parcels: list of all parcels packed in the truck
+    all_parcels: list of all parcels packed in the truck, in the order they \
+    were packed. It must only be changed through the Truck's methods.
     capacity: the volume capacity of the Truck
     route: A list which records the route the Truck takes. The Truck's route \
-    ends where it starts.
+    ends where it starts. It holds city names, or city ids if the Truck's \
+    depot and Parcels use city ids. It must only be changed through the \
+    Truck's methods, which keep its cached distance up to date.
+
+    === Private Attributes ===
+    _load: the sum of the volumes of all parcels packed in the Truck. It is
+    updated whenever a parcel is packed or unpacked, so that it never has to
+    be recounted.
+    _distance: the (DistanceMap, DistanceMap version, distance) of the last
+    distance computed for <route>, or None if <route> has changed since.
+    _parcels: maps the id of every parcel packed in the Truck to the parcel,
+    in the order they were packed, so that a parcel is unpacked in O(1) time.
+    _parcel_list: <all_parcels>, or None if a parcel has been unpacked since
+    it was last built from <_parcels>.
+    _stops: maps every destination of the parcels packed in the Truck to the
+    number of those parcels going there, so that a destination is dropped
+    from <route> when its last parcel is unpacked.
+    _owners: maps the id of every parcel packed onto a truck of the Fleet
+    this Truck was added to, including this one, to that truck, or None if
+    this Truck has not been added to a Fleet.
 
     === Representation invariants ===
     - capacity > 0
     - capacity >= sum of the volumes of all parcels in the Truck >= 0
+    - _load == sum of the volumes of all parcels in the Truck
+    - No two parcels in the Truck have the same id.
+    - If _owners is not None, _owners[par_id] is self for the id of every
+      parcel in the Truck.
     - If len(route) >= 2, route[0] = route[-1]. In other words, if a Truck has
     at least one parcel to deliver, then the Truck's route ends where it starts.
     """
-
+    __slots__ = ('truck_id', 'capacity', 'route', '_load', '_distance',
+                 '_parcels', '_parcel_list', '_stops', '_owners')
     # Attribute types
     truck_id: int
-    all_parcels: List[Parcel]
     capacity: int
-    route: List[str]
-
-    def __init__(self, t_id: int, vol_cap: int, depot: str) -> None:
+    route: List[City]
+    _load: int
+    _distance: Optional[Tuple[DistanceMap, int, int]]
+    _parcels: Dict[int, Parcel]
+    _parcel_list: Optional[List[Parcel]]
+    _stops: Dict[City, int]
+    _owners: Optional[Dict[int, 'Truck']]
+
+    def __init__(self, t_id: int, vol_cap: int, depot: City) -> None:
         """ Initialize a new Truck
 
         <depot> is the city from where the Truck starts.
@@ -88,7 +240,27 @@ class Truck:
         self.truck_id = t_id
         self.capacity = vol_cap
         self.route = [depot]
-        self.all_parcels = []
+        self._load = 0
+        self._distance = None
+        self._parcels = {}
+        self._parcel_list = []
+        self._stops = {}
+        self._owners = None
+
+    @property
+    def all_parcels(self) -> List[Parcel]:
+        """Return the list of all parcels packed in this truck, in the order
+        they were packed.
+
+        >>> t1 = Truck(1000, 20, 'Toronto')
+        >>> t1.pack(Parcel(1, 5, 'Toronto', 'Hamilton'))
+        True
+        >>> [p.par_id for p in t1.all_parcels]
+        [1]
+        """
+        if self._parcel_list is None:
+            self._parcel_list = list(self._parcels.values())
+        return self._parcel_list
 
     def sum_vol(self) -> int:
         """Return the sum of the volumes of all parcels packed in this truck
@@ -105,12 +277,38 @@ class Truck:
         >>> t1.sum_vol()
         22
         """
+        if CHECK_LOAD:
+            assert self._load == self._recount_vol(), \
+                'Truck ' + str(self.truck_id) + ' has a stale load'
+        return self._load
+
+    def _recount_vol(self) -> int:
+        """Return the sum of the volumes of all parcels packed in this truck,
+        recounted from <self>.all_parcels.
+
+        >>> t1 = Truck(1000, 100, 'Toronto')
+        >>> t1.pack(Parcel(1, 5, 'Buffalo', 'Hamilton'))
+        True
+        >>> t1._recount_vol()
+        5
+        """
         sum_all = 0
         for par in self.all_parcels:
             sum_all += par.volume
 
         return sum_all
 
+    def unused_space(self) -> int:
+        """Return the volume still available in this truck
+
+        >>> t1 = Truck(1000, 100, 'Toronto')
+        >>> t1.pack(Parcel(1, 5, 'Buffalo', 'Hamilton'))
+        True
+        >>> t1.unused_space()
+        95
+        """
+        return self.capacity - self.sum_vol()
+
     def pack(self, parcel: Parcel) -> bool:
         """Return True if parcel can be packed in <self> , false otherwise.
 
@@ -120,6 +318,10 @@ class Truck:
         packed to this truck, self.all_parcels and <self>'s route are updated
         because this truck now has to deliver an additional Parcel.
 
+        Raise ValueError if a parcel with the same id as <parcel> is already
+        packed in this truck, or in another truck of the Fleet this truck was
+        added to.
+
         >>> t1 = Truck(1000, 20, 'Toronto')
         >>> p1 = Parcel(1, 17, 'Buffalo', 'Hamilton')
         >>> t1.pack(p1)
@@ -136,19 +338,152 @@ class Truck:
         >>> t1.sum_vol()
         17
         """
-        sum_all = self.sum_vol()
-
-        if sum_all + parcel.volume <= self.capacity:
-            self.all_parcels.append(parcel)
+        if parcel.par_id in self._parcels:
+            raise ValueError(f'parcel {parcel.par_id} is already packed in '
+                             f'truck {self.truck_id}')
+        if self._owners is not None and parcel.par_id in self._owners:
+            raise ValueError(f'parcel {parcel.par_id} is already packed in '
+                             f'truck {self._owners[parcel.par_id].truck_id}')
+        if self.sum_vol() + parcel.volume <= self.capacity:
+            self._parcels[parcel.par_id] = parcel
+            if self._owners is not None:
+                self._owners[parcel.par_id] = self
+            if self._parcel_list is not None:
+                self._parcel_list.append(parcel)
+            self._stops[parcel.destination] = \
+                self._stops.get(parcel.destination, 0) + 1
+            self._load += parcel.volume
             if len(self.route) == 1:
                 self.route.append(parcel.destination)
                 self.route.append(self.route[0])
+                self._distance = None
             elif parcel.destination != self.route[-2]:
                 self.route.insert(len(self.route) - 1, parcel.destination)
+                self._distance = None
             return True
 
         return False
 
+    def parcel(self, par_id: int) -> Optional[Parcel]:
+        """Return the parcel with id <par_id> if it is packed in this truck,
+        or None otherwise.
+
+        >>> t1 = Truck(1000, 20, 'Toronto')
+        >>> t1.pack(Parcel(1, 5, 'Toronto', 'Hamilton'))
+        True
+        >>> t1.parcel(1).volume
+        5
+        >>> print(t1.parcel(2))
+        None
+        """
+        return self._parcels.get(par_id)
+
+    def unpack(self, par_id: int) -> Optional[Parcel]:
+        """Remove the parcel with id <par_id> from this truck and return it,
+        or return None if it is not packed in this truck.
+
+        The parcel's destination is dropped from the route if no other parcel
+        in this truck goes there, and the order of the other stops is kept.
+        This takes O(1) time, or time proportional to the number of stops if
+        a stop is dropped.
+
+        >>> t1 = Truck(1000, 20, 'Toronto')
+        >>> t1.pack(Parcel(1, 5, 'Toronto', 'Hamilton'))
+        True
+        >>> t1.pack(Parcel(2, 5, 'Toronto', 'London'))
+        True
+        >>> t1.pack(Parcel(3, 5, 'Toronto', 'London'))
+        True
+        >>> t1.unpack(2).par_id
+        2
+        >>> t1.route, t1.unused_space()
+        (['Toronto', 'Hamilton', 'London', 'Toronto'], 10)
+        >>> t1.unpack(1).par_id
+        1
+        >>> t1.route
+        ['Toronto', 'London', 'Toronto']
+        >>> print(t1.unpack(1))
+        None
+        """
+        parcel = self._parcels.pop(par_id, None)
+        if parcel is None:
+            return None
+        if self._owners is not None:
+            del self._owners[par_id]
+        self._parcel_list = None
+        self._load -= parcel.volume
+        city = parcel.destination
+        self._stops[city] -= 1
+        if self._stops[city] == 0:
+            del self._stops[city]
+            if len(self._parcels) == 0:
+                self.route = [self.route[0]]
+            else:
+                depot = self.route[0]
+                self.route = [depot] + [c for c in self.route[1:-1]
+                                        if c != city] + [depot]
+            self._distance = None
+        return parcel
+
+    def reroute(self, stops: List[City]) -> None:
+        """Change the route of this truck so that it starts at its depot,
+        visits the cities in <stops> in order, and returns to its depot.
+
+        Precondition: this truck has at least one parcel, and every destination
+        of its parcels other than its depot is in <stops>.
+
+        >>> t1 = Truck(1000, 20, 'Toronto')
+        >>> t1.pack(Parcel(1, 5, 'Toronto', 'Hamilton'))
+        True
+        >>> t1.pack(Parcel(2, 5, 'Toronto', 'London'))
+        True
+        >>> t1.reroute(['London', 'Hamilton'])
+        >>> t1.route
+        ['Toronto', 'London', 'Hamilton', 'Toronto']
+        """
+        self.route = [self.route[0]] + stops + [self.route[0]]
+        self._distance = None
+
+    def clear(self) -> None:
+        """Unpack every parcel from this truck, so that it is empty and its
+        route is just its depot.
+
+        >>> t1 = Truck(1000, 20, 'Toronto')
+        >>> t1.pack(Parcel(1, 5, 'Toronto', 'Hamilton'))
+        True
+        >>> t1.clear()
+        >>> t1.route, t1.all_parcels, t1.unused_space()
+        (['Toronto'], [], 20)
+        """
+        if self._owners is not None:
+            for par_id in self._parcels:
+                del self._owners[par_id]
+        self._parcels = {}
+        self._parcel_list = []
+        self._stops = {}
+        self._load = 0
+        self.route = [self.route[0]]
+        self._distance = None
+
+    def join_fleet(self, owners: Dict[int, 'Truck']) -> None:
+        """Record the parcels of this truck in <owners>, which maps the id of
+        every parcel packed onto a truck of the Fleet this truck is added to
+        to that truck, and keep them recorded there as parcels are packed and
+        unpacked.
+
+        Raise ValueError, and record nothing, if a parcel of this truck is
+        already in <owners>.
+
+        Precondition: this truck has not been added to another Fleet.
+        """
+        for par_id in self._parcels:
+            if par_id in owners:
+                raise ValueError(f'parcel {par_id} is already packed in '
+                                 f'truck {owners[par_id].truck_id}')
+        for par_id in self._parcels:
+            owners[par_id] = self
+        self._owners = owners
+
     # This method is written to be used in scheduler.py
     def very_good_truck(self, v_list: List, par: Parcel) -> bool:
         """Return True if at least one parcel has already been packed onto
@@ -196,6 +531,9 @@ class Truck:
         """Return the total distance travelled by this truck, according to
         distances in <dmap>.
 
+        The distance is cached by this Truck, so calling this again with the
+        same <dmap> before the route or <dmap> changes is cheap.
+
         Precondition: <dmap> contains all distances required to compute the
                       average distance travelled.
 
@@ -212,13 +550,19 @@ class Truck:
         >>> d.add_distance('Toronto', 'Vancouver', 200)
         >>> t1.distance(d)
         500
+        >>> t2 = Truck(1424, 10, d.city_id('Toronto'))
+        >>> t2.pack(Parcel(3, 5, d.city_id('Toronto'), d.city_id('Hamilton')))
+        True
+        >>> t2.distance(d)
+        200
 
         """
-        dist = 0
-        if len(self.route) > 1:
-            for k in range(len(self.route) - 1):
-                dist += dmap.distance(self.route[k], self.route[k + 1])
-        return dist
+        cached = self._distance
+        if cached is None or cached[0] is not dmap \
+                or cached[1] != dmap.version():
+            cached = (dmap, dmap.version(), dmap.route_distance(self.route))
+            self._distance = cached
+        return cached[2]
 
     def __str__(self) -> str:
         """Return a string representation of this Truck
@@ -238,16 +582,13 @@ class Truck:
         Parcel ID = 123, Volume = 20, Destination is Hamilton
         Parcel ID = 1234, Volume = 30, Destination is Vancouver
         """
-        s = 'Truck ID = ' + str(self.truck_id) + ', Capacity = '
-        s += str(self.capacity) + ', Depot is ' + self.route[0] + ':\n'
+        s = f'Truck ID = {self.truck_id}, Capacity = {self.capacity}, ' \
+            f'Depot is {self.route[0]}:\n'
         if len(self.all_parcels) == 0:
             return s + 'Empty'
-        for k in range(len(self.all_parcels)):
-            a = self.all_parcels[k]
-            s += 'Parcel ID = ' + str(a.par_id) + ', Volume = ' + str(a.volume)
-            s += ', Destination is ' + a.destination + '\n'
-
-        return s.strip()
+        return s + '\n'.join([
+            f'Parcel ID = {a.par_id}, Volume = {a.volume}, '
+            f'Destination is {a.destination}' for a in self.all_parcels])
 
 
 class Fleet:
@@ -256,8 +597,14 @@ class Fleet:
     ===== Public Attributes =====
     trucks:
       List of all Truck objects in this fleet.
+
+    ===== Private Attributes =====
+    _owners:
+      Maps the id of every parcel packed onto a truck of this fleet to that
+      truck. Each truck keeps it up to date as it is packed and unpacked.
     """
     trucks: List[Truck]
+    _owners: Dict[int, Truck]
 
     def __init__(self) -> None:
         """Create a Fleet with no trucks.
@@ -267,12 +614,16 @@ class Fleet:
         0
         """
         self.trucks = []
+        self._owners = {}
 
     def add_truck(self, truck: Truck) -> None:
         """Add <truck> to this fleet.
 
+        Raise ValueError, and do not add <truck>, if a parcel packed onto it
+        has the same id as a parcel packed onto a truck of this Fleet.
+
         Precondition: No truck with the same ID as <truck> has already been
-        added to this Fleet.
+        added to this Fleet, and <truck> has not been added to another Fleet.
 
         >>> f = Fleet()
         >>> t = Truck(1423, 1000, 'Toronto')
@@ -282,8 +633,85 @@ class Fleet:
         >>> f.trucks[0].capacity
         1000
         """
+        truck.join_fleet(self._owners)
         self.trucks.append(truck)
 
+    def truck_of(self, par_id: int) -> Optional[Truck]:
+        """Return the truck of this fleet which the parcel with id <par_id> is
+        packed onto, or None if it is not packed onto any of them.
+
+        This takes O(1) time.
+
+        >>> f = Fleet()
+        >>> t = Truck(1423, 10, 'Toronto')
+        >>> f.add_truck(t)
+        >>> t.pack(Parcel(27, 5, 'Toronto', 'Hamilton'))
+        True
+        >>> f.truck_of(27) is t
+        True
+        >>> print(f.truck_of(28))
+        None
+        """
+        return self._owners.get(par_id)
+
+    def unpack(self, par_id: int) -> Optional[Parcel]:
+        """Remove the parcel with id <par_id> from the truck of this fleet
+        it is packed onto, and return it, or return None if it is not packed
+        onto any of them.
+
+        >>> f = Fleet()
+        >>> t = Truck(1423, 10, 'Toronto')
+        >>> f.add_truck(t)
+        >>> t.pack(Parcel(27, 5, 'Toronto', 'Hamilton'))
+        True
+        >>> f.unpack(27).par_id
+        27
+        >>> t.route
+        ['Toronto']
+        """
+        truck = self.truck_of(par_id)
+        if truck is None:
+            return None
+        return truck.unpack(par_id)
+
+    def move(self, par_id: int, dst_truck: Truck) -> bool:
+        """Move the parcel with id <par_id> from the truck of this fleet it
+        is packed onto to <dst_truck>, and return True. Return False, and
+        move nothing, if the parcel is not packed onto any truck of this fleet
+        or <dst_truck> does not have enough unused space for it.
+
+        Both trucks' routes and loads are updated in time proportional to
+        their number of stops.
+
+        Precondition: <dst_truck> is in this fleet.
+
+        >>> f = Fleet()
+        >>> t1 = Truck(1423, 10, 'Toronto')
+        >>> t2 = Truck(1333, 10, 'Toronto')
+        >>> f.add_truck(t1)
+        >>> f.add_truck(t2)
+        >>> t1.pack(Parcel(27, 5, 'Toronto', 'Hamilton'))
+        True
+        >>> f.move(27, t2)
+        True
+        >>> t1.route, t2.route
+        (['Toronto'], ['Toronto', 'Hamilton', 'Toronto'])
+        >>> f.truck_of(27) is t2
+        True
+        >>> t2.pack(Parcel(28, 5, 'Toronto', 'London'))
+        True
+        >>> f.move(28, Truck(1, 1, 'Toronto'))
+        False
+        """
+        src_truck = self.truck_of(par_id)
+        if src_truck is None:
+            return False
+        if src_truck is dst_truck:
+            return True
+        if src_truck.parcel(par_id).volume > dst_truck.unused_space():
+            return False
+        dst_truck.pack(src_truck.unpack(par_id))
+        return True
 
     def __str__(self) -> str:
         """Produce a string representation of this fleet
@@ -319,10 +747,47 @@ class Fleet:
         s = 'Trucks in this Fleet:\n'
         if len(self.trucks) == 0:
             return s + 'This Fleet is empty'
-        for truck in self.trucks:
-            s += truck.__str__() + '\n'
+        return s + '\n'.join([str(truck) for truck in self.trucks])
 
-        return s.strip()
+    def save(self, filename: str) -> None:
+        """Write a snapshot of this fleet to <filename>: every truck, the
+        parcels packed onto it in the order they were packed, its route and
+        its load. load_fleet reads it back.
+
+        The file holds one line of JSON naming the cities, followed by one
+        binary record of 64-bit integers per truck. Records are written a
+        chunk at a time, so no large string is ever built.
+        """
+        ids = {}
+        for truck in self.trucks:
+            for city in truck.route:
+                ids.setdefault(city, len(ids))
+            for par in truck.all_parcels:
+                ids.setdefault(par.source, len(ids))
+                ids.setdefault(par.destination, len(ids))
+        header = json.dumps({'format': _SNAPSHOT_FORMAT,
+                             'byteorder': sys.byteorder,
+                             'cities': list(ids),
+                             'trucks': len(self.trucks)}).encode()
+        # Pad the header so that the records start on an 8-byte boundary.
+        header += b' ' * (-(len(header) + 1) % 8) + b'\n'
+
+        with open(filename, 'wb') as file:
+            file.write(header)
+            chunk = array('q')
+            for truck in self.trucks:
+                stops = truck.route[1:-1]
+                chunk.extend((truck.truck_id, truck.capacity,
+                              ids[truck.route[0]], truck.sum_vol(),
+                              len(truck.all_parcels), len(stops)))
+                for par in truck.all_parcels:
+                    chunk.extend((par.par_id, par.volume, ids[par.source],
+                                  ids[par.destination]))
+                chunk.extend([ids[city] for city in stops])
+                if len(chunk) >= _SNAPSHOT_CHUNK:
+                    chunk.tofile(file)
+                    chunk = array('q')
+            chunk.tofile(file)
 
     def num_trucks(self) -> int:
         """Return the number of trucks in this fleet.
@@ -418,7 +883,7 @@ class Fleet:
         sum_unused = 0
         for truck in self.trucks:
             if truck.sum_vol() > 0:
-                sum_unused += truck.capacity - truck.sum_vol()
+                sum_unused += truck.unused_space()
 
         return sum_unused
 
@@ -524,12 +989,134 @@ class Fleet:
         """
         return self.total_distance_travelled(dmap) / self.num_nonempty_trucks()
 
+    def stats(self, dmap: Optional[DistanceMap] = None) \
+            -> Dict[str, Union[int, float]]:
+        """Return the statistics of this fleet, computed in a single pass over
+        its trucks, as a dictionary with these keys:
+
+        'num_trucks', 'num_nonempty_trucks', 'total_unused_space' and
+        'average_fullness' have the values of the methods with the same name,
+        except that 'average_fullness' is 0.0 if every truck is empty.
+
+        If <dmap> is not None, 'total_distance' and 'average_distance' have the
+        values of total_distance_travelled and average_distance_travelled,
+        according to the distances in <dmap>; 'average_distance' is 0.0 if
+        every truck is empty.
+
+        >>> f = Fleet()
+        >>> t1 = Truck(1423, 10, 'Toronto')
+        >>> t1.pack(Parcel(1, 5, 'Toronto', 'Hamilton'))
+        True
+        >>> f.add_truck(t1)
+        >>> f.add_truck(Truck(1333, 10, 'Toronto'))
+        >>> m = DistanceMap()
+        >>> m.add_distance('Toronto', 'Hamilton', 9)
+        >>> s = f.stats(m)
+        >>> s['num_nonempty_trucks'], s['total_unused_space']
+        (1, 5)
+        >>> s['average_fullness'], s['average_distance']
+        (50.0, 18.0)
+        """
+        nonempty = 0
+        sum_unused = 0
+        sum_fullness = 0
+        tot_dist = 0
+        for truck in self.trucks:
+            load = truck.sum_vol()
+            if load > 0:
+                nonempty += 1
+                sum_unused += truck.capacity - load
+                sum_fullness += load * 100 / truck.capacity
+            if dmap is not None:
+                tot_dist += truck.distance(dmap)
+
+        di = {
+            'num_trucks': len(self.trucks),
+            'num_nonempty_trucks': nonempty,
+            'total_unused_space': sum_unused,
+            'average_fullness': sum_fullness / nonempty if nonempty else 0.0
+        }
+        if dmap is not None:
+            di['total_distance'] = tot_dist
+            di['average_distance'] = tot_dist / nonempty if nonempty else 0.0
+        return di
+
+
+def load_fleet(filename: str) -> Fleet:
+    """Return the Fleet whose snapshot was written to <filename> by
+    Fleet.save, with the same trucks, parcels, routes and loads.
+
+    The file is mapped into memory and its records are read in place, rather
+    than parsed. Raise ValueError if <filename> is not a snapshot that can be
+    read on this machine, or is truncated.
+
+    >>> import os, tempfile
+    >>> t = Truck(1423, 10, 'Toronto')
+    >>> t.pack(Parcel(27, 5, 'York', 'Hamilton'))
+    True
+    >>> f = Fleet()
+    >>> f.add_truck(t)
+    >>> f.add_truck(Truck(1333, 20, 'Toronto'))
+    >>> path = os.path.join(tempfile.mkdtemp(), 'fleet.snap')
+    >>> f.save(path)
+    >>> str(load_fleet(path)) == str(f)
+    True
+    """
+    fleet = Fleet()
+    with open(filename, 'rb') as file:
+        header = json.loads(file.readline())
+        if header.get('format') != _SNAPSHOT_FORMAT \
+                or header.get('byteorder') != sys.byteorder:
+            raise ValueError(f'{filename} is not a fleet snapshot')
+        cities = header['cities']
+        offset = file.tell()
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped, \
+                memoryview(mapped) as view, view[offset:] as body:
+            if len(body) % 8 != 0:
+                raise ValueError(f'{filename} is truncated')
+            with body.cast('q') as values:
+                pos = 0
+                for dummy in range(header['trucks']):
+                    fleet.add_truck(_read_truck(values, pos, cities))
+                    pos += 6 + 4 * values[pos + 4] + values[pos + 5]
+                if pos != len(values):
+                    raise ValueError(f'{filename} is truncated')
+    return fleet
+
+
+def _read_truck(values: memoryview, pos: int, cities: List[City]) -> Truck:
+    """Return the Truck whose snapshot record starts at index <pos> of
+    <values>, with its cities given by index in <cities>.
+    """
+    if pos + 6 > len(values):
+        raise ValueError('fleet snapshot is truncated')
+    t_id, capacity, depot, load, num_parcels, num_stops = \
+        values[pos:pos + 6].tolist()
+    pos += 6
+    fields = values[pos:pos + 4 * num_parcels].tolist()
+    pos += 4 * num_parcels
+    stops = values[pos:pos + num_stops].tolist()
+    if len(fields) != 4 * num_parcels or len(stops) != num_stops:
+        raise ValueError('fleet snapshot is truncated')
+
+    truck = Truck(t_id, capacity, cities[depot])
+    for par in map(Parcel, fields[0::4], fields[1::4],
+                   [cities[k] for k in fields[2::4]],
+                   [cities[k] for k in fields[3::4]]):
+        truck.pack(par)
+    if truck.sum_vol() != load:
+        raise ValueError(f'fleet snapshot has a bad load for truck {t_id}')
+    if num_stops > 0:
+        truck.reroute([cities[k] for k in stops])
+    return truck
+
 
 if __name__ == '__main__':
     import python_ta
     python_ta.check_all(config={
         'allowed-import-modules': ['doctest', 'python_ta', 'typing',
-                                   'distance_map'],
+                                   'distance_map', 'array', 'json', 'mmap',
+                                   'sys', 'os', 'tempfile'],
         'disable': ['E1136'],
         'max-attributes': 15,
     })
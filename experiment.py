@@ -8,11 +8,20 @@ run the experiment, generate statistics as the result of the experiment, and
 
 This module is responsible for all the reading of data from the data files.
 """
-from typing import List, Dict, Union
+from typing import List, Dict, Iterable, Iterator, Optional, TextIO, \
+    Tuple, Union
+from sys import intern
+import gzip
 import json
-from scheduler import RandomScheduler, GreedyScheduler, Scheduler
-from domain import Parcel, Truck, Fleet
-from distance_map import DistanceMap
+from scheduler import RandomScheduler, GreedyScheduler, BinPackingScheduler, \
+    ClusterScheduler, OnlineGreedyScheduler, Scheduler
+from domain import Parcel, ParcelTable, Truck, Fleet
+from distance_map import CityRegistry, DistanceMap
+from routing import optimize_routes
+from local_search import improve_schedule
+from multistart import MultiStartScheduler
+from parcel_store import ParcelStore, write_parcel_store
+from instrument import Instrumentation
 
 
 class SchedulingExperiment:
@@ -33,7 +42,8 @@ class SchedulingExperiment:
     scheduler:
       The scheduler to use in this experiment.
     parcels:
-      The parcels to schedule in this experiment.
+      The parcels to schedule in this experiment. In a streaming experiment,
+      an iterator which reads them from the parcel file as they are scheduled.
     fleet:
       The trucks that parcels are scheduled to in this experiment.
     dmap:
@@ -48,6 +58,29 @@ class SchedulingExperiment:
       A list of parcels. <_unscheduled>'s value is undefined until <self>.run
       is called, at which point it contains the list of parcels that could
       not be scheduled in the experiment.
+    _search_budget:
+      The number of seconds that may be spent improving the schedule by local
+      search after scheduling, or None if it is not improved.
+    _seed:
+      The seed of the random numbers of this experiment, or None.
+    _route_budget:
+      The number of seconds that may be spent reordering the route of each
+      truck after scheduling, or None if routes are not reordered.
+    _route_distances:
+      The total distance travelled by the fleet before and after its routes
+      were reordered, or None if they have not been reordered or parcels have
+      been added since.
+    _shortest_path_seconds:
+      The number of seconds spent computing the shortest path between every
+      pair of cities in <dmap>, or None if they were not computed.
+    _instrument:
+      True iff the phases of each run are timed and counted.
+    _profile_file:
+      The file cProfile statistics of each run are dumped to, or None.
+    _store:
+      The parcel store this experiment opened to read its parcels from, which
+      is closed once they have been scheduled, or None if it did not open
+      one.
 
     === Representation Invariants ===
     - <fleet> contains at least one truck
@@ -57,29 +90,132 @@ class SchedulingExperiment:
     """
     verbose: bool
     scheduler: Scheduler
-    parcels: List[Parcel]
+    parcels: Iterable[Parcel]
     fleet: Fleet
     dmap: DistanceMap
     _stats: Dict[str, Union[int, float]]
     _unscheduled: List[Parcel]
-
-    def __init__(self, config: Dict[str, Union[str, bool]]) -> None:
+    _search_budget: Optional[float]
+    _seed: Optional[int]
+    _route_budget: Optional[float]
+    _route_distances: Optional[Tuple[int, int]]
+    _shortest_path_seconds: Optional[float]
+    _instrument: bool
+    _profile_file: Optional[str]
+    _store: Optional[ParcelStore]
+
+    def __init__(self, config: Dict[str, Union[str, bool]],
+                 parcels: Optional[Iterable[Parcel]] = None,
+                 fleet: Optional[Fleet] = None,
+                 dmap: Optional[DistanceMap] = None) -> None:
         """Initialize a new experiment with the configuration specified in
         <config>.
+
+        <config>['algorithm'] is 'random', 'greedy', 'best-fit' or
+        'first-fit' for a BinPackingScheduler, or 'cluster' for a
+        ClusterScheduler, which orders destinations by their distance in
+        <dmap>. The last three ignore the parcel and truck orders of
+        <config>.
+
+        If <config> has the key 'seed', its value seeds the random algorithm so
+        that its schedule can be reproduced.
+
+        If <config> has the key 'streaming' with value True, parcels are read
+        lazily while they are scheduled rather than all at once beforehand.
+        The random algorithm then takes parcels in file order, and the greedy
+        algorithm is replaced by an OnlineGreedyScheduler, which also takes
+        them in file order. A streaming experiment can only be run once.
+
+        If <config> has the key 'parcel_store', parcels are read from the
+        parcel store file it names, which convert_parcels writes, rather than
+        from <config>['parcel_file']. The store is mapped into memory, and its
+        Parcels are only created as they are scheduled. The experiment closes
+        the store once they have been scheduled, so it can only be run once.
+
+        If <config> has the key 'multi_start' with a positive value, the
+        random or greedy algorithm is run that many times with different
+        seeds by a MultiStartScheduler, in <config>['workers'] processes, and
+        the best schedule by <config>['objective'] is kept. The greedy
+        algorithm then takes the parcels in a different random order each
+        time.
+
+        If <config> has the key 'local_search' with value True, the schedule is
+        improved by local search after scheduling, for
+        <config>['local_search_budget'] seconds (5 by default), using the
+        'seed' of <config> if it has one.
+
+        If <config> has the key 'optimize_routes' with value True, the route of
+        each truck is reordered after scheduling, spending at most
+        <config>['route_time_budget'] seconds (0.05 by default) per truck.
+        The statistics then describe the reordered routes, and also include
+        'distance_before_routing' and 'distance_after_routing', the total
+        distance travelled before and after reordering.
+
+        If <config> has the key 'shortest_paths' with value True, the distance
+        between two cities is taken to be the length of the shortest path
+        between them in <dmap>, which is computed once before scheduling, or
+        loaded from the file named by <config>['distance_cache'] if there is
+        one. The statistics then also include 'shortest_path_seconds', the
+        time this took.
+
+        If <config> has the key 'instrument' with value True, the time spent
+        in, and the number of calls to, each phase of a run are recorded by an
+        Instrumentation, and included in the statistics under keys starting
+        with 'time_' and 'count_'. If <config> has the key 'profile_file', each
+        run is also profiled with cProfile, and its statistics are dumped to
+        that file. Otherwise, the run is not slowed down at all.
+
+        The <parcels>, <fleet> and <dmap> that are not None are used instead of
+        reading them from the files named in <config>, so that several
+        experiments can share input that has been read once. <fleet> must not
+        have any parcels packed yet.
         """
         self.verbose = config['verbose']
-        if config['algorithm'] == 'random':
-            self.scheduler = RandomScheduler()
+        streaming = config.get('streaming', False)
+        self._store = None
+        if parcels is None and 'parcel_store' in config:
+            parcels = self._store = ParcelStore(config['parcel_store'])
+        elif parcels is None and streaming:
+            parcels = iter_parcels(config['parcel_file'])
+        elif parcels is None:
+            parcels = read_parcels(config['parcel_file'])
+        if fleet is None:
+            fleet = read_trucks(config['truck_file'], config['depot_location'])
+        if dmap is None:
+            dmap = read_distance_map(config['map_file'])
+        self.parcels = parcels
+        self.fleet = fleet
+        self.dmap = dmap
+        if config.get('multi_start', 0) > 0 \
+                and config['algorithm'] in ('random', 'greedy'):
+            self.scheduler = MultiStartScheduler(config, dmap)
+        elif config['algorithm'] == 'random':
+            self.scheduler = RandomScheduler(config.get('seed'))
+        elif config['algorithm'] in ('best-fit', 'first-fit'):
+            self.scheduler = BinPackingScheduler(config)
+        elif config['algorithm'] == 'cluster':
+            self.scheduler = ClusterScheduler(dmap)
+        elif streaming:
+            self.scheduler = OnlineGreedyScheduler(config)
         else:
             self.scheduler = GreedyScheduler(config)
 
-        self.parcels = read_parcels(config['parcel_file'])
-        self.fleet = read_trucks(config['truck_file'],
-                                 config['depot_location'])
-        self.dmap = read_distance_map(config['map_file'])
-
         self._stats = {}
         self._unscheduled = []
+        self._search_budget = None
+        if config.get('local_search', False):
+            self._search_budget = config.get('local_search_budget', 5.0)
+        self._seed = config.get('seed')
+        self._route_budget = None
+        if config.get('optimize_routes', False):
+            self._route_budget = config.get('route_time_budget', 0.05)
+        self._route_distances = None
+        self._shortest_path_seconds = None
+        self._instrument = config.get('instrument', False)
+        self._profile_file = config.get('profile_file')
+        if config.get('shortest_paths', False):
+            self._shortest_path_seconds = dmap.precompute_shortest_paths(
+                config.get('distance_cache'))
 
     def run(self, report: bool = False) -> Dict[str, Union[int, float]]:
         """Run the experiment and return statistics on the outcome.
@@ -92,10 +228,71 @@ class SchedulingExperiment:
         If <self.verbose> is True, print step-by-step details
         regarding the scheduling algorithm as it runs.
         """
-        self._unscheduled = self.scheduler.schedule(self.parcels,
-                                                    self.fleet.trucks,
-                                                    self.verbose)
+        if not self._instrument and self._profile_file is None:
+            self._schedule()
+            return self.stats(report)
+
+        with Instrumentation(self._instrument, self._profile_file) as probe:
+            self._schedule()
+            self._compute_stats()
+        self._stats.update(probe.stats(
+            len(self._unscheduled)
+            + sum(len(truck.all_parcels) for truck in self.fleet.trucks)))
+        if report:
+            self._print_report()
+        return self._stats
+
+    def _schedule(self) -> None:
+        """Schedule the parcels of this experiment onto its fleet, and
+        improve the schedule and routes if this experiment does so.
+        """
+        try:
+            self._unscheduled = self.scheduler.schedule(self.parcels,
+                                                        self.fleet.trucks,
+                                                        self.verbose)
+        finally:
+            if self._store is not None:
+                self._store.close()
+        if self._search_budget is not None:
+            self._unscheduled = improve_schedule(self.fleet, self.dmap,
+                                                 self._unscheduled,
+                                                 self._search_budget,
+                                                 self._seed)
+        if self._route_budget is not None:
+            self._route_distances = optimize_routes(self.fleet, self.dmap,
+                                                    self._route_budget)
+        if self._search_budget is not None or self._route_budget is not None:
+            self.scheduler.reset()
+
+    def add_parcels(self, parcels: Iterable[Parcel]) -> List[Parcel]:
+        """Schedule <parcels>, which arrived after this experiment was run,
+        onto the trucks of its fleet without moving any parcel already
+        scheduled, and return the ones that could not be scheduled.
+
+        Only the trucks the new parcels are packed onto are changed, and the
+        time taken depends on the number of new parcels rather than on the
+        number already scheduled. The statistics are not recomputed until
+        stats is called, and no longer include 'distance_before_routing' and
+        'distance_after_routing', since the new stops have not been routed.
+
+        Precondition: run has already been called.
+        """
+        unscheduled = self.scheduler.schedule_more(parcels, self.fleet.trucks,
+                                                   self.verbose)
+        self._unscheduled.extend(unscheduled)
+        self._route_distances = None
+        return unscheduled
+
+    def stats(self, report: bool = False) -> Dict[str, Union[int, float]]:
+        """Compute and return the statistics on the current outcome of this
+        experiment. If <report> is True, also print a report on them.
+
+        The times and counts recorded while an instrumented experiment ran
+        are only included in the statistics returned by run, since they do
+        not describe the current outcome once it has changed.
 
+        Precondition: run has already been called.
+        """
         self._compute_stats()
         if report:
             self._print_report()
@@ -107,15 +304,22 @@ class SchedulingExperiment:
 
         Precondition: _run has already been called.
         """
-        un_trucks = self.fleet.num_trucks() - self.fleet.num_nonempty_trucks()
+        fleet_stats = self.fleet.stats(self.dmap)
+        un_trucks = fleet_stats['num_trucks'] \
+            - fleet_stats['num_nonempty_trucks']
         self._stats = {
-            'fleet': self.fleet.num_trucks(),
+            'fleet': fleet_stats['num_trucks'],
             'unused_trucks': un_trucks,
-            'avg_distance': self.fleet.average_distance_travelled(self.dmap),
-            'avg_fullness': self.fleet.average_fullness(),
-            'unused_space': self.fleet.total_unused_space(),
+            'avg_distance': fleet_stats['average_distance'],
+            'avg_fullness': fleet_stats['average_fullness'],
+            'unused_space': fleet_stats['total_unused_space'],
             'unscheduled': len(self._unscheduled)
         }
+        if self._route_distances is not None:
+            self._stats['distance_before_routing'] = self._route_distances[0]
+            self._stats['distance_after_routing'] = self._route_distances[1]
+        if self._shortest_path_seconds is not None:
+            self._stats['shortest_path_seconds'] = self._shortest_path_seconds
 
     def _print_report(self) -> None:
         """Report on the statistics for this experiment.
@@ -135,43 +339,205 @@ class SchedulingExperiment:
 # ----- Helper functions -----
 
 
+# The number of characters of a data file that are read and parsed at a time.
+_CHUNK_SIZE = 1 << 20
+
+
+def _open_data(data_file: str) -> TextIO:
+    """Open <data_file> for reading as text, decompressing it on the fly if it
+    is gzip-compressed.
+    """
+    with open(data_file, 'rb') as file:
+        magic = file.read(2)
+    if magic == b'\x1f\x8b':
+        return gzip.open(data_file, 'rt')
+    return open(data_file, 'r')
+
+
+def _read_columns(data_file: str, kinds: str) -> Iterator[List[list]]:
+    """Yield the records of <data_file> a chunk of lines at a time, as one list
+    per field: the k-th list holds the k-th field of every line of the chunk.
+
+    Each line of <data_file> must have len(<kinds>) comma-separated fields.
+    If <kinds>[k] is 'i', the k-th field is converted to an int; if it is 's',
+    it is stripped of surrounding whitespace and interned. Blank lines are
+    skipped. Raise a ValueError naming the line of the first malformed line.
+
+    A chunk is split and converted field by field with built-in functions; it
+    is only parsed line by line if that fails, to find the malformed line.
+    """
+    width = len(kinds)
+    line_num = 1
+    with _open_data(data_file) as file:
+        lines = file.readlines(_CHUNK_SIZE)
+        while lines:
+            text = ','.join(lines)
+            fields = text.split(',')
+            try:
+                # Every line must end in the last column, or the fields of a
+                # short line and a long line could line up by accident.
+                last = ''.join(fields[width - 1::width])
+                if len(fields) != width * len(lines) \
+                        or last.count('\n') != text.count('\n'):
+                    raise ValueError
+                cols = [_convert(kinds[k], fields[k::width])
+                        for k in range(width)]
+            except ValueError:
+                cols = _read_lines(data_file, line_num, lines, kinds)
+            yield cols
+            line_num += len(lines)
+            lines = file.readlines(_CHUNK_SIZE)
+
+
+def _read_lines(data_file: str, line_num: int, lines: List[str],
+                kinds: str) -> List[list]:
+    """Return the fields of <lines>, which start at line <line_num> of
+    <data_file>, in the format yielded by _read_columns.
+
+    Raise a ValueError naming the line of the first malformed line.
+
+    >>> _read_lines('trucks.txt', 1, ['1, 20\\n', '\\n', '2, 30\\n'], 'ii')
+    [[1, 2], [20, 30]]
+    >>> _read_lines('trucks.txt', 1, ['1, 20\\n', '2, 30, 4\\n'], 'ii')
+    Traceback (most recent call last):
+    ValueError: trucks.txt, line 2: expected 2 fields, found 3
+    """
+    cols = [[] for dummy in kinds]
+    for k in range(len(lines)):
+        if lines[k].isspace() or lines[k] == '':
+            continue
+        fields = lines[k].split(',')
+        if len(fields) != len(kinds):
+            raise _malformed(data_file, line_num + k,
+                             'expected ' + str(len(kinds)) + ' fields, found '
+                             + str(len(fields)))
+        for j in range(len(kinds)):
+            try:
+                cols[j].extend(_convert(kinds[j], [fields[j]]))
+            except ValueError:
+                raise _malformed(data_file, line_num + k,
+                                 'field ' + str(j + 1) + ' is not an integer'
+                                 ) from None
+    return cols
+
+
+def _convert(kind: str, fields: List[str]) -> list:
+    """Return <fields> converted to ints if <kind> is 'i', or stripped and
+    interned if <kind> is 's'.
+
+    >>> _convert('i', [' 5', '7\\n'])
+    [5, 7]
+    >>> _convert('s', [' Toronto', 'Hamilton\\n'])
+    ['Toronto', 'Hamilton']
+    """
+    if kind == 'i':
+        return list(map(int, fields))
+    return list(map(intern, map(str.strip, fields)))
+
+
+def _malformed(data_file: str, line_num: int, problem: str) -> ValueError:
+    """Return the error raised for line <line_num> of <data_file>, which has
+    the given <problem>.
+
+    >>> str(_malformed('parcels.txt', 3, 'bad volume'))
+    'parcels.txt, line 3: bad volume'
+    """
+    return ValueError(data_file + ', line ' + str(line_num) + ': ' + problem)
+
+
+def iter_parcels(parcel_file: str) -> Iterator[Parcel]:
+    """Yield the parcels of <parcel_file> one at a time, reading the file a
+    chunk at a time, so that only one chunk of it is in memory at once.
+
+    Raise a ValueError naming the line of the first malformed line, once it
+    is reached.
+
+    Precondition: <parcel_file> is the path to a file containing parcel data,
+    which may be gzip-compressed.
+    """
+    for ids, sources, destinations, volumes in _read_columns(parcel_file,
+                                                             'issi'):
+        yield from map(Parcel, ids, volumes, sources, destinations)
+
+
 def read_parcels(parcel_file: str) -> List[Parcel]:
     """Read parcel data from <parcel_file> and return.
 
-    Precondition: <parcel_file> is the path to a file containing parcel data.
+    Raise a ValueError naming the line of the first malformed line.
+
+    Precondition: <parcel_file> is the path to a file containing parcel data,
+    which may be gzip-compressed.
     """
     parcels = []
-    # read and add the parcels to the list.
-    with open(parcel_file, 'r') as file:
-        for line in file:
-            tokens = line.strip().split(',')
-            pid = int(tokens[0].strip())
-            source = tokens[1].strip()
-            destination = tokens[2].strip()
-            volume = int(tokens[3].strip())
-            parcel = Parcel(pid, volume, source, destination)
-            parcels.append(parcel)
+    for ids, sources, destinations, volumes in _read_columns(parcel_file,
+                                                             'issi'):
+        parcels.extend(map(Parcel, ids, volumes, sources, destinations))
 
     return parcels
 
 
+def read_parcel_table(parcel_file: str,
+                      cities: Optional[CityRegistry] = None) -> ParcelTable:
+    """Read parcel data from <parcel_file> and return it as a ParcelTable
+    which interns city names in <cities>, or in a new CityRegistry if <cities>
+    is None.
+
+    Raise a ValueError naming the line of the first malformed line.
+
+    Precondition: <parcel_file> is the path to a file containing parcel data,
+    which may be gzip-compressed.
+    """
+    table = ParcelTable(cities)
+    for ids, sources, destinations, volumes in _read_columns(parcel_file,
+                                                             'issi'):
+        table.extend(ids, volumes, sources, destinations)
+
+    return table
+
+
+def convert_parcels(parcel_file: str, store_file: str) -> int:
+    """Convert the parcel data in <parcel_file> to the parcel store
+    <store_file>, which a ParcelStore can read, and return the number of
+    parcels converted. The file is converted a chunk at a time.
+
+    Raise a ValueError naming the line of the first malformed line.
+
+    Precondition: <parcel_file> is the path to a file containing parcel data,
+    which may be gzip-compressed.
+    """
+    return write_parcel_store(store_file, _read_columns(parcel_file, 'issi'))
+
+
 def read_distance_map(distance_map_file: str) -> DistanceMap:
     """Read distance data from <distance_map_file> and return a DistanceMap
     that records it.
 
+    Raise a ValueError naming the line of the first malformed line.
+
     Precondition: <distance_map_file> is the path to a file containing distance
-                  data.
+                  data, which may be gzip-compressed.
     """
     d = DistanceMap()
-    with open(distance_map_file, 'r') as file:
+    with _open_data(distance_map_file) as file:
+        line_num = 0
         for line in file:
-            tokens = line.strip().split(',')
-            c1 = tokens[0].strip()
-            c2 = tokens[1].strip()
-            distance1 = int(tokens[2].strip())
-            distance2 = int(tokens[3].strip()) if len(tokens) == 4 \
-                else distance1
-            d.add_distance(c1, c2, distance1, distance2)
+            line_num += 1
+            if line.isspace():
+                continue
+            tokens = line.split(',')
+            if len(tokens) not in (3, 4):
+                raise _malformed(distance_map_file, line_num,
+                                 'expected 3 or 4 fields, found '
+                                 + str(len(tokens)))
+            try:
+                distance1 = int(tokens[2])
+                distance2 = int(tokens[3]) if len(tokens) == 4 \
+                    else distance1
+            except ValueError:
+                raise _malformed(distance_map_file, line_num,
+                                 'distances must be integers') from None
+            d.add_distance(tokens[0].strip(), tokens[1].strip(), distance1,
+                           distance2)
 
     return d
 
@@ -180,16 +546,15 @@ def read_trucks(truck_file: str, depot_location: str) -> Fleet:
     """Read truck data from <truck_file> and return a Fleet containing these
     trucks, with each truck starting at the <depot_location>.
 
-    Precondition: <truck_file> is a path to a file containing truck data.
+    Raise a ValueError naming the line of the first malformed line.
+
+    Precondition: <truck_file> is a path to a file containing truck data,
+                  which may be gzip-compressed.
     """
     f = Fleet()
-    with open(truck_file, 'r') as file:
-        for line in file:
-            tokens = line.strip().split(',')
-            tid = int(tokens[0])
-            capacity = int(tokens[1])
-            truck = Truck(tid, capacity, depot_location)
-            f.add_truck(truck)
+    for ids, capacities in _read_columns(truck_file, 'ii'):
+        for k in range(len(ids)):
+            f.add_truck(Truck(ids[k], capacities[k], depot_location))
 
     return f
 
@@ -213,11 +578,12 @@ def simple_check(config_file: str) -> None:
 if __name__ == '__main__':
     import python_ta
     python_ta.check_all(config={
-        'allowed-io': ['read_parcels', 'read_distance_map', 'read_trucks',
-                       '_print_report', 'simple_check'],
+        'allowed-io': ['_open_data', '_print_report', 'simple_check'],
         'allowed-import-modules': ['doctest', 'python_ta', 'typing',
                                    'json', 'scheduler', 'domain',
-                                   'distance_map'],
+                                   'distance_map', 'sys', 'gzip',
+                                   'routing', 'local_search', 'multistart',
+                                   'parcel_store', 'instrument'],
         'disable': ['E1136'],
         'max-attributes': 15,
     })
@@ -3,17 +3,25 @@
 
 This module reads from a json file (whose name is hard-coded in the
 compare_algorithms block) to determine the parcel, truck and map files to use.
-It then constructs all nine possible algorithm configurations, and runs each
-on this same data.  Results are printed to a csv file called 'results.csv'.
+It then constructs all nine possible algorithm configurations, as well as the
+two bin-packing algorithms and the destination-clustering algorithm, and runs
+each on this same data.  Results are printed to a csv file called 'results.csv'.
+
+The input files are read once and shared by all configurations, which
+can be run in parallel by a pool of worker processes.
 
 You have no tasks associated with this module.  It is provided to you so that
 you can compare the performance of the algorithms and notice any patterns or
 conclusions you might draw.  You may also find that reviewing the comparison
 reveals bugs in your code.
 """
-from typing import TextIO, Dict, Union
+from typing import TextIO, Dict, List, Tuple, Union
 import json
-from experiment import SchedulingExperiment
+from experiment import SchedulingExperiment, read_parcels, read_trucks, \
+    read_distance_map
+from domain import Parcel, Truck, Fleet
+from distance_map import DistanceMap
+from parallel import map_shared
 
 
 def print_table_title(file: TextIO) -> None:
@@ -43,12 +51,33 @@ def print_table_row(config: Dict[str, Union[str, bool]],
                f'{stats["unscheduled"]}\n')
 
 
-def compare_algorithms(config_file: str) -> None:
+def _run_configuration(shared: Tuple[List[Parcel], List[Tuple[int, int]],
+                                      DistanceMap],
+                       config: Dict[str, Union[str, bool]]) \
+        -> Dict[str, Union[int, float]]:
+    """Run an experiment with <config> on the parcels, (truck id, capacity)
+    pairs and distance map <shared>, using a fresh fleet of empty trucks, and
+    return its statistics.
+    """
+    parcels, trucks, dmap = shared
+    fleet = Fleet()
+    for tid, capacity in trucks:
+        fleet.add_truck(Truck(tid, capacity, config['depot_location']))
+    expt = SchedulingExperiment(config, parcels, fleet, dmap)
+    return expt.run(report=False)
+
+
+def compare_algorithms(config_file: str, workers: int = 1) -> None:
     """Compare all algorithms on a single problem.
 
-    Run the random algorithm and every configuration of the greedy
+    Run the random algorithm, every configuration of the greedy
+    algorithm, both bin-packing algorithms and the destination-clustering
     algorithm on the scheduling problem defined in <config_file>.
 
+    The input files are read once. If <workers> is more than 1, the
+    configurations are run by a pool of <workers> processes; the rows of the
+    results are written in the same order either way.
+
     Precondition: <config_file> a path to a json file with keys and values
     in the dictionary format.
     """
@@ -100,21 +129,47 @@ def compare_algorithms(config_file: str) -> None:
         {'algorithm': 'greedy',
          'parcel_priority': 'destination',
          'parcel_order': 'non-increasing',
-         'truck_order': 'non-increasing'}
+         'truck_order': 'non-increasing'},
+        # --- Bin packing, by best fit and by first fit
+        {'algorithm': 'best-fit',
+         'parcel_priority': 'volume',
+         'parcel_order': 'non-increasing',
+         'truck_order': 'NA'},
+        {'algorithm': 'first-fit',
+         'parcel_priority': 'volume',
+         'parcel_order': 'non-increasing',
+         'truck_order': 'NA'},
+        # --- Whole destinations at a time
+        {'algorithm': 'cluster',
+         'parcel_priority': 'destination',
+         'parcel_order': 'NA',
+         'truck_order': 'NA'}
     ]
 
+    configs = []
+    for item in algorithm_configurations:
+        # Start with the basic configuration <config>, and add the
+        # algorithm details from this item in our list of configurations.
+        config = basic_config.copy()
+        config.update(item)
+        configs.append(config)
+
+    # Read the input once; every experiment schedules onto its own trucks.
+    parcels = read_parcels(basic_config['parcel_file'])
+    fleet = read_trucks(basic_config['truck_file'],
+                        basic_config['depot_location'])
+    trucks = [(truck.truck_id, truck.capacity) for truck in fleet.trucks]
+    dmap = read_distance_map(basic_config['map_file'])
+
+    # Run an experiment on each configuration.
+    all_results = map_shared(_run_configuration, configs,
+                             (parcels, trucks, dmap), workers)
+
+    # Print the results to our csv file, in the order of the configurations.
     with open('data/results.csv', 'w') as file:
         print_table_title(file)
-        for item in algorithm_configurations:
-            # Start with the basic configuration <config>, and add the
-            # algorithm details from this item in our list of configurations.
-            config = basic_config.copy()
-            config.update(item)
-            # Run an experiment on this configuration and print the results
-            # to our csv file.
-            expt = SchedulingExperiment(config)
-            results = expt.run(report=False)
-            print_table_row(config, results, file)
+        for k in range(len(configs)):
+            print_table_row(configs[k], all_results[k], file)
 
 
 if __name__ == '__main__':
@@ -122,7 +177,8 @@ if __name__ == '__main__':
     python_ta.check_all(config={
         'allowed-io': ['compare_algorithms'],
         'allowed-import-modules': ['doctest', 'python_ta', 'typing',
-                                   'json', 'experiment'],
+                                   'json', 'experiment', 'domain',
+                                   'distance_map', 'parallel'],
         'disable': ['E1136'],
         'max-attributes': 15,
     })
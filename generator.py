@@ -2,63 +2,255 @@
 ===== Module Description =====
 
 This module generates random parcel and truck data and writes each to a file.
+It can also write a map file with the distances between the generated cities.
 Values defined in the module control the amount of data, the range of possible
 values, etc.
+
+Large files are generated and written a chunk of lines at a time, so the data
+never has to be held in memory all at once.
+
+The module can be run from the command line, e.g.
+
+    python generator.py --parcels 10000000 --trucks 100000 --cities 200 \
+        --volumes lognormal --seed 1 --map-file data/big-map-data.txt
 """
 
-from random import randint, choice
+from typing import Callable, Iterator, List, Optional, Tuple
+import argparse
+from itertools import accumulate
+from math import ceil, hypot, log
+from random import Random
+
+# The first cities generated, in order. More cities are named City<k>.
+CITY_NAMES = ['Belleville', 'Guelph', 'Hamilton', 'Toronto', 'London',
+              'Ottawa']
+
+# The depot which no parcel is sent to, unless it is also the source.
+DEPOT = 'Toronto'
+
+# The distributions that parcel volumes can be drawn from.
+DISTRIBUTIONS = ('uniform', 'lognormal', 'heavy-tailed')
+
+# The number of lines generated and written to a file at a time.
+_CHUNK_LINES = 1 << 16
+
+# Sources and destinations are drawn from a table of every allowed pair of
+# cities when there are at most this many cities.
+_PAIR_TABLE_CITIES = 500
+
+# The side of the square that generated cities are placed in.
+_MAP_SIZE = 1000
 
 
 def generate(parcel_filename: str = 'data/demo-parcel-data.txt',
-             truck_filename: str = 'data/demo-truck-data.txt') -> None:
+             truck_filename: str = 'data/demo-truck-data.txt',
+             num_parcels: int = 15, num_trucks: int = 5,
+             seed: Optional[int] = None, num_cities: int = 6,
+             volume_distribution: str = 'uniform',
+             map_filename: Optional[str] = None) -> None:
     """Generate random truck and parcel data, and save to the files
     <parcel_filename> and <truck_filename> respectively.
+
+    There are <num_parcels> parcels and <num_trucks> trucks, and the parcels
+    travel between <num_cities> cities. Parcel volumes are drawn from
+    <volume_distribution>, which is one of DISTRIBUTIONS. If <seed> is not
+    None, the same seed always generates the same data.
+
+    If <map_filename> is not None, the cities are placed at random points on a
+    plane, and the straight-line distance between every pair of them, rounded
+    up, is written to <map_filename>. These distances obey the triangle
+    inequality.
+    The six default cities are also in data/map-data.txt.
+
+    Precondition: num_cities >= 4 and volume_distribution in DISTRIBUTIONS
     """
+    rand = Random(seed)
+    cities = city_names(num_cities)
+
     # Set constants controlling parcel data
-    num_ids_to_pick_from = 20
-    num_ids = 15
-    cities = ['Belleville', 'Guelph', 'Hamilton', 'Toronto', 'London', 'Ottawa']
     min_volume = 5
     max_volume = 25
 
-    depot = 'Toronto'
-
-    # Generate some random parcels
-    ids = list(range(num_ids_to_pick_from))
-    with open(parcel_filename, 'w') as file:
-        for dummy in range(num_ids):
-            # Pick a random id from among those left and remove it so we
-            # don't pick it again.
-            id_ = choice(ids)
-            ids.remove(id_)
-            source = choice(cities)
-            temp = cities.copy()
-            temp.remove(source)
-            if source != depot:
-                temp.remove(depot)
-            destination = choice(temp)
-            volume = randint(min_volume, max_volume)
-            file.write(f'{id_}, {source}, {destination}, {volume}\n')
+    # Generate some random parcels, a chunk at a time. Each parcel goes from
+    # a random city to another random city other than the depot.
+    pairs = _city_pairs(cities, cities.index(DEPOT), rand)
+    volumes = _volume_sampler(volume_distribution, min_volume, max_volume,
+                              rand)
+    ids = _random_ids(num_parcels, rand)
+    with open(parcel_filename, 'w', buffering=1 << 20) as file:
+        for size in _chunk_sizes(num_parcels):
+            file.write(''.join([
+                f'{id_}, {pair}, {volume}\n' for id_, pair, volume
+                in zip(next(ids), pairs(size), volumes(size))]))
 
     # Set constants controlling truck data
-    num_ids_to_pick_from = 10
-    num_ids = 5
     min_volume = 20
     max_volume = 50
 
     # Generate some random trucks
-    ids = list(range(num_ids_to_pick_from))
-    with open(truck_filename, 'w') as file:
-        for dummy in range(num_ids):
-            # Pick a random id from among those left and remove it so we
-            # don't pick it again.
-            id_ = choice(ids)
-            ids.remove(id_)
-            volume = randint(min_volume, max_volume)
-            file.write(f'{id_}, {volume}\n')
+    ids = _random_ids(num_trucks, rand)
+    volumes = _volume_sampler('uniform', min_volume, max_volume, rand)
+    with open(truck_filename, 'w', buffering=1 << 20) as file:
+        for size in _chunk_sizes(num_trucks):
+            file.write(''.join([f'{id_}, {volume}\n' for id_, volume
+                                in zip(next(ids), volumes(size))]))
+
+    if map_filename is not None:
+        _write_map(map_filename, cities, rand)
+
+
+def city_names(num_cities: int) -> List[str]:
+    """Return the names of <num_cities> generated cities.
+
+    >>> city_names(8)[-3:]
+    ['Ottawa', 'City7', 'City8']
+    """
+    return CITY_NAMES[:num_cities] \
+        + [f'City{k}' for k in range(len(CITY_NAMES) + 1, num_cities + 1)]
+
+
+def _chunk_sizes(total: int) -> Iterator[int]:
+    """Yield the sizes of the chunks in which <total> lines are generated.
+
+    >>> list(_chunk_sizes(_CHUNK_LINES + 3)) == [_CHUNK_LINES, 3]
+    True
+    """
+    for start in range(0, total, _CHUNK_LINES):
+        yield min(_CHUNK_LINES, total - start)
+
+
+def _random_ids(num_ids: int, rand: Random) -> Iterator[List[int]]:
+    """Yield <num_ids> distinct ids, as one list for each chunk size given by
+    _chunk_sizes(<num_ids>).
+
+    The ids increase by a random step of 1 or 2, so that about a third of the
+    ids in their range are skipped, and picking each id takes constant time.
+
+    >>> ids = [id_ for chunk in _random_ids(15, Random(1)) for id_ in chunk]
+    >>> len(set(ids)), max(ids) < 30
+    (15, True)
+    """
+    last = -1
+    for size in _chunk_sizes(num_ids):
+        chunk = list(accumulate(rand.choices((1, 2), k=size), initial=last))
+        last = chunk[-1]
+        yield chunk[1:]
+
+
+def _city_pairs(cities: List[str], depot: int,
+                rand: Random) -> Callable[[int], List[str]]:
+    """Return a function which takes a number of parcels and returns the
+    source and destination of each of them, drawn at random using <rand>, as
+    the text '<source>, <destination>'.
+
+    A parcel's destination is never its source, and is never the city with
+    index <depot> in <cities> unless that is also its source.
+
+    >>> pairs = _city_pairs(['A', 'B', 'C', 'D'], 0, Random(0))
+    >>> sorted(set(pairs(1000)))[:4]
+    ['A, B', 'A, C', 'A, D', 'B, C']
+    """
+    num_cities = len(cities)
+    if num_cities <= _PAIR_TABLE_CITIES:
+        table = [f'{cities[s]}, {cities[d]}'
+                 for s in range(num_cities) for d in range(num_cities)
+                 if d != s and (d != depot or s == depot)]
+        return lambda size: rand.choices(table, k=size)
+
+    def pairs(size: int) -> List[str]:
+        """Return <size> random pairs of cities, one at a time.
+
+        A destination is drawn from the cities that are allowed, by drawing
+        an index among them and stepping over the cities that are not.
+        """
+        result = []
+        for s in rand.choices(range(num_cities), k=size):
+            if s == depot:
+                d = int(rand.random() * (num_cities - 1))
+                d += d >= s
+            else:
+                d = int(rand.random() * (num_cities - 2))
+                d += d >= min(s, depot)
+                d += d >= max(s, depot)
+            result.append(f'{cities[s]}, {cities[d]}')
+        return result
+    return pairs
+
+
+def _volume_sampler(distribution: str, min_volume: int, max_volume: int,
+                    rand: Random) -> Callable[[int], List[int]]:
+    """Return a function which takes a number of parcels and returns a random
+    volume for each of them, drawn from <distribution> using <rand>.
+
+    A uniform volume is between <min_volume> and <max_volume>. A lognormal
+    volume has median halfway between them, and a heavy-tailed volume follows
+    a Pareto distribution starting at <min_volume>, so that a few parcels are
+    far larger than the rest. Every volume is at least 1.
+
+    >>> sample = _volume_sampler('heavy-tailed', 5, 25, Random(0))
+    >>> min(sample(1000)) >= 5
+    True
+    """
+    if distribution == 'uniform':
+        volumes = range(min_volume, max_volume + 1)
+        return lambda size: rand.choices(volumes, k=size)
+    if distribution == 'lognormal':
+        median = log((min_volume + max_volume) / 2)
+        return lambda size: [max(1, round(rand.lognormvariate(median, 0.5)))
+                             for dummy in range(size)]
+    if distribution == 'heavy-tailed':
+        return lambda size: [round(min_volume * rand.paretovariate(1.5))
+                             for dummy in range(size)]
+    raise ValueError(f'unknown volume distribution: {distribution}')
+
+
+def _write_map(map_filename: str, cities: List[str], rand: Random) -> None:
+    """Place <cities> at random points on a plane and write the distance
+    between every pair of them to <map_filename>, in the format of
+    data/map-data.txt.
+
+    Each distance is rounded up, and is at least 1. Since the straight-line
+    distances obey the triangle inequality, so do these: the sum of two
+    rounded-up distances is a whole number at least the third distance, so it
+    is at least that distance rounded up.
+    """
+    points: List[Tuple[float, float]] = [
+        (rand.uniform(0, _MAP_SIZE), rand.uniform(0, _MAP_SIZE))
+        for dummy in cities]
+    with open(map_filename, 'w', buffering=1 << 20) as file:
+        for i in range(len(cities)):
+            xi, yi = points[i]
+            file.write(''.join([
+                f'{cities[i]}, {cities[j]}, '
+                f'{max(1, ceil(hypot(xi - points[j][0], yi - points[j][1])))}'
+                f'\n' for j in range(i + 1, len(cities))]))
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Generate data files as described by the command-line arguments
+    <argv>.
+    """
+    parser = argparse.ArgumentParser(
+        description='Generate random parcel, truck and map data.')
+    parser.add_argument('--parcels', type=int, default=15,
+                        help='number of parcels')
+    parser.add_argument('--trucks', type=int, default=5,
+                        help='number of trucks')
+    parser.add_argument('--cities', type=int, default=len(CITY_NAMES),
+                        help='number of cities (at least 4)')
+    parser.add_argument('--volumes', choices=DISTRIBUTIONS, default='uniform',
+                        help='distribution of parcel volumes')
+    parser.add_argument('--seed', type=int, help='seed for reproducible data')
+    parser.add_argument('--parcel-file', default='data/demo-parcel-data.txt')
+    parser.add_argument('--truck-file', default='data/demo-truck-data.txt')
+    parser.add_argument('--map-file',
+                        help='also write the distances between the cities')
+    args = parser.parse_args(argv)
+    if args.cities < 4:
+        parser.error('--cities must be at least 4')
+    generate(args.parcel_file, args.truck_file, args.parcels, args.trucks,
+             args.seed, args.cities, args.volumes, args.map_file)
 
 
 if __name__ == '__main__':
-    import python_ta
-    python_ta.check_all(config='.pylintrc')
-    generate()
+    main()
@@ -0,0 +1,277 @@
+"""
+===== Module Description =====
+
+This module contains the class Instrumentation, which times and counts the
+main phases of scheduling while it is active, and can also profile the
+whole run with cProfile.
+
+Nothing in the schedulers checks whether they are being instrumented.
+Instead, while an Instrumentation is active, the methods on their hot paths
+are temporarily replaced by wrappers which time and count each call, and the
+original methods are put back when it stops. An experiment which is not
+instrumented runs exactly the code it would run without this module.
+
+The phases are:
+- queue: ordering the parcels, by building and draining a PriorityQueue or
+  by shuffling them.
+- candidate_scan: looking up the trucks whose route ends at a destination.
+- truck_selection: choosing a truck with room for a parcel from an index.
+- pack: packing a parcel onto a truck.
+- index_update: re-indexing a truck after it is packed.
+- stats: computing the statistics of a fleet.
+"""
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+from cProfile import Profile
+from functools import wraps
+from random import Random
+from time import perf_counter
+from container import PriorityQueue
+from domain import Truck, Fleet
+from scheduler import TruckIndex, DestinationIndex, CapacityTree
+
+# The methods which are timed for each phase.
+PHASES = {
+    'queue': [(PriorityQueue, '__init__'), (PriorityQueue, 'remove'),
+              (Random, 'shuffle')],
+    'candidate_scan': [(DestinationIndex, 'trucks_ending_at')],
+    'truck_selection': [(TruckIndex, 'tightest'), (TruckIndex, 'loosest'),
+                        (TruckIndex, 'random_fit'),
+                        (CapacityTree, 'first_fit')],
+    'pack': [(Truck, 'pack')],
+    'index_update': [(TruckIndex, 'update'), (DestinationIndex, 'update'),
+                     (CapacityTree, 'update')],
+    'stats': [(Fleet, 'stats')],
+}
+
+# The methods whose calls are counted but not timed, because they are too
+# cheap for a timer not to distort them.
+COUNTED = {'sum_vol': (Truck, 'sum_vol')}
+
+# The methods which return a collection of candidate Trucks, whose sizes are
+# added up.
+SIZED = {'candidate_trucks': (DestinationIndex, 'trucks_ending_at')}
+
+
+class Instrumentation:
+    """A recorder of the time spent in, and the number of calls to, each
+    phase of scheduling while it is active.
+
+    A call to a phase made while another call to the same phase is running,
+    such as a TruckIndex update made by a DestinationIndex update, is
+    counted as part of the outer call. Work done in other processes, such as
+    the workers of a MultiStartScheduler, is not recorded.
+
+    The schedulers do not scan the Trucks one by one: a Truck is chosen from
+    the candidates by a binary search in a TruckIndex. So instead of the
+    number of Trucks scanned, 'candidate_trucks' counts the Trucks that the
+    candidate scans offered, that is, the non-empty Trucks whose route ended
+    at the destination of each Parcel looked up.
+
+    === Public Attributes ===
+    times: the number of seconds spent in each phase.
+    counts: the number of calls to each phase and to each method in COUNTED,
+      and the total size of the results of each method in SIZED.
+
+    === Private Attributes ===
+    _phases: True iff the phases are timed and counted.
+    _profile_file: the file the cProfile statistics of the run are dumped
+      to, or None if it is not profiled.
+    _profiler: the profiler of the run while it is active, or None.
+    _running: whether a call to each phase is running, so that the calls it
+      makes to the same phase are not timed again.
+    _saved: the (class, name, method) of every method that is replaced by a
+      wrapper while this Instrumentation is active.
+
+    === Representation Invariants ===
+    - <_saved> is empty unless this Instrumentation is active.
+    """
+    # Attribute types
+    times: Dict[str, float]
+    counts: Dict[str, int]
+    _phases: bool
+    _profile_file: Optional[str]
+    _profiler: Optional[Profile]
+    _running: Dict[str, bool]
+    _saved: List[Tuple[type, str, Any]]
+
+    def __init__(self, phases: bool = True,
+                 profile_file: Optional[str] = None) -> None:
+        """Initialize a new, inactive Instrumentation which times and counts
+        the phases of scheduling if <phases> is True, and dumps cProfile
+        statistics to <profile_file> if it is not None.
+        """
+        self.times = {phase: 0.0 for phase in PHASES}
+        self.counts = {name: 0
+                       for name in list(PHASES) + list(COUNTED) + list(SIZED)}
+        self._phases = phases
+        self._profile_file = profile_file
+        self._profiler = None
+        self._running = {phase: False for phase in PHASES}
+        self._saved = []
+
+    def __enter__(self) -> 'Instrumentation':
+        """Start this Instrumentation and return it.
+        """
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        """Stop this Instrumentation.
+        """
+        self.stop()
+
+    def start(self) -> None:
+        """Start timing and counting the phases of scheduling, and profiling
+        if there is a profile file.
+
+        Precondition: this Instrumentation is not active.
+
+        >>> from domain import Parcel
+        >>> probe = Instrumentation()
+        >>> with probe:
+        ...     t = Truck(1, 10, 'Toronto')
+        ...     t.pack(Parcel(1, 5, 'Toronto', 'York'))
+        True
+        >>> probe.counts['pack'], probe.counts['sum_vol']
+        (1, 1)
+        >>> hasattr(Truck.pack, '__wrapped__')
+        False
+        """
+        if self._phases:
+            for phase, methods in PHASES.items():
+                for cls, name in methods:
+                    self._replace(cls, name, self._timed(cls.__dict__[name],
+                                                         phase))
+            for counter, (cls, name) in COUNTED.items():
+                self._replace(cls, name, self._counted(cls.__dict__[name],
+                                                       counter))
+            for counter, (cls, name) in SIZED.items():
+                self._replace(cls, name, self._sized(cls.__dict__[name],
+                                                     counter))
+        if self._profile_file is not None:
+            self._profiler = Profile()
+            self._profiler.enable()
+
+    def stop(self) -> None:
+        """Stop timing and counting, put back every method that was
+        replaced, and dump the profile if there is a profile file.
+        """
+        if self._profiler is not None:
+            self._profiler.disable()
+            self._profiler.dump_stats(self._profile_file)
+            self._profiler = None
+        while self._saved:
+            cls, name, method = self._saved.pop()
+            setattr(cls, name, method)
+
+    def stats(self, num_parcels: Optional[int] = None) \
+            -> Dict[str, Union[int, float]]:
+        """Return the times and counts recorded by this Instrumentation, with
+        the key 'time_<phase>' for the seconds spent in each phase and
+        'count_<name>' for each count.
+
+        If <num_parcels>, the number of parcels scheduled, is given, also
+        include 'count_truck_selection_per_parcel', the number of times a
+        Truck was chosen from an index per parcel, and
+        'count_candidate_trucks_per_parcel', the number of candidate Trucks
+        offered per parcel. Return an empty dictionary if the phases were not
+        timed.
+
+        >>> from domain import Parcel
+        >>> from scheduler import GreedyScheduler
+        >>> trucks = [Truck(1, 10, 'Toronto'), Truck(2, 10, 'Toronto')]
+        >>> parcels = [Parcel(k, 4, 'Toronto', 'York') for k in range(3)]
+        >>> scheduler = GreedyScheduler({'parcel_priority': 'volume',
+        ...                              'parcel_order': 'non-decreasing',
+        ...                              'truck_order': 'non-decreasing'})
+        >>> with Instrumentation() as probe:
+        ...     scheduler.schedule(parcels, trucks)
+        []
+        >>> probe.stats(3)['count_candidate_trucks']
+        2
+        """
+        if not self._phases:
+            return {}
+        result = {}
+        for phase, seconds in self.times.items():
+            result['time_' + phase] = seconds
+        for name, count in self.counts.items():
+            result['count_' + name] = count
+        if num_parcels:
+            for name in ['truck_selection', 'candidate_trucks']:
+                result['count_' + name + '_per_parcel'] = \
+                    self.counts[name] / num_parcels
+        return result
+
+    def _replace(self, cls: type, name: str, method: Callable) -> None:
+        """Replace the method <name> of <cls> by <method> until this
+        Instrumentation stops.
+        """
+        self._saved.append((cls, name, cls.__dict__[name]))
+        setattr(cls, name, method)
+
+    def _timed(self, method: Callable, phase: str) -> Callable:
+        """Return a wrapper of <method> which adds the time and number of its
+        calls to those of <phase>.
+        """
+        times = self.times
+        counts = self.counts
+        running = self._running
+
+        @wraps(method)
+        def timed(*args: Any, **kwargs: Any) -> Any:
+            """Call the wrapped method, and time the call unless it was made
+            by another call to the same phase.
+            """
+            if running[phase]:
+                return method(*args, **kwargs)
+            running[phase] = True
+            start = perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                times[phase] += perf_counter() - start
+                counts[phase] += 1
+                running[phase] = False
+        return timed
+
+    def _counted(self, method: Callable, counter: str) -> Callable:
+        """Return a wrapper of <method> which counts its calls in
+        <counter>.
+        """
+        counts = self.counts
+
+        @wraps(method)
+        def counted(*args: Any, **kwargs: Any) -> Any:
+            """Count the call, and call the wrapped method."""
+            counts[counter] += 1
+            return method(*args, **kwargs)
+        return counted
+
+    def _sized(self, method: Callable, counter: str) -> Callable:
+        """Return a wrapper of <method> which adds the size of each of its
+        results, or 0 for None, to <counter>.
+        """
+        counts = self.counts
+
+        @wraps(method)
+        def sized(*args: Any, **kwargs: Any) -> Any:
+            """Call the wrapped method, and count the size of its result."""
+            result = method(*args, **kwargs)
+            if result is not None:
+                counts[counter] += len(result)
+            return result
+        return sized
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-import-modules': ['doctest', 'python_ta', 'typing',
+                                   'cProfile', 'functools', 'random', 'time',
+                                   'container', 'domain', 'scheduler'],
+        'disable': ['E1136'],
+        'max-attributes': 15,
+    })
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,446 @@
+"""
+===== Module Description =====
+
+This module contains a local search which improves the schedule of a fleet
+after a Scheduler has packed it, for as long as it is given.
+
+The search moves parcels between trucks, swaps parcels between trucks, and
+moves parcels between the trucks and the parcels left unscheduled. It accepts
+moves by simulated annealing, so that it can leave a schedule which no single
+move improves, and keeps the best schedule it has seen.
+
+Each truck's route visits each of its destinations once, and a move only
+looks at the stops it adds or removes, so it is evaluated in time
+proportional to the number of stops on the two trucks it touches.
+"""
+from typing import Callable, Dict, List, Optional, Tuple
+from math import exp
+from random import Random
+from time import perf_counter
+from distance_map import DistanceMap, City
+from domain import Parcel, Fleet
+from routing import MISSING_LEG
+
+# The cost of leaving one unit of volume unscheduled. It is large enough that
+# scheduling a parcel is worth more than any distance it adds.
+UNSCHEDULED_PENALTY = 10 ** 6
+
+# The number of moves tried between two looks at the clock.
+_CLOCK_INTERVAL = 64
+
+# The temperature at the end of the search, as a fraction of the temperature
+# at the start.
+_FINAL_TEMPERATURE = 0.001
+
+# The index that stands for the parcels which are not on any truck.
+_UNSCHEDULED = -1
+
+
+def improve_schedule(fleet: Fleet, dmap: DistanceMap,
+                     unscheduled: List[Parcel], time_budget: float = 5.0,
+                     seed: Optional[int] = None,
+                     max_moves: Optional[int] = None) -> List[Parcel]:
+    """Improve the schedule of <fleet>, whose trucks have been packed and left
+    the parcels <unscheduled>, by local search for at most <time_budget>
+    seconds, or at most <max_moves> moves if that is not None. Return the
+    parcels which are left unscheduled by the improved schedule.
+
+    A schedule is better if it leaves less volume unscheduled, or leaves the
+    same volume unscheduled and has a shorter total distance, according to
+    <dmap>. Only the trucks whose parcels change are repacked; each of them
+    then visits each of its destinations once. If <seed> is not None, the
+    same seed always makes the same moves, although the number of moves made
+    in <time_budget> may vary.
+
+    >>> from domain import Truck
+    >>> d = DistanceMap()
+    >>> d.add_distance('York', 'A', 10)
+    >>> d.add_distance('York', 'B', 10)
+    >>> d.add_distance('A', 'B', 15)
+    >>> t1, t2 = Truck(1, 10, 'York'), Truck(2, 10, 'York')
+    >>> for k, (t, city) in enumerate([(t1, 'A'), (t1, 'B'), (t2, 'B'),
+    ...                                 (t2, 'A')]):
+    ...     t.pack(Parcel(k, 4, 'York', city))
+    True
+    True
+    True
+    True
+    >>> f = Fleet()
+    >>> f.add_truck(t1)
+    >>> f.add_truck(t2)
+    >>> left = improve_schedule(f, d, [Parcel(9, 2, 'York', 'A')], seed=1,
+    ...                         max_moves=2000)
+    >>> left, f.total_distance_travelled(d)
+    ([], 40)
+    """
+    search = _Search(fleet, dmap, unscheduled, seed)
+    search.run(time_budget, max_moves)
+    return search.write_back(fleet)
+
+
+class _Search:
+    """The state of a local search over the schedule of a fleet.
+
+    Trucks are referred to by their index in the fleet, and the parcels that
+    are not on any truck by the index _UNSCHEDULED.
+
+    === Private Attributes ===
+    _rand: the source of random numbers of this search.
+    _leg: returns the distance between two cities, 0 if they are the same
+      city, or MISSING_LEG if it is not recorded.
+    _depots: the depot of each truck.
+    _capacities: the capacity of each truck.
+    _parcels: the parcels on each truck.
+    _unscheduled: the parcels which are not on any truck.
+    _loads: the total volume of the parcels on each truck.
+    _counts: maps each destination of the parcels on each truck, other than
+      its depot, to the number of its parcels going there.
+    _stops: the destinations each truck visits, in order, not counting its
+      depot at either end.
+    _costs: the distance travelled by each truck along its stops.
+    _cost: the total cost of the schedule: the sum of <_costs> plus
+      UNSCHEDULED_PENALTY for each unit of unscheduled volume.
+    _best_cost: the least cost of a schedule seen so far.
+    _journal: the moves made since the schedule was last the best seen, in
+      order, each with what is needed to undo it.
+
+    === Representation Invariants ===
+    - _loads[k] <= _capacities[k] for every truck k
+    - the keys of _counts[k] are exactly the cities in _stops[k]
+    - _best_cost <= _cost
+    """
+    # Attribute types
+    _rand: Random
+    _leg: Callable[[City, City], int]
+    _depots: List[City]
+    _capacities: List[int]
+    _parcels: List[List[Parcel]]
+    _unscheduled: List[Parcel]
+    _loads: List[int]
+    _counts: List[Dict[City, int]]
+    _stops: List[List[City]]
+    _costs: List[int]
+    _cost: int
+    _best_cost: int
+    _journal: List[tuple]
+
+    def __init__(self, fleet: Fleet, dmap: DistanceMap,
+                 unscheduled: List[Parcel], seed: Optional[int]) -> None:
+        """Initialize a search starting from the schedule of <fleet>, which
+        left <unscheduled>, with distances from <dmap>.
+        """
+        def leg(a: City, b: City) -> int:
+            """Return the distance from <a> to <b>, which is 0 if they are
+            the same city, as for the empty route of a truck at its depot.
+            """
+            if a == b:
+                return 0
+            dist = dmap.distance(a, b)
+            return MISSING_LEG if dist < 0 else dist
+
+        self._rand = Random(seed)
+        self._leg = leg
+        self._depots = []
+        self._capacities = []
+        self._parcels = []
+        self._loads = []
+        self._counts = []
+        self._stops = []
+        self._costs = []
+        for truck in fleet.trucks:
+            depot = truck.route[0]
+            counts = {}
+            for par in truck.all_parcels:
+                if par.destination != depot:
+                    counts[par.destination] = counts.get(par.destination, 0) + 1
+            stops = []
+            for city in truck.route[1:-1]:
+                if city in counts and city not in stops:
+                    stops.append(city)
+            self._depots.append(depot)
+            self._capacities.append(truck.capacity)
+            self._parcels.append(list(truck.all_parcels))
+            self._loads.append(truck.sum_vol())
+            self._counts.append(counts)
+            self._stops.append(stops)
+            self._costs.append(self._route_cost(depot, stops))
+        self._unscheduled = list(unscheduled)
+        self._cost = sum(self._costs) + UNSCHEDULED_PENALTY * sum(
+            par.volume for par in unscheduled)
+        self._best_cost = self._cost
+        self._journal = []
+
+    def run(self, time_budget: float, max_moves: Optional[int]) -> None:
+        """Make random moves by simulated annealing until <time_budget>
+        seconds have passed, or <max_moves> moves have been tried if that is
+        not None, and then return to the best schedule seen.
+        """
+        if len(self._depots) == 0:
+            return
+        start = perf_counter()
+        initial = self._initial_temperature()
+        temperature = initial
+        moves = 0
+        while max_moves is None or moves < max_moves:
+            if moves % _CLOCK_INTERVAL == 0:
+                done = (perf_counter() - start) / time_budget \
+                    if time_budget > 0 else 1.0
+                if max_moves is not None:
+                    done = max(done, moves / max_moves)
+                if done >= 1.0:
+                    break
+                temperature = initial * _FINAL_TEMPERATURE ** done
+            moves += 1
+            move = self._random_move()
+            if move is None:
+                continue
+            delta = move[0]
+            if delta <= 0 or (temperature > 0 and self._rand.random()
+                              < exp(-delta / temperature)):
+                self._apply(move)
+        while self._cost > self._best_cost:
+            self._undo()
+
+    def write_back(self, fleet: Fleet) -> List[Parcel]:
+        """Repack every truck of <fleet> whose parcels differ from those this
+        search has put on it, and return the unscheduled parcels.
+        """
+        changed = []
+        for k in range(len(fleet.trucks)):
+            truck = fleet.trucks[k]
+            if len(truck.all_parcels) != len(self._parcels[k]) or not all(
+                    old is new for old, new
+                    in zip(truck.all_parcels, self._parcels[k])):
+                truck.clear()
+                changed.append(k)
+        # Every changed truck is cleared before any is repacked, since a
+        # parcel may only be on one truck of the fleet at a time.
+        for k in changed:
+            truck = fleet.trucks[k]
+            for par in self._parcels[k]:
+                truck.pack(par)
+            if len(self._parcels[k]) > 0:
+                truck.reroute(self._stops[k])
+        return self._unscheduled
+
+    def _route_cost(self, depot: City, stops: List[City]) -> int:
+        """Return the distance travelled from <depot> along <stops> and back.
+        """
+        if len(stops) == 0:
+            return 0
+        total = self._leg(depot, stops[0]) + self._leg(stops[-1], depot)
+        for k in range(len(stops) - 1):
+            total += self._leg(stops[k], stops[k + 1])
+        return total
+
+    def _initial_temperature(self) -> float:
+        """Return a starting temperature at which a typical move that adds
+        distance is accepted about a third of the time.
+        """
+        worse = []
+        for dummy in range(100):
+            move = self._random_move()
+            if move is not None and 0 < move[0] < UNSCHEDULED_PENALTY:
+                worse.append(move[0])
+        if len(worse) == 0:
+            return 0.0
+        return sum(worse) / len(worse)
+
+    def _random_move(self) -> Optional[tuple]:
+        """Return a random move which keeps every truck within its capacity,
+        or None if the one drawn would not.
+
+        A move is a tuple (delta, a, p, b, q, stops_a, stops_b): parcel
+        <p> at index p of place <a> moves to place <b>, and parcel q of place
+        <b> moves to place <a> unless q is None. A place is a truck index or
+        _UNSCHEDULED. <delta> is the change in cost, and <stops_a> and
+        <stops_b> are the new stops of trucks <a> and <b>, or None if they do
+        not change.
+        """
+        num_trucks = len(self._depots)
+        if len(self._unscheduled) > 0 and self._rand.random() < 1 / 3:
+            a = _UNSCHEDULED
+        else:
+            a = self._rand.randrange(num_trucks)
+        b = self._rand.randrange(num_trucks)
+        if a == b:
+            return None
+        from_a = self._place(a)
+        if len(from_a) == 0:
+            return None
+        p = self._rand.randrange(len(from_a))
+        par = from_a[p]
+
+        q = None
+        other = None
+        from_b = self._place(b)
+        if len(from_b) > 0 and self._rand.random() < 0.5:
+            q = self._rand.randrange(len(from_b))
+            other = from_b[q]
+
+        moved = par.volume - (0 if other is None else other.volume)
+        if self._loads[b] + moved > self._capacities[b] or (
+                a != _UNSCHEDULED
+                and self._loads[a] - moved > self._capacities[a]):
+            return None
+        delta_a, stops_a = self._change(a, par, other)
+        delta_b, stops_b = self._change(b, other, par)
+        return delta_a + delta_b, a, p, b, q, stops_a, stops_b
+
+    def _place(self, place: int) -> List[Parcel]:
+        """Return the parcels of <place>, a truck index or _UNSCHEDULED.
+        """
+        if place == _UNSCHEDULED:
+            return self._unscheduled
+        return self._parcels[place]
+
+    def _change(self, place: int, out: Optional[Parcel],
+                into: Optional[Parcel]) -> Tuple[int, Optional[List[City]]]:
+        """Return the change in cost if <out> leaves <place> and <into> joins
+        it, where either may be None, and the new stops of <place>, or None if
+        they do not change.
+
+        A stop whose last parcel leaves is dropped, and a new stop is put
+        where it adds the least distance.
+        """
+        if place == _UNSCHEDULED:
+            delta = 0 if into is None else into.volume
+            delta -= 0 if out is None else out.volume
+            return UNSCHEDULED_PENALTY * delta, None
+
+        depot = self._depots[place]
+        counts = self._counts[place]
+        leg = self._leg
+        stops = self._stops[place]
+        new_stops = None
+        delta = 0
+        if out is not None and out.destination != depot \
+                and counts[out.destination] == 1 \
+                and (into is None or into.destination != out.destination):
+            i = stops.index(out.destination)
+            before = depot if i == 0 else stops[i - 1]
+            after = depot if i == len(stops) - 1 else stops[i + 1]
+            delta += leg(before, after) - leg(before, stops[i]) \
+                - leg(stops[i], after)
+            new_stops = stops[:i] + stops[i + 1:]
+        if into is not None and into.destination != depot \
+                and into.destination not in counts:
+            base = stops if new_stops is None else new_stops
+            city = into.destination
+            best, where = None, 0
+            for i in range(len(base) + 1):
+                before = depot if i == 0 else base[i - 1]
+                after = depot if i == len(base) else base[i]
+                added = leg(before, city) + leg(city, after) \
+                    - leg(before, after)
+                if best is None or added < best:
+                    best, where = added, i
+            delta += best
+            new_stops = base[:where] + [city] + base[where:]
+        return delta, new_stops
+
+    def _apply(self, move: tuple) -> None:
+        """Make <move>, as returned by _random_move.
+        """
+        delta, a, p, b, q, stops_a, stops_b = move
+        from_a = self._place(a)
+        from_b = self._place(b)
+        par = from_a[p]
+        if q is None:
+            from_a[p] = from_a[-1]
+            from_a.pop()
+            self._remove(a, par)
+        else:
+            other = from_b[q]
+            from_a[p] = other
+            from_b[q] = from_b[-1]
+            from_b.pop()
+            self._remove(b, other)
+            self._remove(a, par)
+            self._add(a, other)
+        from_b.append(par)
+        self._add(b, par)
+
+        undo = [delta, a, p, b, q]
+        for place, stops in [(a, stops_a), (b, stops_b)]:
+            if stops is not None:
+                undo.append((place, self._stops[place], self._costs[place]))
+                self._stops[place] = stops
+                self._costs[place] = self._route_cost(self._depots[place],
+                                                      stops)
+        self._cost += delta
+        if self._cost < self._best_cost:
+            self._best_cost = self._cost
+            self._journal = []
+        else:
+            self._journal.append(undo)
+
+    def _undo(self) -> None:
+        """Undo the last move in the journal, putting every parcel back at the
+        index it had before the move.
+        """
+        undo = self._journal.pop()
+        delta, a, p, b, q = undo[:5]
+        from_a = self._place(a)
+        from_b = self._place(b)
+        par = from_b.pop()
+        self._remove(b, par)
+        if q is None:
+            self._add(a, par)
+            if p == len(from_a):
+                from_a.append(par)
+            else:
+                from_a.append(from_a[p])
+                from_a[p] = par
+        else:
+            other = from_a[p]
+            self._remove(a, other)
+            self._add(a, par)
+            self._add(b, other)
+            from_a[p] = par
+            if q == len(from_b):
+                from_b.append(other)
+            else:
+                from_b.append(from_b[q])
+                from_b[q] = other
+        for place, stops, cost in undo[5:]:
+            self._stops[place] = stops
+            self._costs[place] = cost
+        self._cost -= delta
+
+    def _remove(self, place: int, par: Parcel) -> None:
+        """Update the load and destination counts of <place> for <par>
+        leaving it.
+        """
+        if place == _UNSCHEDULED:
+            return
+        self._loads[place] -= par.volume
+        counts = self._counts[place]
+        if par.destination != self._depots[place]:
+            counts[par.destination] -= 1
+            if counts[par.destination] == 0:
+                del counts[par.destination]
+
+    def _add(self, place: int, par: Parcel) -> None:
+        """Update the load and destination counts of <place> for <par>
+        joining it.
+        """
+        if place == _UNSCHEDULED:
+            return
+        self._loads[place] += par.volume
+        counts = self._counts[place]
+        if par.destination != self._depots[place]:
+            counts[par.destination] = counts.get(par.destination, 0) + 1
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-import-modules': ['doctest', 'python_ta', 'typing', 'math',
+                                   'random', 'time', 'distance_map', 'domain',
+                                   'routing'],
+        'disable': ['E1136'],
+        'max-attributes': 15,
+    })
+    import doctest
+    doctest.testmod()
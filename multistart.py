@@ -0,0 +1,182 @@
+"""
+===== Module Description =====
+
+This module contains the class MultiStartScheduler, which runs a randomized
+scheduling algorithm many times with different seeds, in a pool of worker
+processes, and keeps the best schedule by a configurable objective.
+
+The parcels, trucks and distance map are handed to each worker once, when it
+starts, rather than once per run. Each run starts from copies of the trucks
+with the parcels they already hold, so that the best run is chosen for the
+trucks as they are. A run only sends back the value of its
+objective, and the best run is then repeated with its seed to pack the
+trucks, so no schedule is ever sent between processes.
+"""
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+from random import Random
+from distance_map import DistanceMap, City
+from domain import Parcel, Truck, Fleet
+from parallel import map_shared
+from scheduler import Scheduler, RandomScheduler, OnlineGreedyScheduler
+
+# The statistics an objective can be made of. Every one of them is better
+# when it is smaller. The last two describe the parcels that are left
+# unscheduled.
+OBJECTIVE_KEYS = ('num_nonempty_trucks', 'total_unused_space',
+                  'total_distance', 'average_distance', 'unscheduled',
+                  'unscheduled_volume')
+
+
+class MultiStartScheduler(Scheduler):
+    """A Scheduler which runs a randomized algorithm once for each of several
+    seeds, and keeps the schedule which is best by its objective.
+
+    The randomized algorithm is a RandomScheduler, or, for a randomized
+    greedy algorithm, an OnlineGreedyScheduler which takes the Parcels in a
+    random order.
+
+    === Public Attributes ===
+    seeds: the seed of each run, in the order they are run.
+
+    === Private Attributes ===
+    _config: the configuration of the algorithm that is run.
+    _dmap: the distances used to evaluate the objective.
+    _workers: the number of worker processes the runs are shared among.
+    _objective: the statistics which decide which run is best, in order of
+    importance.
+    """
+    # Attribute types
+    seeds: List[int]
+    _config: Dict[str, Union[str, bool, int]]
+    _dmap: DistanceMap
+    _workers: int
+    _objective: Tuple[str, ...]
+
+    def __init__(self, config: Dict[str, Union[str, bool, int]],
+                 dmap: DistanceMap) -> None:
+        """Initialize a new MultiStartScheduler which makes
+        <config>['multi_start'] runs of the random algorithm if
+        <config>['algorithm'] is 'random', and of the randomized greedy
+        algorithm with <config>['truck_order'] otherwise.
+
+        The seeds of the runs are drawn from <config>['seed'] if it is given.
+        The runs are shared among <config>['workers'] processes (1 by
+        default), and the best run is the one with the least value of the
+        statistics named in <config>['objective'] (by default, the number of
+        unscheduled parcels and then the total distance), compared in order.
+        Distances are taken from <dmap>.
+
+        Precondition: <config>['multi_start'] >= 1, and every name in
+        <config>['objective'] is in OBJECTIVE_KEYS
+        """
+        self._config = config
+        self._dmap = dmap
+        rand = Random(config.get('seed'))
+        self.seeds = [rand.randrange(2 ** 32)
+                      for dummy in range(config['multi_start'])]
+        self._workers = config.get('workers', 1)
+        self._objective = tuple(config.get('objective',
+                                           ('unscheduled', 'total_distance')))
+
+    def schedule(self, parcels: Iterable[Parcel], trucks: List[Truck],
+                 verbose: bool = False) -> List[Parcel]:
+        """Schedule the given <parcels> onto the given <trucks> with the seed
+        whose run is best by the objective of this MultiStartScheduler.
+
+        Mutate the Truck objects in <trucks> so that they store information
+        about which parcel objects they will deliver and what route they will
+        take.  Do *not* mutate the list <parcels>, or any of the parcel objects
+        in that list.
+
+        Return a list containing the parcels that did not get scheduled onto any
+        truck, due to lack of capacity.
+
+        If <verbose> is True, print step-by-step details regarding
+        the scheduling algorithm as it runs with the best seed.
+
+        Parcels already packed onto <trucks> stay where they are, and every
+        run is made and evaluated on copies of <trucks> which hold them too.
+        So this also schedules a late batch of parcels for schedule_more.
+
+        >>> from distance_map import DistanceMap
+        >>> d = DistanceMap()
+        >>> d.add_distance('York', 'A', 5)
+        >>> d.add_distance('York', 'B', 5)
+        >>> d.add_distance('A', 'B', 5)
+        >>> parcels = [Parcel(k, 3 + k % 4, 'York', 'AB'[k % 2])
+        ...            for k in range(12)]
+        >>> trucks = [Truck(k, 15, 'York') for k in range(3)]
+        >>> s = MultiStartScheduler({'algorithm': 'random', 'multi_start': 20,
+        ...                          'seed': 1}, d)
+        >>> left = s.schedule(parcels, trucks)
+        >>> sum(len(t.all_parcels) for t in trucks) + len(left)
+        12
+        """
+        parcels = list(parcels)
+        spec = [(t.truck_id, t.capacity, t.route, t.all_parcels)
+                for t in trucks]
+        results = map_shared(_run_seed, self.seeds, (parcels, spec, self),
+                             self._workers)
+        best = min(range(len(results)), key=lambda k: results[k])
+        return self.run(self.seeds[best], parcels, trucks, verbose)
+
+    def run(self, seed: Optional[int], parcels: List[Parcel],
+            trucks: List[Truck], verbose: bool = False) -> List[Parcel]:
+        """Schedule <parcels> onto <trucks> by a single run of the randomized
+        algorithm of this MultiStartScheduler, seeded with <seed>, and return
+        the parcels that did not get scheduled.
+        """
+        if self._config['algorithm'] == 'random':
+            return RandomScheduler(seed).schedule(parcels, trucks, verbose)
+        order = parcels.copy()
+        Random(seed).shuffle(order)
+        return OnlineGreedyScheduler(self._config).schedule(order, trucks,
+                                                            verbose)
+
+    def evaluate(self, trucks: List[Truck],
+                 unscheduled: List[Parcel]) -> tuple:
+        """Return the value of the objective of this MultiStartScheduler for
+        a schedule which packed <trucks> and left <unscheduled>.
+        """
+        fleet = Fleet()
+        for truck in trucks:
+            fleet.add_truck(truck)
+        stats = fleet.stats(self._dmap)
+        stats['unscheduled'] = len(unscheduled)
+        stats['unscheduled_volume'] = sum(par.volume for par in unscheduled)
+        return tuple(stats[key] for key in self._objective)
+
+
+def _run_seed(shared: Tuple[List[Parcel],
+                            List[Tuple[int, int, List[City], List[Parcel]]],
+                            MultiStartScheduler],
+              seed: int) -> tuple:
+    """Run the randomized algorithm of the MultiStartScheduler in <shared>
+    with <seed> on the parcels in <shared>, using fresh trucks made from the
+    (truck id, capacity, route, packed parcels) tuples in <shared>, and
+    return the value of its objective.
+    """
+    parcels, spec, scheduler = shared
+    trucks = []
+    for tid, capacity, route, packed in spec:
+        truck = Truck(tid, capacity, route[0])
+        for par in packed:
+            truck.pack(par)
+        if len(packed) > 0:
+            truck.reroute(route[1:-1])
+        trucks.append(truck)
+    unscheduled = scheduler.run(seed, parcels, trucks)
+    return scheduler.evaluate(trucks, unscheduled)
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-import-modules': ['doctest', 'python_ta', 'typing',
+                                   'random', 'distance_map', 'domain',
+                                   'parallel', 'scheduler'],
+        'disable': ['E1136'],
+        'max-attributes': 15,
+    })
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,68 @@
+"""
+===== Module Description =====
+
+This module contains map_shared, which calls a function on each of several
+items with the same input, in a pool of worker processes if there is more
+than one worker.
+
+The shared input is handed to each worker once, by the initializer of the
+pool, rather than once per item. It is used by module explore to run every
+algorithm configuration on the same parcels, trucks and map, and by module
+multistart to run every seed on them.
+"""
+from typing import Any, Callable, Iterable, List
+from functools import partial
+from multiprocessing import Pool
+
+# The input shared by every call made in this worker process. It is set by
+# _share when the worker starts.
+_shared: Any = None
+
+
+def map_shared(function: Callable[[Any, Any], Any], items: Iterable[Any],
+               shared: Any, workers: int = 1) -> List[Any]:
+    """Return the list of function(<shared>, item) for each item of <items>,
+    in order.
+
+    If <workers> is more than 1, the calls are shared among a pool of
+    <workers> processes, each of which is handed <shared> once when it
+    starts. <function> must then be defined at the top level of a module,
+    and <shared>, <items> and the results must be picklable.
+
+    >>> map_shared(pow, [1, 2, 3], 2)
+    [2, 4, 8]
+    """
+    if workers <= 1:
+        return [function(shared, item) for item in items]
+    with Pool(workers, _share, (shared,)) as pool:
+        return pool.map(partial(_call_shared, function), items)
+
+
+def _share(shared: Any) -> None:
+    """Make <shared> the input of every call made in this process.
+
+    This is the initializer of each worker process.
+    """
+    global _shared
+    _shared = shared
+
+
+def _call_shared(function: Callable[[Any, Any], Any], item: Any) -> Any:
+    """Return function(<shared>, <item>) for the input shared with this
+    process.
+
+    Precondition: _share has been called in this process.
+    """
+    return function(_shared, item)
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-import-modules': ['doctest', 'python_ta', 'typing',
+                                   'functools', 'multiprocessing'],
+        'disable': ['E1136'],
+        'max-attributes': 15,
+    })
+    import doctest
+    doctest.testmod()
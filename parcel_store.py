@@ -0,0 +1,280 @@
+"""
+===== Module Description =====
+
+This module contains the class ParcelStore, which reads parcels from a binary
+parcel store file through a memory map, and write_parcel_store, which writes
+such a file.
+
+A parcel store holds one fixed-width record of four 64-bit integers per
+parcel: its id, volume, source and destination, with the cities given by
+their ids in a table of city names at the end of the file. Opening a store
+only maps it into memory, however many parcels it holds, and a ParcelStore
+can list or order its parcels by volume or destination without creating a
+Parcel object for each of them.
+
+Text parcel files are converted to parcel stores by
+experiment.convert_parcels.
+"""
+from typing import Any, BinaryIO, Iterable, Iterator, List, Tuple
+from array import array
+import json
+import mmap
+import sys
+from distance_map import CityRegistry
+from domain import Parcel
+
+# The first 8 bytes of every parcel store.
+_MAGIC = b'PSTORE01'
+
+# The number of bytes before the first record: the magic bytes, the number of
+# parcels, and the offset of the table of city names.
+_PREAMBLE_SIZE = 24
+
+# The number of 64-bit integers in a record, and the position of each field.
+_FIELDS = 4
+_ID, _VOLUME, _SOURCE, _DESTINATION = range(_FIELDS)
+
+# The number of parcels created from a ParcelStore at a time while it is
+# iterated over.
+_CHUNK_PARCELS = 1 << 14
+
+
+class ParcelStore:
+    """The parcels of a parcel store file, read through a memory map.
+
+    Records are read from the file in place. A Parcel is only created when
+    one is looked up or iterated over; these Parcels name their cities, and
+    are equal in value but not identical to the Parcels produced by earlier
+    lookups.
+
+    A ParcelStore can be given to a Scheduler wherever a list of Parcels is
+    expected. A GreedyScheduler takes its Parcels from ordered, so that they
+    are created one at a time as they are scheduled.
+
+    === Public Attributes ===
+    cities: the cities of the parcels, with the ids they have in the store.
+
+    === Private Attributes ===
+    _file: the open store file.
+    _map: the memory map of <_file>.
+    _records: the records of the store, as a flat view of 64-bit integers
+      over <_map>, with the fields of the k-th parcel at indices
+      4 * k to 4 * k + 3.
+
+    === Representation Invariants ===
+    - len(_records) is a multiple of 4.
+    """
+    # Attribute types
+    cities: CityRegistry
+    _file: BinaryIO
+    _map: mmap.mmap
+    _records: memoryview
+
+    def __init__(self, store_file: str) -> None:
+        """Open the parcel store <store_file>.
+
+        Raise ValueError if <store_file> is not a parcel store that can be
+        read on this machine, or is truncated.
+        """
+        self._file = open(store_file, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError(f'{store_file} is not a parcel store') from None
+        try:
+            count, table = _read_preamble(self._map, store_file)
+            trailer = json.loads(self._map[table:])
+            if trailer.get('byteorder') != sys.byteorder:
+                raise ValueError(f'{store_file} was written on another '
+                                 f'machine')
+        except ValueError:
+            self._map.close()
+            self._file.close()
+            raise
+        self.cities = CityRegistry()
+        for name in trailer['cities']:
+            self.cities.intern(name)
+        end = _PREAMBLE_SIZE + count * _FIELDS * 8
+        with memoryview(self._map) as view:
+            self._records = view[_PREAMBLE_SIZE:end].cast('q')
+
+    def __enter__(self) -> 'ParcelStore':
+        """Return this ParcelStore, which is closed at the end of the with
+        statement.
+        """
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        """Close this ParcelStore.
+        """
+        self.close()
+
+    def close(self) -> None:
+        """Close the store file. This ParcelStore cannot be used afterwards.
+        """
+        if not self._map.closed:
+            self._records.release()
+            self._map.close()
+        self._file.close()
+
+    def __len__(self) -> int:
+        """Return the number of parcels in this ParcelStore.
+        """
+        return len(self._records) // _FIELDS
+
+    def __getitem__(self, k: int) -> Parcel:
+        """Return a Parcel with the values of the parcel at index <k> of this
+        ParcelStore.
+        """
+        if k < 0:
+            k += len(self)
+        if not 0 <= k < len(self):
+            raise IndexError('parcel index out of range')
+        par_id, volume, source, destination = \
+            self._records[_FIELDS * k:_FIELDS * (k + 1)].tolist()
+        name_of = self.cities.name_of
+        return Parcel(par_id, volume, name_of(source), name_of(destination))
+
+    def __iter__(self) -> Iterator[Parcel]:
+        """Return an iterator which creates the Parcels of this ParcelStore,
+        in order, a chunk at a time.
+        """
+        return self._chunks(range(0, len(self), _CHUNK_PARCELS))
+
+    def column(self, field: str) -> memoryview:
+        """Return the values of <field>, which is 'id', 'volume', 'source' or
+        'destination', for every parcel of this ParcelStore, in order, as a
+        view of the store rather than a copy. Cities are given by their ids in
+        <cities>.
+        """
+        k = ('id', 'volume', 'source', 'destination').index(field)
+        return self._records[k::_FIELDS]
+
+    def order(self, priority: str, reverse: bool = False) -> array:
+        """Return the indices of the parcels of this ParcelStore in order of
+        <priority>, which is 'volume' or 'destination', from smallest to
+        largest, or largest to smallest if <reverse> is True. Destinations
+        are ordered by name. Parcels with equal keys stay in store order.
+
+        The indices are bucketed by key into arrays rather than sorted as a
+        list, so ordering n parcels with K distinct keys takes O(n + K log K)
+        time and about 16 bytes per parcel, instead of a Python int and a key
+        for each parcel.
+        """
+        if priority == 'volume':
+            keys = self.column('volume')
+            key_order = None
+        else:
+            keys = self.column('destination')
+            key_order = self.cities.name_of
+        buckets = {}
+        for k, key in enumerate(keys):
+            bucket = buckets.get(key)
+            if bucket is None:
+                bucket = buckets[key] = array('q')
+            bucket.append(k)
+        indices = array('q')
+        for key in sorted(buckets, key=key_order, reverse=reverse):
+            indices.extend(buckets.pop(key))
+        return indices
+
+    def ordered(self, priority: str,
+                reverse: bool = False) -> Iterator[Parcel]:
+        """Return an iterator which creates the Parcels of this ParcelStore in
+        the order given by order(<priority>, <reverse>), one at a time.
+        """
+        indices = self.order(priority, reverse)
+        return (Parcel(*fields) for fields in self._fields_at(indices))
+
+    def _fields_at(self, indices: array) -> Iterator[Tuple]:
+        """Yield the (id, volume, source name, destination name) of the
+        parcels at <indices>, in order.
+        """
+        records = self._records
+        name_of = self.cities.name_of
+        for k in indices:
+            i = _FIELDS * k
+            yield (records[i + _ID], records[i + _VOLUME],
+                   name_of(records[i + _SOURCE]),
+                   name_of(records[i + _DESTINATION]))
+
+    def _chunks(self, starts: Iterable[int]) -> Iterator[Parcel]:
+        """Yield the Parcels of the chunks of this ParcelStore which start at
+        the indices <starts>.
+        """
+        name_of = self.cities.name_of
+        for start in starts:
+            end = min(start + _CHUNK_PARCELS, len(self))
+            fields = self._records[_FIELDS * start:_FIELDS * end].tolist()
+            yield from map(Parcel, fields[_ID::_FIELDS],
+                           fields[_VOLUME::_FIELDS],
+                           map(name_of, fields[_SOURCE::_FIELDS]),
+                           map(name_of, fields[_DESTINATION::_FIELDS]))
+
+
+def write_parcel_store(store_file: str, chunks: Iterable[List[list]]) -> int:
+    """Write the parcels given by <chunks> to the parcel store <store_file>,
+    and return the number of parcels written.
+
+    Each chunk is a list of the ids, sources, destinations and volumes of
+    some parcels, in the order of the fields of a parcel file. Chunks are
+    written as they arrive, so only one of them is in memory at a time.
+
+    >>> import os, tempfile
+    >>> path = os.path.join(tempfile.mkdtemp(), 'parcels.store')
+    >>> write_parcel_store(path, [[[27, 28], ['Toronto', 'York'],
+    ...                            ['York', 'Guelph'], [5, 6]]])
+    2
+    >>> store = ParcelStore(path)
+    >>> [(p.par_id, p.destination) for p in store.ordered('volume', True)]
+    [(28, 'Guelph'), (27, 'York')]
+    >>> store.close()
+    """
+    cities = CityRegistry()
+    count = 0
+    with open(store_file, 'wb') as file:
+        file.write(bytes(_PREAMBLE_SIZE))
+        for ids, sources, destinations, volumes in chunks:
+            records = array('q', bytes(8 * _FIELDS * len(ids)))
+            records[_ID::_FIELDS] = array('q', ids)
+            records[_VOLUME::_FIELDS] = array('q', volumes)
+            records[_SOURCE::_FIELDS] = array('q', map(cities.intern,
+                                                       sources))
+            records[_DESTINATION::_FIELDS] = array(
+                'q', map(cities.intern, destinations))
+            records.tofile(file)
+            count += len(ids)
+        table = file.tell()
+        names = [cities.name_of(k) for k in range(len(cities))]
+        file.write(json.dumps({'byteorder': sys.byteorder,
+                               'cities': names}).encode())
+        file.seek(0)
+        file.write(_MAGIC + array('q', [count, table]).tobytes())
+    return count
+
+
+def _read_preamble(data: mmap.mmap, store_file: str) -> Tuple[int, int]:
+    """Return the number of parcels and the offset of the table of city names
+    of the parcel store <data>, read from the file <store_file>.
+    """
+    if len(data) < _PREAMBLE_SIZE or data[:len(_MAGIC)] != _MAGIC:
+        raise ValueError(f'{store_file} is not a parcel store')
+    count, table = array('q', data[len(_MAGIC):_PREAMBLE_SIZE])
+    if table != _PREAMBLE_SIZE + count * _FIELDS * 8 or table > len(data):
+        raise ValueError(f'{store_file} is truncated')
+    return count, table
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-import-modules': ['doctest', 'python_ta', 'typing', 'array',
+                                   'json', 'mmap', 'sys', 'os', 'tempfile',
+                                   'distance_map', 'domain'],
+        'disable': ['E1136'],
+        'max-attributes': 15,
+    })
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,230 @@
+"""
+===== Module Description =====
+
+This module contains functions which reorder the stops of the trucks in a
+fleet after parcels have been scheduled onto them, so that the trucks travel
+shorter distances.
+
+A truck's route follows the order in which its parcels were packed, and may
+visit a city more than once. The route is rebuilt so that it visits each
+destination once: a nearest-neighbour tour is improved with 2-opt and Or-opt
+moves until no move helps or the time budget for the truck runs out.
+"""
+from typing import List, Tuple
+from time import perf_counter
+from distance_map import DistanceMap, City
+from domain import Truck, Fleet
+
+# The cost of travelling between two cities whose distance is not recorded.
+# It is large enough that a route never uses such a leg to save distance.
+MISSING_LEG = 10 ** 9
+
+
+def optimize_routes(fleet: Fleet, dmap: DistanceMap,
+                    time_budget: float = 0.05) -> Tuple[int, int]:
+    """Reorder the route of every non-empty truck in <fleet> so that it visits
+    each of its destinations once, along a tour that is as short as can be
+    found within <time_budget> seconds per truck, according to <dmap>.
+
+    A truck keeps its route if the new one is not shorter.
+
+    Return the total distance travelled by <fleet> before and after the
+    routes were reordered.
+
+    >>> from domain import Parcel
+    >>> d = DistanceMap()
+    >>> d.add_distance('York', 'A', 1)
+    >>> d.add_distance('York', 'B', 10)
+    >>> d.add_distance('A', 'B', 10)
+    >>> t = Truck(1, 10, 'York')
+    >>> for k, city in enumerate(['A', 'B', 'A']):
+    ...     t.pack(Parcel(k, 1, 'York', city))
+    True
+    True
+    True
+    >>> f = Fleet()
+    >>> f.add_truck(t)
+    >>> optimize_routes(f, d)
+    (22, 21)
+    >>> t.route
+    ['York', 'A', 'B', 'York']
+    """
+    before = fleet.total_distance_travelled(dmap)
+    for truck in fleet.trucks:
+        if len(truck.route) > 1:
+            _optimize_truck(truck, dmap, time_budget)
+    return before, fleet.total_distance_travelled(dmap)
+
+
+def _optimize_truck(truck: Truck, dmap: DistanceMap,
+                    time_budget: float) -> None:
+    """Reorder the route of <truck> as described in optimize_routes.
+
+    Precondition: <truck> has at least one parcel.
+    """
+    deadline = perf_counter() + time_budget
+    depot = truck.route[0]
+    stops = []
+    seen = {depot}
+    for city in truck.route[1:-1]:
+        if city not in seen:
+            seen.add(city)
+            stops.append(city)
+    if not stops:
+        return
+
+    best = [depot] + stops + [depot]
+    tour = [depot] + _nearest_neighbour(depot, stops, dmap) + [depot]
+    if _cost(tour, dmap) < _cost(best, dmap):
+        best = tour
+    _improve(best, dmap, deadline)
+    if _cost(best, dmap) < _cost(truck.route, dmap):
+        truck.reroute(best[1:-1])
+
+
+def _leg(dmap: DistanceMap, a: City, b: City) -> int:
+    """Return the cost of travelling from <a> to <b> according to <dmap>.
+
+    >>> d = DistanceMap()
+    >>> d.add_distance('York', 'A', 4)
+    >>> _leg(d, 'York', 'A')
+    4
+    >>> _leg(d, 'York', 'B') == MISSING_LEG
+    True
+    """
+    dist = dmap.distance(a, b)
+    return MISSING_LEG if dist < 0 else dist
+
+
+def _cost(route: List[City], dmap: DistanceMap) -> int:
+    """Return the cost of travelling along <route> according to <dmap>.
+    """
+    total = 0
+    for k in range(len(route) - 1):
+        total += _leg(dmap, route[k], route[k + 1])
+    return total
+
+
+def _nearest_neighbour(depot: City, stops: List[City],
+                       dmap: DistanceMap) -> List[City]:
+    """Return <stops> in the order visited by starting at <depot> and always
+    travelling to the nearest stop not visited yet. Ties go to the stop that
+    occurs first in <stops>.
+
+    >>> d = DistanceMap()
+    >>> d.add_distance('York', 'A', 5)
+    >>> d.add_distance('York', 'B', 1)
+    >>> d.add_distance('A', 'B', 2)
+    >>> _nearest_neighbour('York', ['A', 'B'], d)
+    ['B', 'A']
+    """
+    left = stops.copy()
+    order = []
+    here = depot
+    while left:
+        nearest = 0
+        for k in range(1, len(left)):
+            if _leg(dmap, here, left[k]) < _leg(dmap, here, left[nearest]):
+                nearest = k
+        here = left.pop(nearest)
+        order.append(here)
+    return order
+
+
+def _improve(route: List[City], dmap: DistanceMap, deadline: float) -> None:
+    """Mutate <route>, whose first and last cities are its depot, by applying
+    improving 2-opt and Or-opt moves until none is left or the time given by
+    perf_counter() passes <deadline>.
+    """
+    improved = True
+    while improved and perf_counter() < deadline:
+        improved = _two_opt(route, dmap, deadline) \
+            or _or_opt(route, dmap, deadline)
+
+
+def _two_opt(route: List[City], dmap: DistanceMap, deadline: float) -> bool:
+    """Reverse the first segment of the stops of <route> whose reversal makes
+    <route> shorter, and return True, or return False if there is no such
+    segment or the time given by perf_counter() passes <deadline>.
+
+    Distances need not be symmetric, so reversing a segment also changes the
+    cost of the legs inside it.
+
+    >>> d = DistanceMap()
+    >>> for a, b, di in [('Y', 'A', 1), ('Y', 'B', 9), ('Y', 'C', 1),
+    ...                  ('A', 'B', 1), ('A', 'C', 9), ('B', 'C', 1)]:
+    ...     d.add_distance(a, b, di)
+    >>> route = ['Y', 'A', 'C', 'B', 'Y']
+    >>> _two_opt(route, d, perf_counter() + 1)
+    True
+    >>> route
+    ['Y', 'A', 'B', 'C', 'Y']
+    """
+    n = len(route) - 1
+    for i in range(1, n - 1):
+        if perf_counter() > deadline:
+            return False
+        inner = 0
+        for j in range(i + 1, n):
+            inner += _leg(dmap, route[j], route[j - 1]) \
+                - _leg(dmap, route[j - 1], route[j])
+            delta = inner + _leg(dmap, route[i - 1], route[j]) \
+                + _leg(dmap, route[i], route[j + 1]) \
+                - _leg(dmap, route[i - 1], route[i]) \
+                - _leg(dmap, route[j], route[j + 1])
+            if delta < 0:
+                route[i:j + 1] = route[j:i - 1:-1]
+                return True
+    return False
+
+
+def _or_opt(route: List[City], dmap: DistanceMap, deadline: float) -> bool:
+    """Move the first segment of one to three consecutive stops of <route>
+    whose move to another place in <route> makes it shorter, and return True,
+    or return False if there is no such segment or the time given by
+    perf_counter() passes <deadline>.
+
+    >>> d = DistanceMap()
+    >>> for a, b, di in [('Y', 'A', 1), ('Y', 'B', 9), ('Y', 'C', 1),
+    ...                  ('A', 'B', 1), ('A', 'C', 9), ('B', 'C', 1)]:
+    ...     d.add_distance(a, b, di)
+    >>> route = ['Y', 'B', 'A', 'C', 'Y']
+    >>> _or_opt(route, d, perf_counter() + 1)
+    True
+    >>> route
+    ['Y', 'A', 'B', 'C', 'Y']
+    """
+    n = len(route) - 1
+    for size in range(1, 4):
+        for i in range(1, n - size + 1):
+            if perf_counter() > deadline:
+                return False
+            first = route[i]
+            last = route[i + size - 1]
+            gain = _leg(dmap, route[i - 1], first) \
+                + _leg(dmap, last, route[i + size]) \
+                - _leg(dmap, route[i - 1], route[i + size])
+            rest = route[:i] + route[i + size:]
+            for q in range(len(rest) - 1):
+                if q == i - 1:
+                    continue
+                add = _leg(dmap, rest[q], first) \
+                    + _leg(dmap, last, rest[q + 1]) \
+                    - _leg(dmap, rest[q], rest[q + 1])
+                if add < gain:
+                    route[:] = rest[:q + 1] + route[i:i + size] \
+                        + rest[q + 1:]
+                    return True
+    return False
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-import-modules': ['doctest', 'python_ta', 'typing',
+                                   'time', 'distance_map', 'domain'],
+        'disable': ['E1136'],
+        'max-attributes': 15,
+    })
+    import doctest
+    doctest.testmod()
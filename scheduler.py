@@ -3,13 +3,20 @@
 
 This module contains the abstract Scheduler class, as well as the two
 subclasses RandomScheduler and GreedyScheduler, which implement the two
-scheduling algorithms described in the handout.
+scheduling algorithms described in the handout, BinPackingScheduler, which
+implements the best-fit and first-fit decreasing rules of bin packing, and
+ClusterScheduler, which keeps the Parcels for each destination together.
 """
 
-from typing import List, Dict, Union, Callable
-from random import choice
+from typing import Any, List, Dict, Iterable, Iterator, Tuple, Optional, \
+    Union, Callable, Deque
+from bisect import bisect_left, insort
+from collections import deque
+from random import Random
 from container import PriorityQueue
+from distance_map import DistanceMap
 from domain import Parcel, Truck
+from parcel_store import ParcelStore
 
 
 class Scheduler:
@@ -25,6 +32,9 @@ class Scheduler:
         which parcels will go on which trucks, as well as the route each truck
         will take.
 
+        <parcels> may also be a ParcelTable or a ParcelStore, whose Parcels
+        are created as the scheduler needs them.
+
         Mutate the Truck objects in <trucks> so that they store information
         about which parcel objects they will deliver and what route they will
         take.  Do *not* mutate the list <parcels>, or any of the parcel objects
@@ -38,17 +48,76 @@ class Scheduler:
         """
         raise NotImplementedError
 
+    def schedule_more(self, new_parcels: List[Parcel], trucks: List[Truck],
+                      verbose: bool = False) -> List[Parcel]:
+        """Schedule <new_parcels>, which arrived after the parcels already
+        packed onto <trucks>, onto <trucks> by the same rules as schedule,
+        without moving any parcel that is already packed.
+
+        Return a list containing the new parcels that did not get scheduled
+        onto any truck, due to lack of capacity.
+
+        A Scheduler which keeps indexes of the Trucks it last scheduled onto
+        reuses them here, so that the time taken depends on the number of new
+        parcels rather than on the number already packed. Otherwise, this is
+        the same as calling schedule with <new_parcels>.
+
+        Precondition: <trucks> has not been changed since this Scheduler last
+        scheduled onto it, except by this Scheduler, or reset has been called
+        since.
+        """
+        return self.schedule(new_parcels, trucks, verbose)
+
+    def reset(self) -> None:
+        """Forget any indexes this Scheduler keeps of the Trucks it last
+        scheduled onto, so that the next call to schedule_more builds them
+        again from the Trucks as they are then.
+        """
+
 
 class RandomScheduler(Scheduler):
     """A Random Scheduler which randomly chooses Parcels, and for each chosen
     parcel, schedules it to a randomly chosen Truck from among those trucks that
-    have capacity to add that parcel"""
+    have capacity to add that parcel
 
-    def schedule(self, parcels: List[Parcel], trucks: List[Truck],
+    === Private Attributes ===
+    _random: the source of random numbers for this RandomScheduler. Two
+    RandomSchedulers created with the same seed produce the same schedules.
+    _trucks: the list of Trucks this RandomScheduler last scheduled onto, or
+    None if it has not scheduled since it was created or reset.
+    _index: a TruckIndex of <_trucks>, or None if <_trucks> is None.
+    """
+    # Attribute types
+    _random: Random
+    _trucks: Optional[List[Truck]]
+    _index: Optional['TruckIndex']
+
+    def __init__(self, seed: Union[int, Random, None] = None) -> None:
+        """Initialise a new RandomScheduler which draws random numbers from
+        <seed> if it is a Random instance, or from a new Random instance seeded
+        with <seed> otherwise. If <seed> is None, the schedules it produces are
+        not reproducible.
+        """
+        if isinstance(seed, Random):
+            self._random = seed
+        else:
+            self._random = Random(seed)
+        self._trucks = None
+        self._index = None
+
+    def schedule(self, parcels: Iterable[Parcel], trucks: List[Truck],
                  verbose: bool = False) -> List[Parcel]:
         """Schedule the given <parcels> onto the given <trucks> according to
         the rule outlined in the class Docstring.
-        for parcel in parcels:
+
+        The Parcels are shuffled once and then processed in that order, and
+        each Truck is drawn uniformly from the Trucks with enough unused space
+        with the help of a TruckIndex.
+
+        If <parcels> is an iterator, such as a generator reading Parcels from
+        a file, it is consumed once and its Parcels are processed in the order
+        they arrive instead of being shuffled, so that they never all have to
+        be held in memory.
 
         Mutate the Truck objects in <trucks> so that they store information
         about which parcel objects they will deliver and what route they will
@@ -61,24 +130,49 @@ class RandomScheduler(Scheduler):
         the scheduling algorithm as it runs.
         """
 
-        temp = parcels.copy()
+        self.reset()
+        return self.schedule_more(parcels, trucks, verbose)
+
+    def schedule_more(self, new_parcels: Iterable[Parcel], trucks: List[Truck],
+                      verbose: bool = False) -> List[Parcel]:
+        """Schedule <new_parcels> onto <trucks> as schedule does, reusing the
+        TruckIndex of <trucks> if it was the list of Trucks last scheduled
+        onto.
+
+        Precondition: <trucks> has not been changed since this
+        RandomScheduler last scheduled onto it, except by this
+        RandomScheduler, or reset has been called since.
+
+        >>> trucks = [Truck(1, 10, 'Toronto'), Truck(2, 10, 'Toronto')]
+        >>> s = RandomScheduler(0)
+        >>> s.schedule([Parcel(1, 8, 'Toronto', 'York')], trucks)
+        []
+        >>> left = s.schedule_more([Parcel(2, 8, 'Toronto', 'York'),
+        ...                         Parcel(3, 8, 'Toronto', 'York')], trucks)
+        >>> [par.par_id for par in left], [t.unused_space() for t in trucks]
+        ([3], [2, 2])
+        """
+        if iter(new_parcels) is new_parcels:
+            temp = new_parcels
+        else:
+            temp = list(new_parcels)
+            self._random.shuffle(temp)
+        if self._trucks is not trucks or len(self._index) != len(trucks):
+            self._trucks = trucks
+            self._index = TruckIndex(trucks)
+        index = self._index
         huge_par = []
-        for k in range(len(parcels)):
-            parcel = choice(temp)
-            temp.remove(parcel)
-            good_trucks = []
-            for truck in trucks:
-                if truck.sum_vol() + parcel.volume <= truck.capacity:
-                    good_trucks.append(truck)
-            if len(good_trucks) > 0:
-                t = choice(good_trucks)
+        for k, parcel in enumerate(temp):
+            t = index.random_fit(parcel.volume, self._random)
+            if t is not None:
                 t.pack(parcel)
+                index.update(t)
                 if verbose:
                     i = trucks.index(t)
                     print('Parcel' + str(k) + ' packed to Truck' + str(i))
                     b1 = 'Remaining space in Truck' + str(i) + ' after Parcel'
                     b2 = str(k) + ' is packed = '
-                    print(b1 + b2, t.capacity - t.sum_vol())
+                    print(b1 + b2, t.unused_space())
             else:
                 huge_par.append(parcel)
                 if verbose:
@@ -86,6 +180,266 @@ class RandomScheduler(Scheduler):
                     print(c1 + ' to lack of capacity')
         return huge_par
 
+    def reset(self) -> None:
+        """Forget the TruckIndex of the Trucks last scheduled onto.
+        """
+        self._trucks = None
+        self._index = None
+
+
+class TruckIndex:
+    """An index of Trucks ordered by their unused space.
+
+    The index answers "which Truck has the least (or the most) unused space,
+    among those with room for a given volume?" in O(log T) time for T indexed
+    Trucks. Ties are broken in favour of the Truck which occurs first in the
+    list of Trucks the index was built from, so that the answers agree with
+    a linear scan over that list. Entries live in a flat sorted list, so an
+    update also shifts part of that list in memory; this is a single memmove
+    and is much cheaper than a scan over the Trucks.
+
+    A Truck which is packed after it has been indexed must be passed to
+    update before the index is queried again.
+
+    === Private Attributes ===
+    _entries:
+      One (unused space, position, truck) triple per indexed Truck, in
+      increasing order. <position> is the Truck's position in the list of
+      Trucks being scheduled.
+    _keys:
+      Maps id(truck) of every indexed Truck to the (unused space, position)
+      pair it is stored under in <_entries>.
+
+    === Representation Invariants ===
+    - <_entries> is sorted, and no two entries share a position.
+    - <_keys> has exactly one key for every entry of <_entries>.
+    """
+    # Attribute types
+    _entries: List[Tuple[int, int, Truck]]
+    _keys: Dict[int, Tuple[int, int]]
+
+    def __init__(self, trucks: Optional[List[Truck]] = None) -> None:
+        """Initialize a new TruckIndex holding every Truck of <trucks>, or an
+        empty TruckIndex if <trucks> is None.
+
+        >>> index = TruckIndex([Truck(1, 20, 'Toronto'), Truck(2, 10, 'York')])
+        >>> len(index)
+        2
+        """
+        self._entries = []
+        self._keys = {}
+        if trucks is not None:
+            for k in range(len(trucks)):
+                space = trucks[k].unused_space()
+                self._entries.append((space, k, trucks[k]))
+                self._keys[id(trucks[k])] = (space, k)
+            self._entries.sort()
+
+    def __len__(self) -> int:
+        """Return the number of Trucks in this TruckIndex.
+        """
+        return len(self._entries)
+
+    def __contains__(self, truck: Truck) -> bool:
+        """Return True iff <truck> is in this TruckIndex.
+
+        >>> t1 = Truck(1, 20, 'Toronto')
+        >>> t1 in TruckIndex([t1])
+        True
+        >>> t1 in TruckIndex()
+        False
+        """
+        return id(truck) in self._keys
+
+    def add(self, truck: Truck, position: int) -> None:
+        """Add <truck>, the Truck at index <position> of the list of Trucks
+        being scheduled, to this TruckIndex.
+
+        Precondition: <truck> is not in this TruckIndex.
+        """
+        key = (truck.unused_space(), position)
+        self._keys[id(truck)] = key
+        insort(self._entries, (key[0], key[1], truck))
+
+    def remove(self, truck: Truck) -> None:
+        """Remove <truck> from this TruckIndex.
+
+        Precondition: <truck> is in this TruckIndex.
+        """
+        key = self._keys.pop(id(truck))
+        del self._entries[bisect_left(self._entries, key)]
+
+    def update(self, truck: Truck) -> None:
+        """Re-index <truck>, whose unused space may have changed since it was
+        added to this TruckIndex. Do nothing if <truck> is not in this
+        TruckIndex.
+
+        >>> t1 = Truck(1, 20, 'Toronto')
+        >>> t2 = Truck(2, 10, 'Toronto')
+        >>> index = TruckIndex([t1, t2])
+        >>> t1.pack(Parcel(1, 15, 'Toronto', 'Hamilton'))
+        True
+        >>> index.update(t1)
+        >>> index.tightest(1) is t1
+        True
+        """
+        if id(truck) in self._keys:
+            position = self._keys[id(truck)][1]
+            self.remove(truck)
+            self.add(truck, position)
+
+    def tightest(self, volume: int) -> Optional[Truck]:
+        """Return the Truck with the least unused space among the Trucks in
+        this TruckIndex with at least <volume> unused space, or None if there
+        is no such Truck.
+
+        >>> t1 = Truck(1, 20, 'Toronto')
+        >>> t2 = Truck(2, 10, 'Toronto')
+        >>> t3 = Truck(3, 10, 'Toronto')
+        >>> index = TruckIndex([t1, t2, t3])
+        >>> index.tightest(5) is t2
+        True
+        >>> index.tightest(11) is t1
+        True
+        >>> print(index.tightest(21))
+        None
+        """
+        i = bisect_left(self._entries, (volume, -1))
+        if i == len(self._entries):
+            return None
+        return self._entries[i][2]
+
+    def random_fit(self, volume: int, rand: Random) -> Optional[Truck]:
+        """Return a Truck chosen uniformly at random, using <rand>, from the
+        Trucks in this TruckIndex with at least <volume> unused space, or None
+        if there is no such Truck.
+
+        >>> t1 = Truck(1, 10, 'Toronto')
+        >>> t2 = Truck(2, 20, 'Toronto')
+        >>> index = TruckIndex([t1, t2])
+        >>> index.random_fit(15, Random(0)) is t2
+        True
+        >>> print(index.random_fit(21, Random(0)))
+        None
+        """
+        i = bisect_left(self._entries, (volume, -1))
+        if i == len(self._entries):
+            return None
+        return self._entries[rand.randrange(i, len(self._entries))][2]
+
+    def loosest(self, volume: int) -> Optional[Truck]:
+        """Return the Truck with the most unused space among the Trucks in
+        this TruckIndex with at least <volume> unused space, or None if there
+        is no such Truck.
+
+        >>> t1 = Truck(1, 10, 'Toronto')
+        >>> t2 = Truck(2, 20, 'Toronto')
+        >>> t3 = Truck(3, 20, 'Toronto')
+        >>> index = TruckIndex([t1, t2, t3])
+        >>> index.loosest(5) is t2
+        True
+        >>> print(index.loosest(21))
+        None
+        """
+        if len(self._entries) == 0 or self._entries[-1][0] < volume:
+            return None
+        most = self._entries[-1][0]
+        i = bisect_left(self._entries, (most, -1))
+        return self._entries[i][2]
+
+
+class DestinationIndex:
+    """An index of the non-empty Trucks being scheduled by the last stop of
+    their route, that is, the city at route[-2].
+
+    It gives the Trucks for which Truck.very_good_truck may hold for a Parcel
+    by a dictionary lookup on the Parcel's destination, instead of a scan over
+    every Truck.
+
+    A Truck which is packed after it has been indexed must be passed to
+    update before the index is queried again.
+
+    === Private Attributes ===
+    _by_city:
+      Maps a city to a TruckIndex of the non-empty Trucks whose route ends at
+      that city.
+    _last_stop:
+      Maps id(truck) of every Truck being scheduled to the city its route
+      ends at, or None if it is empty.
+    _positions:
+      Maps id(truck) of every Truck being scheduled to its position in the
+      list of Trucks being scheduled.
+
+    === Representation Invariants ===
+    - A Truck is in <_by_city>[c] iff <_last_stop>[id(truck)] == c.
+    """
+    # Attribute types
+    _by_city: Dict[str, TruckIndex]
+    _last_stop: Dict[int, Optional[str]]
+    _positions: Dict[int, int]
+
+    def __init__(self, trucks: List[Truck]) -> None:
+        """Initialize a new DestinationIndex of <trucks>.
+
+        >>> t1 = Truck(1, 20, 'Toronto')
+        >>> t1.pack(Parcel(1, 5, 'Toronto', 'Hamilton'))
+        True
+        >>> index = DestinationIndex([t1, Truck(2, 20, 'Toronto')])
+        >>> t1 in index.trucks_ending_at('Hamilton')
+        True
+        """
+        self._by_city = {}
+        self._last_stop = {}
+        self._positions = {}
+        for k in range(len(trucks)):
+            self._positions[id(trucks[k])] = k
+            self._last_stop[id(trucks[k])] = None
+            self.update(trucks[k])
+
+    def trucks_ending_at(self, city: str) -> Optional[TruckIndex]:
+        """Return a TruckIndex of the non-empty Trucks whose route ends at
+        <city>, or None if there are no such Trucks.
+
+        >>> print(DestinationIndex([]).trucks_ending_at('Hamilton'))
+        None
+        """
+        return self._by_city.get(city)
+
+    def update(self, truck: Truck) -> None:
+        """Re-index <truck>, whose route or unused space may have changed since
+        it was indexed.
+
+        Precondition: <truck> is one of the Trucks being scheduled.
+
+        >>> t1 = Truck(1, 20, 'Toronto')
+        >>> index = DestinationIndex([t1])
+        >>> t1.pack(Parcel(1, 5, 'Toronto', 'Hamilton'))
+        True
+        >>> index.update(t1)
+        >>> t1.pack(Parcel(2, 5, 'Toronto', 'London'))
+        True
+        >>> index.update(t1)
+        >>> print(index.trucks_ending_at('Hamilton'))
+        None
+        >>> t1 in index.trucks_ending_at('London')
+        True
+        """
+        old = self._last_stop[id(truck)]
+        new = truck.route[-2] if len(truck.route) > 1 else None
+        if old == new:
+            if new is not None:
+                self._by_city[new].update(truck)
+            return
+        if old is not None:
+            self._by_city[old].remove(truck)
+            if len(self._by_city[old]) == 0:
+                del self._by_city[old]
+        if new is not None:
+            if new not in self._by_city:
+                self._by_city[new] = TruckIndex()
+            self._by_city[new].add(truck, self._positions[id(truck)])
+        self._last_stop[id(truck)] = new
+
 
 class GreedyScheduler(Scheduler):
     """A Scheduler which processes Parcels one at a time, and picks the "best"
@@ -94,15 +448,33 @@ class GreedyScheduler(Scheduler):
     is "best" for a given Parcel
 
     === Private Attributes ===
-    _par_func: a function written outside any class that plays a role in
-    deciding the order in which Parcels are processed.
-    _truck_func: a function written outside any class that, for a given Parcel,
-    plays a role in deciding the choice of a suitable Truck to deliver the
-    Parcel.
+    _par_func: a function written outside any class that maps a Parcel to
+    the key which decides the order in which Parcels are processed. Parcels
+    with smaller keys are processed first, unless <_par_reverse> is True.
+    _par_reverse: True iff Parcels with larger keys are processed first.
+    _store_order: the field of a ParcelStore, and whether it is ordered from
+    largest to smallest, which gives its Parcels in the same order as
+    <_par_func> and <_par_reverse>.
+    _fit_name: the name of the TruckIndex method which, for a given Parcel,
+    picks a suitable Truck to deliver the Parcel among the candidate Trucks
+    with enough unused space for it. The candidates are the Trucks whose route
+    ends at the Parcel's destination if there are any, and all Trucks
+    otherwise. The method is looked up each time Parcels are scheduled, so
+    that it can be wrapped by the instrument module.
+    _trucks: the list of Trucks this GreedyScheduler last scheduled onto, or
+    None if it has not scheduled since it was created or reset.
+    _index: a TruckIndex of <_trucks>, or None if <_trucks> is None.
+    _dest_index: a DestinationIndex of <_trucks>, or None if <_trucks> is
+    None.
     """
     # Attribute types
-    _par_func: Callable[[Parcel, Parcel], bool]
-    _truck_func: Callable[[List[Truck]], Union[Truck, None]]
+    _par_func: Callable[[Parcel], Any]
+    _par_reverse: bool
+    _store_order: Tuple[str, bool]
+    _fit_name: str
+    _trucks: Optional[List[Truck]]
+    _index: Optional[TruckIndex]
+    _dest_index: Optional[DestinationIndex]
 
     def __init__(self, config: Dict) -> None:
         """Initialises a new GreedyScheduler
@@ -110,18 +482,20 @@ class GreedyScheduler(Scheduler):
         a = config['parcel_priority']
         b = config['parcel_order']
         c = config['truck_order']
-        if a == 'destination' and b == 'non-decreasing':
-            self._par_func = _dest_non_dec
-        if a == 'destination' and b == 'non-increasing':
-            self._par_func = _dest_non_inc
+        self._par_reverse = False
+        self._store_order = (a, b == 'non-increasing')
+        if a == 'destination':
+            self._par_func = _dest_key
+            self._par_reverse = b == 'non-increasing'
         if a == 'volume' and b == 'non-decreasing':
-            self._par_func = _vol_non_dec
+            self._par_func = _vol_key
         if a == 'volume' and b == 'non-increasing':
-            self._par_func = _vol_non_inc
+            self._par_func = _neg_vol_key
         if c == 'non-decreasing':
-            self._truck_func = _truck_non_dec
+            self._fit_name = 'tightest'
         if c == 'non-increasing':
-            self._truck_func = _truck_non_inc
+            self._fit_name = 'loosest'
+        self.reset()
 
     def schedule(self, parcels: List[Parcel], trucks: List[Truck],
                  verbose: bool = False) -> List[Parcel]:
@@ -141,148 +515,564 @@ class GreedyScheduler(Scheduler):
         If <verbose> is True, print step-by-step details regarding
         the scheduling algorithm as it runs.
         """
+        self.reset()
+        return self.schedule_more(parcels, trucks, verbose)
+
+    def schedule_more(self, new_parcels: List[Parcel], trucks: List[Truck],
+                      verbose: bool = False) -> List[Parcel]:
+        """Schedule <new_parcels> onto <trucks> as schedule does, in order of
+        priority among <new_parcels> only, reusing the indexes of <trucks> if
+        it was the list of Trucks last scheduled onto.
+
+        Precondition: <trucks> has not been changed since this
+        GreedyScheduler last scheduled onto it, except by this
+        GreedyScheduler, or reset has been called since.
+
+        >>> s = GreedyScheduler({'parcel_priority': 'volume',
+        ...                      'parcel_order': 'non-increasing',
+        ...                      'truck_order': 'non-decreasing'})
+        >>> trucks = [Truck(1, 10, 'Toronto'), Truck(2, 20, 'Toronto')]
+        >>> s.schedule([Parcel(1, 8, 'Toronto', 'York')], trucks)
+        []
+        >>> s.schedule_more([Parcel(2, 2, 'Toronto', 'York')], trucks)
+        []
+        >>> [len(t.all_parcels) for t in trucks]
+        [2, 0]
+        """
         if len(trucks) == 0:
             return []
 
-        pq = PriorityQueue(self._par_func)
+        if isinstance(new_parcels, ParcelStore):
+            return self._schedule_in_order(
+                new_parcels.ordered(*self._store_order), trucks, verbose)
+        pq = PriorityQueue(key=self._par_func, reverse=self._par_reverse,
+                           items=new_parcels)
+        return self._schedule_in_order(_drain(pq), trucks, verbose)
+
+    def reset(self) -> None:
+        """Forget the indexes of the Trucks last scheduled onto.
+        """
+        self._trucks = None
+        self._index = None
+        self._dest_index = None
+
+    def _schedule_in_order(self, parcels: Iterable[Parcel], trucks: List[Truck],
+                           verbose: bool) -> List[Parcel]:
+        """Schedule <parcels> onto <trucks> in the order they are given, using
+        the rule for choosing a Truck that this GreedyScheduler was created
+        with. Return a list of the parcels that were not scheduled.
+
+        The indexes of <trucks> are reused if it was the list of Trucks last
+        scheduled onto, and built otherwise.
+
+        If <verbose> is True, print step-by-step details regarding
+        the scheduling algorithm as it runs.
+        """
+        if self._trucks is not trucks or len(self._index) != len(trucks):
+            self._trucks = trucks
+            self._index = TruckIndex(trucks)
+            self._dest_index = DestinationIndex(trucks)
+        index = self._index
+        dest_index = self._dest_index
+        fit = getattr(TruckIndex, self._fit_name)
         huge_par = []
-        for parcel in parcels:
-            pq.add(parcel)
-        while not pq.is_empty():
-            par = pq.remove()
-            good_trucks = []
-            v_good_trucks = []
-            for truck in trucks:
-                if truck.sum_vol() + par.volume <= truck.capacity:
-                    good_trucks.append(truck)
-                    truck.very_good_truck(v_good_trucks, par)
-            if len(v_good_trucks) > 0:
-                good_trucks = v_good_trucks
-            if len(good_trucks) > 0:
-                a = self._truck_func(good_trucks)
+        for par in parcels:
+            a = None
+            v_good_trucks = dest_index.trucks_ending_at(par.destination)
+            if v_good_trucks is not None:
+                a = fit(v_good_trucks, par.volume)
+            if a is None:
+                a = fit(index, par.volume)
+            if a is not None:
                 if verbose:
                     b1 = 'Parcel with volume ' + str(par.volume)
-                    b1 += ' and destination ' + par.destination + ' packed to '
-                    b1 += 'Truck having unused volume equal to '
-                    print(b1, a.capacity - a.sum_vol())
+                    b1 += ' and destination ' + str(par.destination)
+                    b1 += ' packed to Truck having unused volume equal to '
+                    print(b1, a.unused_space())
                 a.pack(par)
+                index.update(a)
+                dest_index.update(a)
                 if verbose:
                     c1 = 'Remaining space in this Truck after the above parcel'
-                    print(c1 + ' is packed = ', a.capacity - a.sum_vol())
+                    print(c1 + ' is packed = ', a.unused_space())
 
             else:
                 huge_par.append(par)
                 if verbose:
                     d1 = 'Unable to pack Parcel with volume ' + str(par.volume)
-                    d1 += ' and destination ' + par.destination
+                    d1 += ' and destination ' + str(par.destination)
                     print(d1 + ' to any truck due to lack of capacity.')
 
         return huge_par
 
 
-def _dest_non_dec(parcel_a: Parcel, parcel_b: Parcel) -> bool:
-    """Return True if <parcel_a> has a smaller destination (we compare strings)
-    than <parcel_b>, False <parcel_a> has a larger destination than <parcel_b>.
+class OnlineGreedyScheduler(GreedyScheduler):
+    """A GreedyScheduler which processes Parcels in the order they arrive,
+    rather than in order of priority, so that it can schedule Parcels as they
+    are read instead of after all of them have been read.
 
-    >>> p1 = Parcel(1, 10, 'Toronto', 'Hamilton')
-    >>> p2 = Parcel(2, 5, 'London', 'Vancouver')
-    >>> _dest_non_dec(p1, p2)
-    True
+    Its 'parcel_priority' and 'parcel_order' configuration is ignored; its
+    'truck_order' is used as in a GreedyScheduler.
     """
-    return parcel_a.destination < parcel_b.destination
 
+    def schedule(self, parcels: Iterable[Parcel], trucks: List[Truck],
+                 verbose: bool = False) -> List[Parcel]:
+        """Schedule the given <parcels> onto the given <trucks>, in the order
+        in which <parcels> produces them. <parcels> may be an iterator, which
+        is consumed once; no more than one Parcel of it is held at a time,
+        except for those returned as unscheduled.
 
-def _dest_non_inc(parcel_a: Parcel, parcel_b: Parcel) -> bool:
-    """Return True if <parcel_a> has a larger destination (we compare strings)
-    than <parcel_b>, False <parcel_a> has a smaller destination than <parcel_b>.
+        Mutate the Truck objects in <trucks> so that they store information
+        about which parcel objects they will deliver and what route they will
+        take.
 
-    >>> p1 = Parcel(1, 10, 'Toronto', 'Hamilton')
-    >>> p2 = Parcel(2, 5, 'London', 'Vancouver')
-    >>> _dest_non_inc(p1, p2)
-    False
+        Return a list containing the parcels that did not get scheduled onto any
+        truck, due to lack of capacity.
+
+        If <verbose> is True, print step-by-step details regarding
+        the scheduling algorithm as it runs.
+        """
+        self.reset()
+        return self._schedule_in_order(parcels, trucks, verbose)
+
+    def schedule_more(self, new_parcels: Iterable[Parcel],
+                      trucks: List[Truck],
+                      verbose: bool = False) -> List[Parcel]:
+        """Schedule <new_parcels> onto <trucks> as schedule does, in the
+        order they arrive, reusing the indexes of <trucks> if it was the list
+        of Trucks last scheduled onto.
+
+        Precondition: <trucks> has not been changed since this
+        OnlineGreedyScheduler last scheduled onto it, except by this
+        OnlineGreedyScheduler, or reset has been called since.
+        """
+        return self._schedule_in_order(new_parcels, trucks, verbose)
+
+
+class CapacityTree:
+    """A segment tree over the unused space of a list of Trucks, which finds
+    the first Truck in the list with room for a given volume in O(log T) time
+    for T Trucks.
+
+    A Truck which is packed after the tree is built must be passed to update
+    before the tree is queried again.
+
+    === Private Attributes ===
+    _size:
+      The number of leaves of the tree, which is the least power of 2 that is
+      at least the number of Trucks.
+    _space:
+      The nodes of the tree, with the root at index 1 and the children of
+      node i at indices 2 * i and 2 * i + 1. Leaf <_size> + k holds the
+      unused space of the Truck at position k, or -1 if there is no such
+      Truck, and every other node holds the larger value of its children.
+
+    === Representation Invariants ===
+    - len(_space) == 2 * _size
     """
-    return parcel_a.destination > parcel_b.destination
+    # Attribute types
+    _size: int
+    _space: List[int]
 
+    def __init__(self, trucks: List[Truck]) -> None:
+        """Initialize a new CapacityTree over the unused space of <trucks>.
+        """
+        self._size = 1
+        while self._size < len(trucks):
+            self._size *= 2
+        self._space = [-1] * (2 * self._size)
+        for k in range(len(trucks)):
+            self._space[self._size + k] = trucks[k].unused_space()
+        for i in range(self._size - 1, 0, -1):
+            self._space[i] = max(self._space[2 * i], self._space[2 * i + 1])
 
-def _vol_non_dec(parcel_a: Parcel, parcel_b: Parcel) -> bool:
-    """Return True if <parcel_a> has a smaller volume than <parcel_b>,
-    False <parcel_a> has a larger volume than <parcel_b>.
+    def first_fit(self, volume: int) -> Optional[int]:
+        """Return the lowest position of a Truck with at least <volume> unused
+        space, or None if there is no such Truck.
 
-    >>> p1 = Parcel(1, 10, 'Toronto', 'Hamilton')
-    >>> p2 = Parcel(2, 5, 'London', 'Vancouver')
-    >>> _vol_non_dec(p1, p2)
-    False
+        >>> tree = CapacityTree([Truck(1, 10, 'Toronto'),
+        ...                      Truck(2, 30, 'Toronto'),
+        ...                      Truck(3, 20, 'Toronto')])
+        >>> tree.first_fit(15), tree.first_fit(5)
+        (1, 0)
+        >>> print(tree.first_fit(31))
+        None
+        """
+        if self._space[1] < volume:
+            return None
+        i = 1
+        while i < self._size:
+            i *= 2
+            if self._space[i] < volume:
+                i += 1
+        return i - self._size
+
+    def update(self, position: int, truck: Truck) -> None:
+        """Record the unused space of <truck>, the Truck at <position>, which
+        may have changed since it was recorded.
+
+        >>> t1 = Truck(1, 10, 'Toronto')
+        >>> tree = CapacityTree([t1, Truck(2, 5, 'Toronto')])
+        >>> t1.pack(Parcel(1, 8, 'Toronto', 'Hamilton'))
+        True
+        >>> tree.update(0, t1)
+        >>> tree.first_fit(3)
+        1
+        """
+        i = self._size + position
+        self._space[i] = truck.unused_space()
+        i //= 2
+        while i >= 1:
+            self._space[i] = max(self._space[2 * i], self._space[2 * i + 1])
+            i //= 2
+
+
+class BinPackingScheduler(Scheduler):
+    """A Scheduler which treats Trucks as bins and packs Parcels in order of
+    non-increasing volume, using either the best-fit decreasing or the
+    first-fit decreasing rule of bin packing.
+
+    Best fit puts each Parcel on the Truck with the least unused space that
+    can hold it, and first fit puts it on the first Truck in the list of
+    Trucks that can hold it. Either way, scheduling P Parcels onto T Trucks
+    takes O(P log P + P log T) time.
+
+    === Private Attributes ===
+    _first_fit: True iff this BinPackingScheduler uses first fit rather than
+    best fit.
+    """
+    # Attribute types
+    _first_fit: bool
+
+    def __init__(self, config: Dict) -> None:
+        """Initialise a new BinPackingScheduler, which uses first fit if
+        <config>['algorithm'] is 'first-fit', and best fit otherwise.
+        """
+        self._first_fit = config['algorithm'] == 'first-fit'
+
+    def schedule(self, parcels: Iterable[Parcel], trucks: List[Truck],
+                 verbose: bool = False) -> List[Parcel]:
+        """Schedule the given <parcels> onto the given <trucks> according to
+        the rule outlined in the class Docstring. Parcels of equal volume are
+        processed in the order they are given.
+
+        Mutate the Truck objects in <trucks> so that they store information
+        about which parcel objects they will deliver and what route they will
+        take.  Do *not* mutate the list <parcels>, or any of the parcel objects
+        in that list.
+
+        Return a list containing the parcels that did not get scheduled onto any
+        truck, due to lack of capacity.
+
+        If <verbose> is True, print step-by-step details regarding
+        the scheduling algorithm as it runs.
+
+        >>> trucks = [Truck(1, 10, 'Toronto'), Truck(2, 7, 'Toronto')]
+        >>> parcels = [Parcel(1, 3, 'Toronto', 'Hamilton'),
+        ...            Parcel(2, 6, 'Toronto', 'London'),
+        ...            Parcel(3, 4, 'Toronto', 'Guelph')]
+        >>> BinPackingScheduler({'algorithm': 'best-fit'}).schedule(parcels,
+        ...                                                        trucks)
+        []
+        >>> [[p.par_id for p in t.all_parcels] for t in trucks]
+        [[3, 1], [2]]
+        """
+        if self._first_fit:
+            tree = CapacityTree(trucks)
+        else:
+            index = TruckIndex(trucks)
+        huge_par = []
+        for par in sorted(parcels, key=_neg_vol_key):
+            if self._first_fit:
+                k = tree.first_fit(par.volume)
+                a = None if k is None else trucks[k]
+            else:
+                a = index.tightest(par.volume)
+            if a is None:
+                huge_par.append(par)
+                if verbose:
+                    d1 = 'Unable to pack Parcel with volume ' + str(par.volume)
+                    print(d1 + ' to any truck due to lack of capacity.')
+                continue
+
+            a.pack(par)
+            if self._first_fit:
+                tree.update(k, a)
+            else:
+                index.update(a)
+            if verbose:
+                b1 = 'Parcel with volume ' + str(par.volume)
+                print(b1 + ' packed to Truck ' + str(a.truck_id)
+                      + ', whose remaining space is', a.unused_space())
+        return huge_par
+
+
+class ClusterScheduler(Scheduler):
+    """A Scheduler which packs the Parcels going to the same destination onto
+    as few Trucks as it can, so that each Truck visits few cities.
+
+    Parcels are grouped into clusters by destination. If the ClusterScheduler
+    has a DistanceMap, the clusters are processed in order of non-increasing
+    distance from the depot to their destination, so that the farthest
+    destinations get the largest Trucks and are visited by the fewest Trucks.
+    Otherwise, or between destinations at the same distance, they are
+    processed in order of non-increasing total volume.
+
+    A whole cluster goes on the empty Truck with the least unused space that
+    can hold it, or, if no empty Truck can, on the Truck with the least unused
+    space that can. Only when no Truck can hold the whole cluster is it
+    split: a Truck is filled with the cluster's Parcels, largest first, and
+    the rest of the cluster is placed in the same way. The Truck filled is the
+    empty Truck with the most unused space, if it can hold the cluster's
+    largest Parcel, or else the Truck with the least unused space that can
+    hold its smallest Parcel.
+
+    Grouping takes a single pass over the Parcels, and sorting the distinct
+    volumes of a cluster takes O(V log V) time for V distinct volumes. Each
+    Parcel is then placed in O(log T + log V) time for T Trucks, except that
+    taking the last Parcel of a volume removes that volume from a list in
+    O(V) time.
+
+    === Private Attributes ===
+    _dmap: the distances used to order the clusters, or None if they are
+      ordered by total volume only.
+    """
+    # Attribute types
+    _dmap: Optional[DistanceMap]
+
+    def __init__(self, dmap: Optional[DistanceMap] = None) -> None:
+        """Initialize a new ClusterScheduler, which orders the clusters by
+        their distance from the depot in <dmap> if it is not None.
+        """
+        self._dmap = dmap
+
+    def schedule(self, parcels: Iterable[Parcel], trucks: List[Truck],
+                 verbose: bool = False) -> List[Parcel]:
+        """Schedule the given <parcels> onto the given <trucks> according to
+        the rule outlined in the class Docstring.
+
+        Mutate the Truck objects in <trucks> so that they store information
+        about which parcel objects they will deliver and what route they will
+        take.  Do *not* mutate the list <parcels>, or any of the parcel objects
+        in that list.
+
+        Return a list containing the parcels that did not get scheduled onto any
+        truck, due to lack of capacity.
+
+        If <verbose> is True, print step-by-step details regarding
+        the scheduling algorithm as it runs.
+
+        >>> trucks = [Truck(1, 10, 'Toronto'), Truck(2, 8, 'Toronto')]
+        >>> parcels = [Parcel(1, 3, 'Toronto', 'Hamilton'),
+        ...            Parcel(2, 3, 'Toronto', 'London'),
+        ...            Parcel(3, 4, 'Toronto', 'Hamilton')]
+        >>> ClusterScheduler().schedule(parcels, trucks)
+        []
+        >>> [t.route for t in trucks]
+        [['Toronto', 'London', 'Toronto'], ['Toronto', 'Hamilton', 'Toronto']]
+        """
+        clusters = {}
+        for par in parcels:
+            if par.destination not in clusters:
+                clusters[par.destination] = _Cluster()
+            clusters[par.destination].add(par)
+
+        index = TruckIndex(trucks)
+        empty = TruckIndex()
+        for k in range(len(trucks)):
+            if len(trucks[k].all_parcels) == 0:
+                empty.add(trucks[k], k)
+        huge_par = []
+        for dest in self._order(clusters, trucks):
+            cluster = clusters[dest]
+            while len(cluster) > 0:
+                a = empty.tightest(cluster.total)
+                if a is None:
+                    a = index.tightest(cluster.total)
+                if a is None:
+                    a = empty.loosest(cluster.largest())
+                if a is None:
+                    a = index.tightest(cluster.smallest())
+                if a is None:
+                    huge_par.extend(cluster.take_all())
+                    if verbose:
+                        print('Unable to pack the remaining Parcels with '
+                              'destination ' + str(dest)
+                              + ' to any truck due to lack of capacity.')
+                    break
+
+                par = cluster.take_largest(a.unused_space())
+                while par is not None:
+                    a.pack(par)
+                    par = cluster.take_largest(a.unused_space())
+                if verbose:
+                    print('Parcels with destination ' + str(dest)
+                          + ' packed to Truck ' + str(a.truck_id)
+                          + ', whose remaining space is', a.unused_space())
+                index.update(a)
+                if a in empty:
+                    empty.remove(a)
+        return huge_par
+
+    def _order(self, clusters: Dict[str, '_Cluster'],
+               trucks: List[Truck]) -> List[str]:
+        """Return the destinations of <clusters> in the order in which their
+        clusters are placed onto <trucks>, as outlined in the class
+        Docstring.
+        """
+        if self._dmap is None or len(trucks) == 0:
+            return sorted(clusters, key=lambda d: -clusters[d].total)
+        depot = trucks[0].route[0]
+        distance = self._dmap.distance
+        return sorted(clusters, key=lambda d: (-distance(depot, d),
+                                               -clusters[d].total))
+
+
+class _Cluster:
+    """The Parcels going to one destination which have not been scheduled
+    yet, bucketed by volume so that the largest Parcel that fits in a given
+    space is found in O(log V) time for V distinct volumes.
+
+    === Public Attributes ===
+    total: the total volume of the Parcels in this cluster.
+
+    === Private Attributes ===
+    _volumes: the distinct volumes of the Parcels in this cluster, in
+    increasing order, or None if they have not been sorted since a volume
+    was added.
+    _buckets: maps each volume of a Parcel in this cluster to the Parcels
+    with that volume, in the order they were added.
     """
-    return parcel_a.volume < parcel_b.volume
+    # Attribute types
+    total: int
+    _volumes: Optional[List[int]]
+    _buckets: Dict[int, Deque[Parcel]]
 
+    def __init__(self) -> None:
+        """Initialize a new empty cluster.
+        """
+        self.total = 0
+        self._volumes = []
+        self._buckets = {}
+
+    def __len__(self) -> int:
+        """Return the number of distinct volumes in this cluster, which is 0
+        iff it has no Parcels.
+        """
+        return len(self._buckets)
+
+    def add(self, par: Parcel) -> None:
+        """Add <par> to this cluster.
+        """
+        self.total += par.volume
+        if par.volume in self._buckets:
+            self._buckets[par.volume].append(par)
+        else:
+            self._buckets[par.volume] = deque([par])
+            self._volumes = None
+
+    def largest(self) -> int:
+        """Return the largest volume of a Parcel in this cluster.
+
+        Precondition: this cluster has at least one Parcel.
+        """
+        return self._sorted_volumes()[-1]
 
-def _vol_non_inc(parcel_a: Parcel, parcel_b: Parcel) -> bool:
-    """Return True if <parcel_a> has a larger volume than <parcel_b>,
-    False if <parcel_a> has a smaller volume than <parcel_b>.
+    def smallest(self) -> int:
+        """Return the smallest volume of a Parcel in this cluster.
+
+        Precondition: this cluster has at least one Parcel.
+        """
+        return self._sorted_volumes()[0]
+
+    def take_largest(self, space: int) -> Optional[Parcel]:
+        """Remove and return the largest Parcel in this cluster whose volume
+        is at most <space>, or None if there is no such Parcel. Of several
+        such Parcels, the one added first is returned.
+
+        >>> c = _Cluster()
+        >>> for k, volume in enumerate([3, 5, 5, 9]):
+        ...     c.add(Parcel(k, volume, 'Toronto', 'Hamilton'))
+        >>> [c.take_largest(8).par_id, c.take_largest(8).par_id, c.total]
+        [1, 2, 12]
+        >>> print(c.take_largest(2))
+        None
+        """
+        volumes = self._sorted_volumes()
+        i = bisect_left(volumes, space + 1)
+        if i == 0:
+            return None
+        volume = volumes[i - 1]
+        bucket = self._buckets[volume]
+        par = bucket.popleft()
+        if len(bucket) == 0:
+            del self._buckets[volume]
+            del volumes[i - 1]
+        self.total -= volume
+        return par
+
+    def take_all(self) -> List[Parcel]:
+        """Remove and return every Parcel in this cluster, largest first.
+        """
+        pars = []
+        for volume in reversed(self._sorted_volumes()):
+            pars.extend(self._buckets[volume])
+        self.total = 0
+        self._volumes = []
+        self._buckets = {}
+        return pars
+
+    def _sorted_volumes(self) -> List[int]:
+        """Return the distinct volumes of the Parcels in this cluster, in
+        increasing order, sorting them if a volume was added since they were
+        last sorted.
+        """
+        if self._volumes is None:
+            self._volumes = sorted(self._buckets)
+        return self._volumes
+
+
+def _drain(pq: PriorityQueue) -> Iterator[Any]:
+    """Remove and yield the items of <pq> until it is empty.
+
+    >>> list(_drain(PriorityQueue(key=len, items=['fred', 'hat'])))
+    ['hat', 'fred']
+    """
+    while not pq.is_empty():
+        yield pq.remove()
+
+
+def _dest_key(parcel: Parcel) -> str:
+    """Return the key which orders Parcels by destination (we compare strings).
 
     >>> p1 = Parcel(1, 10, 'Toronto', 'Hamilton')
     >>> p2 = Parcel(2, 5, 'London', 'Vancouver')
-    >>> _vol_non_inc(p1, p2)
+    >>> _dest_key(p1) < _dest_key(p2)
     True
     """
-    return parcel_a.volume > parcel_b.volume
+    return parcel.destination
 
 
-def _truck_non_dec(spl_list: List[Truck]) -> Union[Truck, None]:
-    """Return None if <spl_list> is empty. If <spl_list> is non empty, return
-    that Truck of <spl_list> which has the least available space. If there is a
-    tie for such a truck, return the Truck which occurs the first in
-    <spl_list>.
+def _vol_key(parcel: Parcel) -> int:
+    """Return the key which orders Parcels by non-decreasing volume.
 
-    >>> t1 = Truck(100, 20, 'Toronto')
-    >>> t2 = Truck(200, 10, 'Toronto')
-    >>> p1= Parcel(1, 11, 'Toronto', 'Hamilton')
-    >>> t1.pack(p1)
-    True
-    >>> li = [t1, t2]
-    >>> _truck_non_dec(li).capacity == 20
-    True
-    >>> _truck_non_dec(li).capacity - _truck_non_dec(li).sum_vol() == 9
-    True
+    >>> p1 = Parcel(1, 10, 'Toronto', 'Hamilton')
+    >>> p2 = Parcel(2, 5, 'London', 'Vancouver')
+    >>> _vol_key(p1) < _vol_key(p2)
+    False
     """
-    if len(spl_list) == 0:
-        return None
-    a = spl_list[0]
-    for truck in spl_list:
-        a_comp = a.capacity - a.sum_vol()
-        truck_comp = truck.capacity - truck.sum_vol()
-        if truck_comp < a_comp:
-            a = truck
-    return a
-
-
-def _truck_non_inc(spl_list: List[Truck]) -> Union[Truck, None]:
-    """Return None if <spl_list> is empty. If <spl_list> is non empty, return
-    that Truck of <spl_list> which has the most available space. If there is a
-    tie for such a truck, return the Truck which occurs the first in
-    <spl_list>.
-
-    >>> t1 = Truck(100, 20, 'Toronto')
-    >>> t2 = Truck(200, 10, 'Toronto')
-    >>> p1= Parcel(1, 11, 'Toronto', 'Hamilton')
-    >>> t1.pack(p1)
-    True
-    >>> li = [t1, t2]
-    >>> _truck_non_inc(li).capacity == 10
-    True
-    >>> _truck_non_inc(li).sum_vol() == 0
+    return parcel.volume
+
+
+def _neg_vol_key(parcel: Parcel) -> int:
+    """Return the key which orders Parcels by non-increasing volume.
+
+    >>> p1 = Parcel(1, 10, 'Toronto', 'Hamilton')
+    >>> p2 = Parcel(2, 5, 'London', 'Vancouver')
+    >>> _neg_vol_key(p1) < _neg_vol_key(p2)
     True
     """
-    if len(spl_list) == 0:
-        return None
-    a = spl_list[0]
-    for truck in spl_list:
-        a_comp = a.capacity - a.sum_vol()
-        truck_comp = truck.capacity - truck.sum_vol()
-        if truck_comp > a_comp:
-            a = truck
-
-    return a
+    return -parcel.volume
 
 
 if __name__ == '__main__':
@@ -293,7 +1083,9 @@ if __name__ == '__main__':
     python_ta.check_all(config={
         'allowed-io': ['compare_algorithms'],
         'allowed-import-modules': ['doctest', 'python_ta', 'typing',
-                                   'random', 'container', 'domain'],
+                                   'random', 'container', 'domain',
+                                   'bisect', 'collections', 'distance_map',
+                                   'parcel_store'],
         'disable': ['E1136'],
         'max-attributes': 15,
     })
@@ -4,13 +4,27 @@
 This module contains test cases to test the code.
 """
 
+import gzip
+import json
+import pathlib
+import pstats
+import random
 import pytest
 from typing import Dict
+import domain
 from distance_map import DistanceMap
-from domain import Truck, Parcel, Fleet
-from scheduler import GreedyScheduler
+from domain import Truck, Parcel, Fleet, ParcelTable, load_fleet
+from scheduler import GreedyScheduler, OnlineGreedyScheduler, \
+    RandomScheduler, TruckIndex, BinPackingScheduler, ClusterScheduler
 from container import PriorityQueue, _shorter
-from experiment import SchedulingExperiment
+from routing import optimize_routes
+from local_search import improve_schedule
+from multistart import MultiStartScheduler
+from generator import generate, city_names
+from experiment import SchedulingExperiment, read_parcels, \
+    read_parcel_table, read_trucks, read_distance_map, convert_parcels
+from parcel_store import ParcelStore
+import explore
 
 # This variable is used in the special pytest test case defined by function
 # test_experiment below.  The variable defines a single scheduling experiment
@@ -53,6 +67,24 @@ def test_distance_map_basic() -> None:
     assert m.distance('Montreal', 'Toronto') == 4
 
 
+def test_distance_map_city_ids() -> None:
+    """Test that DistanceMap gives the same distances by city id as by name,
+    before and after the id array is built."""
+    m = DistanceMap()
+    m.add_distance('Montreal', 'Toronto', 4, 5)
+    montreal = m.city_id('Montreal')
+    toronto = m.city_id('Toronto')
+    york = m.city_id('York')
+    assert m.distance(montreal, toronto) == 4
+    assert m.distance(toronto, montreal) == 5
+    assert m.distance(montreal, york) == -1
+    m.add_distance('Montreal', 'York', 7)
+    assert m.distance(york, montreal) == m.distance('York', 'Montreal') == 7
+    m.add_distance('Ottawa', 'York', 2)
+    assert m.distance(m.city_id('Ottawa'), york) == 2
+    assert m.distance(toronto, toronto) == -1
+
+
 def test_num_trucks_doctest() -> None:
     """Test the doctest provided for Fleet.num_trucks"""
     f = Fleet()
@@ -161,6 +193,183 @@ def test_average_distance_travelled_doctest() -> None:
     assert f.average_distance_travelled(m) == 18.0
 
 
+def test_fleet_stats_matches_methods() -> None:
+    """Test that Fleet.stats agrees with the Fleet methods it replaces."""
+    f = Fleet()
+    m = DistanceMap()
+    cities = ['Toronto', 'Hamilton', 'London', 'Guelph']
+    for k in range(len(cities) - 1):
+        m.add_distance(cities[k], cities[k + 1], 10 + k)
+        m.add_distance(cities[k], cities[-1], 20 + k)
+    for k in range(8):
+        t = Truck(k, 10 + k, 'Toronto')
+        for j in range(k % 3):
+            t.pack(Parcel(10 * k + j, 3 + j, 'Toronto', cities[j + 1]))
+        f.add_truck(t)
+    s = f.stats(m)
+    assert s['num_trucks'] == f.num_trucks()
+    assert s['num_nonempty_trucks'] == f.num_nonempty_trucks()
+    assert s['total_unused_space'] == f.total_unused_space()
+    assert s['average_fullness'] == f.average_fullness()
+    assert s['total_distance'] == f.total_distance_travelled(m)
+    assert s['average_distance'] == f.average_distance_travelled(m)
+
+
+def test_route_distance_cache_invalidation() -> None:
+    """Test that a Truck's cached route distance follows changes to its route
+    and to the DistanceMap."""
+    m = DistanceMap()
+    m.add_distance('Toronto', 'Hamilton', 9)
+    m.add_distance('Toronto', 'London', 20)
+    m.add_distance('Hamilton', 'London', 15)
+    t = Truck(1423, 10, 'Toronto')
+    t.pack(Parcel(1, 5, 'Toronto', 'Hamilton'))
+    assert t.distance(m) == 18
+    assert t.distance(m) == 18
+    t.pack(Parcel(2, 1, 'Toronto', 'London'))
+    assert t.distance(m) == 44
+    m.add_distance('Hamilton', 'London', 5)
+    assert t.distance(m) == 34
+    t.reroute(['London', 'Hamilton'])
+    assert t.distance(m) == 34
+    other = DistanceMap()
+    other.add_distance('Toronto', 'Hamilton', 1)
+    other.add_distance('Toronto', 'London', 1)
+    other.add_distance('Hamilton', 'London', 1)
+    assert t.distance(other) == 3
+    assert t.distance(m) == 34
+
+
+def test_shortest_paths_and_cache(tmp_path: pathlib.Path) -> None:
+    """Test that precomputed shortest paths fill in missing distances, and
+    that the cache file is only reused for the same distances."""
+    m = DistanceMap()
+    m.add_distance('Toronto', 'Hamilton', 9)
+    m.add_distance('Hamilton', 'London', 15, 16)
+    m.add_distance('Ottawa', 'Kingston', 2)
+    cache = str(tmp_path / 'paths.bin')
+    m.precompute_shortest_paths(cache)
+    assert m.distance('Toronto', 'London') == 24
+    assert m.distance('London', 'Toronto') == 25
+    assert m.distance('Toronto', 'Ottawa') == -1
+    t = Truck(1423, 10, 'Toronto')
+    t.pack(Parcel(1, 5, 'Toronto', 'London'))
+    assert t.distance(m) == 49
+
+    m2 = DistanceMap()
+    m2.add_distance('Toronto', 'Hamilton', 9)
+    m2.add_distance('Hamilton', 'London', 15, 16)
+    m2.add_distance('Ottawa', 'Kingston', 2)
+    m2.precompute_shortest_paths(cache)
+    assert m2.distance('London', 'Toronto') == 25
+    m2.add_distance('Toronto', 'London', 20)
+    m2.precompute_shortest_paths(cache)
+    assert m2.distance('Toronto', 'London') == 20
+    assert m2.distance('London', 'Toronto') == 20
+
+
+def test_truck_load_check(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that Truck.sum_vol keeps a running load, and that CHECK_LOAD
+    catches a load which no longer matches the Truck's parcels."""
+    monkeypatch.setattr(domain, 'CHECK_LOAD', True)
+    t = Truck(1423, 10, 'Toronto')
+    assert t.pack(Parcel(1, 5, 'Buffalo', 'Hamilton')) is True
+    assert t.pack(Parcel(2, 4, 'Toronto', 'Montreal')) is True
+    assert t.sum_vol() == 9
+    assert t.unused_space() == 1
+    t.all_parcels.append(Parcel(3, 1, 'Toronto', 'Montreal'))
+    with pytest.raises(AssertionError):
+        t.sum_vol()
+
+
+def test_pack_rejects_duplicate_parcel_id() -> None:
+    """Test that a truck refuses a second parcel with an id it already holds,
+    so that unpacking afterwards leaves its load, parcels and route in
+    agreement, and that a fleet refuses an id packed onto two trucks and
+    keeps its index of parcel ids up to date."""
+    t = Truck(1, 20, 'A')
+    assert t.pack(Parcel(1, 5, 'A', 'B')) is True
+    with pytest.raises(ValueError):
+        t.pack(Parcel(1, 7, 'A', 'C'))
+    assert t.pack(Parcel(2, 3, 'A', 'D')) is True
+    assert t.unpack(2).volume == 3
+    assert t.sum_vol() == 5
+    assert [p.volume for p in t.all_parcels] == [5]
+    assert t.route == ['A', 'B', 'A']
+    assert t.unpack(1).volume == 5
+    assert (t.sum_vol(), t.route) == (0, ['A'])
+
+    f = Fleet()
+    for k in range(2):
+        f.add_truck(Truck(k, 20, 'A'))
+    f.trucks[0].pack(Parcel(9, 5, 'A', 'B'))
+    with pytest.raises(ValueError):
+        f.trucks[1].pack(Parcel(9, 5, 'A', 'B'))
+    assert f.trucks[1].all_parcels == []
+    t = Truck(2, 20, 'A')
+    t.pack(Parcel(9, 5, 'A', 'C'))
+    with pytest.raises(ValueError):
+        f.add_truck(t)
+    assert f.truck_of(9) is f.trucks[0]
+    assert f.unpack(8) is None
+    assert f.unpack(9).par_id == 9
+    assert f.truck_of(9) is None
+    f.trucks[1].pack(Parcel(9, 5, 'A', 'B'))
+    assert f.truck_of(9) is f.trucks[1]
+    f.trucks[1].clear()
+    assert f.truck_of(9) is None
+
+
+def test_fleet_move_and_unpack_keep_trucks_consistent() -> None:
+    """Test that a random series of Fleet.move and Fleet.unpack calls leaves
+    every truck with the load and stops of its remaining parcels, and that
+    Fleet.truck_of finds each parcel's truck."""
+    rand = random.Random(3)
+    f = Fleet()
+    for k in range(6):
+        f.add_truck(Truck(k, 40, 'York'))
+    parcels = [Parcel(k, rand.randint(1, 8), 'York', rand.choice('ABCDE'))
+               for k in range(50)]
+    for par in parcels:
+        rand.choice(f.trucks).pack(par)
+    for dummy in range(300):
+        par = rand.choice(parcels)
+        if rand.random() < 0.1:
+            f.unpack(par.par_id)
+        else:
+            f.move(par.par_id, rand.choice(f.trucks))
+    for truck in f.trucks:
+        assert truck.sum_vol() == truck._recount_vol() <= truck.capacity
+        stops = set(truck.route[1:-1])
+        assert stops == {p.destination for p in truck.all_parcels}
+        assert (len(truck.route) == 1) == (len(truck.all_parcels) == 0)
+        for par in truck.all_parcels:
+            assert f.truck_of(par.par_id) is truck
+
+
+def test_fleet_snapshot_round_trip(tmp_path: pathlib.Path) -> None:
+    """Test that a scheduled fleet with reordered routes is restored from its
+    snapshot with the same allocations, routes and loads, and that a
+    truncated snapshot is rejected."""
+    f = read_trucks('data/truck-data-small.txt', 'Toronto')
+    GreedyScheduler({'parcel_priority': 'destination',
+                     'parcel_order': 'non-decreasing',
+                     'truck_order': 'non-decreasing'}).schedule(
+        read_parcels('data/parcel-data-small.txt'), f.trucks)
+    for truck in f.trucks:
+        truck.reroute(truck.route[-2:0:-1])
+    path = tmp_path / 'fleet.snap'
+    f.save(str(path))
+    g = load_fleet(str(path))
+    assert g.parcel_allocations() == f.parcel_allocations()
+    assert [t.route for t in g.trucks] == [t.route for t in f.trucks]
+    assert [t.unused_space() for t in g.trucks] == \
+        [t.unused_space() for t in f.trucks]
+    path.write_bytes(path.read_bytes()[:-8])
+    with pytest.raises(ValueError):
+        load_fleet(str(path))
+
+
 def test_priority_queue_is_empty_doctest() -> None:
     """Test the doctest provided for PriorityQueue.is_empty"""
     pq = PriorityQueue(str.__lt__)
@@ -184,6 +393,21 @@ def test_priority_queue_add_remove_doctest() -> None:
     assert pq.remove() == 'monalisa'
 
 
+def test_priority_queue_key_matches_comparator() -> None:
+    """Test that a key-based PriorityQueue loaded with add_all removes items
+    in the same FIFO-priority order as a comparator-based one."""
+    words = ['fred', 'arju', 'monalisa', 'hat', 'bob', 'sue', 'alexandra']
+    by_cmp = PriorityQueue(_shorter)
+    for word in words:
+        by_cmp.add(word)
+    by_key = PriorityQueue(key=len)
+    by_key.add_all(words)
+    assert len(by_key) == len(words)
+    while not by_cmp.is_empty():
+        assert by_key.remove() == by_cmp.remove()
+    assert by_key.is_empty()
+
+
 def test_greedy_scheduler_example() -> None:
     """Test GreedyScheduler on the example provided."""
     p17 = Parcel(17, 25, 'York', 'Toronto')
@@ -228,6 +452,501 @@ def test_greedy_scheduler_example() -> None:
     assert truck_parcels[3] == [17]
 
 
+def test_truck_index_matches_linear_scan() -> None:
+    """Test that TruckIndex picks the same Truck as a scan over the list of
+    Trucks with enough unused space, including the tie-break."""
+    trucks = [Truck(k, 10 + (k * 7) % 13, 'Toronto') for k in range(20)]
+    index = TruckIndex(trucks)
+    for k in range(60):
+        volume = 1 + (k * 5) % 9
+        fits = [t for t in trucks if t.unused_space() >= volume]
+        if not fits:
+            assert index.tightest(volume) is None
+            assert index.loosest(volume) is None
+        else:
+            spaces = [t.unused_space() for t in fits]
+            assert index.tightest(volume) is fits[spaces.index(min(spaces))]
+            assert index.loosest(volume) is fits[spaces.index(max(spaces))]
+            truck = fits[k % len(fits)]
+            truck.pack(Parcel(k, volume, 'Toronto', 'Hamilton'))
+            index.update(truck)
+
+
+def test_bin_packing_matches_linear_scan() -> None:
+    """Test that BinPackingScheduler packs each Parcel, largest first, onto
+    the Truck a scan over the list of Trucks would pick."""
+    parcels = [Parcel(k, 1 + (k * 11) % 17, 'York', 'City' + str(k % 4))
+               for k in range(150)]
+    ordered = sorted(parcels, key=lambda p: -p.volume)
+    for algorithm in ['best-fit', 'first-fit']:
+        trucks = [Truck(k, 20 + (k * 7) % 23, 'York') for k in range(25)]
+        expected = {}
+        spaces = [t.capacity for t in trucks]
+        for p in ordered:
+            fits = [k for k in range(len(trucks)) if spaces[k] >= p.volume]
+            if fits and algorithm == 'best-fit':
+                fits = [min(fits, key=lambda k: spaces[k])]
+            if fits:
+                spaces[fits[0]] -= p.volume
+                expected.setdefault(trucks[fits[0]].truck_id, []).append(
+                    p.par_id)
+        scheduler = BinPackingScheduler({'algorithm': algorithm})
+        unscheduled = scheduler.schedule(parcels, trucks)
+        f = Fleet()
+        for truck in trucks:
+            f.add_truck(truck)
+        allocations = {tid: ids for tid, ids in f.parcel_allocations().items()
+                       if ids}
+        assert allocations == expected
+        assert len(unscheduled) == len(parcels) - sum(
+            len(ids) for ids in expected.values())
+
+
+def test_cluster_scheduler_keeps_destinations_together() -> None:
+    """Test that ClusterScheduler gives each Truck a single destination when
+    every cluster fits on some Truck, and splits a cluster only across Trucks
+    that deliver nothing else."""
+    parcels = [Parcel(k, 2 + k % 3, 'York', 'City' + str(k % 6))
+               for k in range(60)]
+    trucks = [Truck(k, 40 + 5 * k, 'York') for k in range(8)]
+    assert ClusterScheduler().schedule(parcels, trucks) == []
+    for t in trucks:
+        assert len(t.route) <= 3
+
+    parcels.extend(Parcel(100 + k, 5, 'York', 'Big') for k in range(30))
+    trucks = [Truck(k, 40 + 5 * k, 'York') for k in range(8)]
+    unscheduled = ClusterScheduler().schedule(parcels, trucks)
+    packed = sum(len(t.all_parcels) for t in trucks)
+    assert packed + len(unscheduled) == len(parcels)
+    for t in trucks:
+        if 'Big' in t.route:
+            assert t.route == ['York', 'Big', 'York']
+        assert t.unused_space() >= 0
+
+
+def test_cluster_scheduler_gives_far_clusters_large_trucks() -> None:
+    """Test that a ClusterScheduler with a DistanceMap places the farthest
+    cluster first, so that it gets the largest Truck and the nearer cluster
+    is split instead."""
+    dmap = DistanceMap()
+    dmap.add_distance('York', 'Near', 10)
+    dmap.add_distance('York', 'Far', 100)
+    parcels = [Parcel(k, 5, 'York', 'Near') for k in range(6)] \
+        + [Parcel(10 + k, 5, 'York', 'Far') for k in range(6)]
+    trucks = [Truck(1, 10, 'York'), Truck(2, 20, 'York'),
+              Truck(3, 30, 'York')]
+    assert ClusterScheduler(dmap).schedule(parcels, trucks) == []
+    assert [t.route for t in trucks] == [['York', 'Near', 'York'],
+                                         ['York', 'Near', 'York'],
+                                         ['York', 'Far', 'York']]
+
+    trucks = [Truck(1, 10, 'York'), Truck(2, 20, 'York'),
+              Truck(3, 30, 'York')]
+    assert ClusterScheduler().schedule(parcels, trucks) == []
+    assert trucks[2].route == ['York', 'Near', 'York']
+
+
+def test_random_scheduler_seeded() -> None:
+    """Test that RandomScheduler respects capacities and that two schedulers
+    with the same seed produce the same schedule."""
+    parcels = [Parcel(k, 1 + k % 7, 'York', 'City' + str(k % 5))
+               for k in range(200)]
+    allocations = []
+    for dummy in range(2):
+        trucks = [Truck(k, 40 + k % 11, 'York') for k in range(15)]
+        unscheduled = RandomScheduler(7).schedule(parcels, trucks)
+        f = Fleet()
+        for truck in trucks:
+            assert truck.sum_vol() <= truck.capacity
+            f.add_truck(truck)
+        packed = sum(len(ids) for ids in f.parcel_allocations().values())
+        assert packed + len(unscheduled) == len(parcels)
+        allocations.append(f.parcel_allocations())
+    assert allocations[0] == allocations[1]
+
+
+@pytest.mark.parametrize('num_parcels, num_trucks', [(200, 40), (60, 60)])
+def test_improve_schedule_never_worse(tmp_path: pathlib.Path,
+                                      num_parcels: int,
+                                      num_trucks: int) -> None:
+    """Test that local search keeps every parcel exactly once and every truck
+    within its capacity, and never leaves more unscheduled volume, or the
+    same volume and a longer distance, both on an overloaded fleet and on one
+    with empty trucks to spare."""
+    parcel_file = str(tmp_path / 'parcels.txt')
+    truck_file = str(tmp_path / 'trucks.txt')
+    generate(parcel_file, truck_file, num_parcels=num_parcels,
+             num_trucks=num_trucks, seed=5)
+    parcels = read_parcels(parcel_file)
+    fleet = read_trucks(truck_file, 'Toronto')
+    m = read_distance_map('data/map-data.txt')
+    scheduler = GreedyScheduler({'parcel_priority': 'destination',
+                                 'parcel_order': 'non-decreasing',
+                                 'truck_order': 'non-decreasing'})
+    unscheduled = scheduler.schedule(parcels, fleet.trucks)
+    before = (sum(p.volume for p in unscheduled),
+              fleet.total_distance_travelled(m))
+    nonempty = fleet.num_nonempty_trucks()
+    left = improve_schedule(fleet, m, unscheduled, seed=2, max_moves=20000)
+    after = (sum(p.volume for p in left), fleet.total_distance_travelled(m))
+    assert after <= before
+    if before[0] == 0:
+        assert fleet.num_nonempty_trucks() <= nonempty
+    ids = [p.par_id for t in fleet.trucks for p in t.all_parcels]
+    assert sorted(ids + [p.par_id for p in left]) \
+        == sorted(p.par_id for p in parcels)
+    for t in fleet.trucks:
+        assert t.unused_space() >= 0
+        assert t.sum_vol() == sum(p.volume for p in t.all_parcels)
+
+
+def test_multi_start_keeps_best_run() -> None:
+    """Test that MultiStartScheduler keeps a run which is at least as good as
+    every single run, and that a pool of workers picks the same run."""
+    m = DistanceMap()
+    cities = ['York', 'A', 'B', 'C']
+    for i in range(len(cities)):
+        for j in range(i + 1, len(cities)):
+            m.add_distance(cities[i], cities[j], 3 * i + j)
+    parcels = [Parcel(k, 2 + (k * 5) % 9, 'York', cities[1 + k % 3])
+               for k in range(40)]
+    config = {'algorithm': 'greedy', 'parcel_priority': 'NA',
+              'parcel_order': 'NA', 'truck_order': 'non-decreasing',
+              'multi_start': 6, 'seed': 4,
+              'objective': ['unscheduled_volume', 'total_distance']}
+    allocations = []
+    for workers in [1, 2]:
+        scheduler = MultiStartScheduler(dict(config, workers=workers), m)
+        trucks = [Truck(k, 20 + k, 'York') for k in range(8)]
+        left = scheduler.schedule(parcels, trucks)
+        best = scheduler.evaluate(trucks, left)
+        for seed in scheduler.seeds:
+            fresh = [Truck(k, 20 + k, 'York') for k in range(8)]
+            assert best <= scheduler.evaluate(
+                fresh, scheduler.run(seed, parcels, fresh))
+        allocations.append([[p.par_id for p in t.all_parcels]
+                            for t in trucks])
+    assert allocations[0] == allocations[1]
+
+
+def test_multi_start_schedule_more_counts_packed_parcels() -> None:
+    """Test that MultiStartScheduler.schedule_more keeps the parcels already
+    packed, and keeps a run which is at least as good as every single run
+    made on trucks holding them."""
+    m = DistanceMap()
+    cities = ['York', 'A', 'B', 'C']
+    for i in range(len(cities)):
+        for j in range(i + 1, len(cities)):
+            m.add_distance(cities[i], cities[j], 3 * i + j)
+    parcels = [Parcel(k, 2 + (k * 5) % 9, 'York', cities[1 + k % 3])
+               for k in range(40)]
+    config = {'algorithm': 'random', 'multi_start': 6, 'seed': 4,
+              'objective': ['unscheduled_volume', 'total_distance']}
+    scheduler = MultiStartScheduler(config, m)
+    trucks = [Truck(k, 25 + k, 'York') for k in range(8)]
+    scheduler.schedule(parcels[:20], trucks)
+    packed = [list(t.all_parcels) for t in trucks]
+
+    def loaded() -> list:
+        """Return copies of the trucks holding the first batch."""
+        copies = [Truck(k, 25 + k, 'York') for k in range(8)]
+        for truck, pars in zip(copies, packed):
+            for par in pars:
+                truck.pack(par)
+        return copies
+
+    left = scheduler.schedule_more(parcels[20:], trucks)
+    for truck, pars in zip(trucks, packed):
+        assert truck.all_parcels[:len(pars)] == pars
+    best = scheduler.evaluate(trucks, left)
+    for seed in scheduler.seeds:
+        copies = loaded()
+        assert best <= scheduler.evaluate(
+            copies, scheduler.run(seed, parcels[20:], copies))
+
+
+def test_schedule_more_matches_scheduling_at_once() -> None:
+    """Test that scheduling parcels in two batches with schedule_more packs
+    the trucks as scheduling them in one go does, and that a GreedyScheduler
+    reusing its indexes agrees with one that builds them afresh."""
+    parcels = [Parcel(k, 1 + (k * 7) % 13, 'York', 'ABCD'[k % 4])
+               for k in range(60)]
+    config = {'parcel_priority': 'volume', 'parcel_order': 'non-increasing',
+              'truck_order': 'non-decreasing'}
+    allocations = []
+    for batches in [[parcels], [parcels[:25], parcels[25:]]]:
+        scheduler = OnlineGreedyScheduler(config)
+        trucks = [Truck(k, 30 + k, 'York') for k in range(10)]
+        left = scheduler.schedule(batches[0], trucks)
+        for batch in batches[1:]:
+            left += scheduler.schedule_more(batch, trucks)
+        allocations.append(([[p.par_id for p in t.all_parcels]
+                             for t in trucks], [p.par_id for p in left]))
+    assert allocations[0] == allocations[1]
+
+    allocations = []
+    for fresh in [False, True]:
+        scheduler = GreedyScheduler(config)
+        trucks = [Truck(k, 30 + k, 'York') for k in range(10)]
+        scheduler.schedule(parcels[:25], trucks)
+        if fresh:
+            scheduler = GreedyScheduler(config)
+        left = scheduler.schedule_more(parcels[25:], trucks)
+        assert all(t.unused_space() >= 0 for t in trucks)
+        allocations.append(([[p.par_id for p in t.all_parcels]
+                             for t in trucks], [p.par_id for p in left]))
+    assert allocations[0] == allocations[1]
+
+
+def test_generate_sizes_and_seed(tmp_path: pathlib.Path) -> None:
+    """Test that generate writes the requested numbers of parcels and trucks
+    with distinct ids, and that a seed reproduces the same data."""
+    files = [str(tmp_path / name) for name in ['p1', 't1', 'p2', 't2']]
+    generate(files[0], files[1], num_parcels=500, num_trucks=40, seed=7)
+    generate(files[2], files[3], num_parcels=500, num_trucks=40, seed=7)
+    parcels = read_parcels(files[0])
+    assert len({p.par_id for p in parcels}) == 500
+    assert all(p.source != p.destination for p in parcels)
+    trucks = read_trucks(files[1], 'Toronto').trucks
+    assert len({t.truck_id for t in trucks}) == 40
+    for first, second in [(files[0], files[2]), (files[1], files[3])]:
+        assert pathlib.Path(first).read_text() \
+            == pathlib.Path(second).read_text()
+
+
+def test_generate_map_is_consistent(tmp_path: pathlib.Path) -> None:
+    """Test that a generated map has a distance for every pair of generated
+    cities, and that these distances obey the triangle inequality."""
+    files = [str(tmp_path / name) for name in ['p', 't', 'm']]
+    generate(files[0], files[1], num_parcels=300, num_trucks=10, seed=3,
+             num_cities=12, volume_distribution='lognormal',
+             map_filename=files[2])
+    m = read_distance_map(files[2])
+    for p in read_parcels(files[0]):
+        assert p.destination != 'Toronto' or p.source == 'Toronto'
+        assert p.volume >= 1
+    cities = city_names(12)
+    for a in cities:
+        for b in cities:
+            if a != b:
+                assert m.distance(a, b) == m.distance(b, a) > 0
+                for c in cities:
+                    if c not in (a, b):
+                        assert m.distance(a, b) \
+                            <= m.distance(a, c) + m.distance(c, b)
+
+
+def test_generate_many_cities_pairs(tmp_path: pathlib.Path,
+                                    monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that parcels drawn without a table of city pairs, as they are
+    for many cities, use every allowed pair and no other."""
+    monkeypatch.setattr('generator._PAIR_TABLE_CITIES', 0)
+    files = [str(tmp_path / name) for name in ['p', 't']]
+    generate(files[0], files[1], num_parcels=2000, num_trucks=1, seed=4,
+             num_cities=5)
+    cities = city_names(5)
+    assert {(p.source, p.destination) for p in read_parcels(files[0])} \
+        == {(a, b) for a in cities for b in cities
+            if a != b and (b != 'Toronto' or a == 'Toronto')}
+
+
+def test_read_parcels_gzip_and_errors(tmp_path: pathlib.Path) -> None:
+    """Test that the parcel readers accept gzip-compressed files, and report
+    the line number of a malformed line."""
+    plain = tmp_path / 'parcels.txt'
+    plain.write_text('53, Woodstock, Mississauga, 150\n\n'
+                     '764, Kingston, Hamilton, 100\n')
+    packed = tmp_path / 'parcels.txt.gz'
+    with gzip.open(packed, 'wt') as file:
+        file.write(plain.read_text())
+    table = read_parcel_table(str(packed))
+    assert [(p.par_id, p.volume, p.source, p.destination) for p in table] \
+        == [(53, 150, 'Woodstock', 'Mississauga'),
+            (764, 100, 'Kingston', 'Hamilton')]
+    assert [p.par_id for p in read_parcels(str(plain))] == [53, 764]
+
+    plain.write_text('53, Woodstock, Mississauga, 150\n'
+                     '764, Kingston, Hamilton\n')
+    with pytest.raises(ValueError, match='line 2'):
+        read_parcels(str(plain))
+
+
+def test_compare_algorithms_in_pool(tmp_path: pathlib.Path,
+                                    monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that explore.compare_algorithms writes the same rows, in the
+    order of its configurations, when a pool of workers runs them."""
+    config = {key: str(pathlib.Path(value).resolve())
+              if key.endswith('_file') else value
+              for key, value in test_arguments[0][1].items()}
+    config['seed'] = 0
+    (tmp_path / 'config.json').write_text(json.dumps(config))
+    (tmp_path / 'data').mkdir()
+    monkeypatch.chdir(tmp_path)
+    tables = []
+    for workers in [1, 3]:
+        explore.compare_algorithms('config.json', workers)
+        tables.append((tmp_path / 'data' / 'results.csv').read_text())
+    assert tables[0] == tables[1]
+    rows = tables[0].splitlines()[1:]
+    assert [row.split(',')[0].strip() for row in rows] == \
+        ['random'] + ['greedy'] * 8 + ['best-fit', 'first-fit', 'cluster']
+
+
+def test_add_parcels_drops_routing_distances() -> None:
+    """Test that an experiment with reordered routes stops reporting the
+    distances before and after routing once parcels have been added."""
+    config = dict(test_arguments[0][1])
+    config['optimize_routes'] = True
+    fleet = Fleet()
+    for k in range(3):
+        fleet.add_truck(Truck(k, 1000, 'Toronto'))
+    experiment = SchedulingExperiment(config, fleet=fleet)
+    assert 'distance_after_routing' in experiment.run()
+    assert experiment.add_parcels([Parcel(999, 5, 'Toronto', 'London')]) \
+        == []
+    results = experiment.stats()
+    assert 'distance_before_routing' not in results
+    assert 'distance_after_routing' not in results
+    assert results['avg_distance'] == \
+        experiment.fleet.average_distance_travelled(experiment.dmap)
+
+
+def test_instrumented_experiment(tmp_path: pathlib.Path) -> None:
+    """Test that an instrumented experiment reports the same statistics as
+    a plain one, plus the times and counts of its phases, dumps a profile,
+    and leaves the scheduler's methods as they were."""
+    config = dict(test_arguments[0][1])
+    plain = SchedulingExperiment(config).run()
+    assert not any(key.startswith('time_') for key in plain)
+    config['instrument'] = True
+    config['profile_file'] = str(tmp_path / 'run.prof')
+    experiment = SchedulingExperiment(config)
+    results = experiment.run()
+    assert {key: results[key] for key in plain} == plain
+    assert experiment.stats() == plain
+    parcels = read_parcels(config['parcel_file'])
+    assert results['count_pack'] == len(parcels) - results['unscheduled']
+    assert results['count_candidate_scan'] == len(parcels)
+    assert results['count_candidate_trucks_per_parcel'] == \
+        results['count_candidate_trucks'] / len(parcels)
+    assert results['count_stats'] == 1
+    assert results['count_sum_vol'] > 0
+    assert results['time_truck_selection'] >= 0.0
+    assert not hasattr(Truck.pack, '__wrapped__')
+    assert pstats.Stats(config['profile_file']).total_calls > 0
+
+
+def test_streaming_experiment() -> None:
+    """Test that a streaming experiment schedules every parcel of the file,
+    and that OnlineGreedyScheduler consumes an iterator in arrival order."""
+    config = dict(test_arguments[0][1])
+    config['streaming'] = True
+    results = SchedulingExperiment(config).run()
+    assert results['unused_trucks'] == 0
+    assert results['unscheduled'] == 0
+
+    t1 = Truck(1, 10, 'York')
+    t2 = Truck(2, 10, 'York')
+    parcels = iter([Parcel(1, 6, 'York', 'London'),
+                    Parcel(2, 6, 'York', 'Guelph'),
+                    Parcel(3, 4, 'York', 'London'),
+                    Parcel(4, 5, 'York', 'Guelph')])
+    config = {'parcel_priority': 'volume', 'parcel_order': 'non-decreasing',
+              'truck_order': 'non-decreasing'}
+    unscheduled = OnlineGreedyScheduler(config).schedule(parcels, [t1, t2])
+    assert [p.par_id for p in unscheduled] == [4]
+    assert [p.par_id for p in t1.all_parcels] == [1, 3]
+    assert [p.par_id for p in t2.all_parcels] == [2]
+
+
+def test_parcel_table_schedules_like_list() -> None:
+    """Test that a ParcelTable read from a file holds the same parcels as the
+    list read from it, that a GreedyScheduler schedules both the same, and
+    that neither Parcels nor Trucks have a __dict__."""
+    config = test_arguments[0][1]
+    parcels = read_parcels(config['parcel_file'])
+    table = read_parcel_table(config['parcel_file'])
+    assert len(table) == len(parcels)
+    assert not hasattr(table[0], '__dict__')
+    allocations = []
+    for source in (parcels, table):
+        f = Fleet()
+        for k in range(3):
+            f.add_truck(Truck(k, 100, 'Toronto'))
+        unscheduled = GreedyScheduler(config).schedule(source, f.trucks)
+        allocations.append((f.parcel_allocations(),
+                            [p.par_id for p in unscheduled]))
+    assert allocations[0] == allocations[1]
+    assert not hasattr(f.trucks[0], '__dict__')
+
+
+def test_parcel_store_matches_text_file(tmp_path: pathlib.Path) -> None:
+    """Test that a parcel store converted from a parcel file holds the same
+    parcels, and that a GreedyScheduler schedules it as it schedules the
+    parcels read from the text file."""
+    path = str(tmp_path / 'parcels.store')
+    parcels = read_parcels('data/parcel-data-small.txt')
+    assert convert_parcels('data/parcel-data-small.txt', path) == len(parcels)
+    with ParcelStore(path) as store:
+        assert [(p.par_id, p.volume, p.source, p.destination)
+                for p in store] \
+            == [(p.par_id, p.volume, p.source, p.destination)
+                for p in parcels]
+        assert store[-1].par_id == parcels[-1].par_id
+        for priority in ['volume', 'destination']:
+            for order in ['non-decreasing', 'non-increasing']:
+                config = {'parcel_priority': priority, 'parcel_order': order,
+                          'truck_order': 'non-increasing'}
+                allocations = []
+                for source in [parcels, store]:
+                    f = read_trucks('data/truck-data-small.txt', 'Toronto')
+                    left = GreedyScheduler(config).schedule(source, f.trucks)
+                    allocations.append((f.parcel_allocations(),
+                                        [p.par_id for p in left]))
+                assert allocations[0] == allocations[1]
+
+    config = dict(test_arguments[0][1])
+    config['parcel_store'] = path
+    experiment = SchedulingExperiment(config)
+    assert experiment.run() == SchedulingExperiment(test_arguments[0][1]).run()
+    with pytest.raises(ValueError):
+        experiment.parcels[0]
+
+
+def test_optimize_routes_never_longer() -> None:
+    """Test that optimize_routes keeps every destination on each route and
+    never makes the fleet travel further."""
+    m = DistanceMap()
+    cities = ['Toronto', 'Hamilton', 'London', 'Guelph', 'Ottawa', 'York']
+    for i in range(len(cities)):
+        for j in range(i + 1, len(cities)):
+            m.add_distance(cities[i], cities[j], (i * 37 + j * 11) % 50 + 5)
+    f = Fleet()
+    for k in range(4):
+        t = Truck(k, 100, 'Toronto')
+        for j in range(12):
+            t.pack(Parcel(100 * k + j, 1, 'Toronto',
+                          cities[1 + (j * (k + 2)) % 5]))
+        f.add_truck(t)
+    destinations = [{p.destination for p in t.all_parcels} for t in f.trucks]
+    before, after = optimize_routes(f, m)
+    assert after <= before
+    assert after == f.total_distance_travelled(m)
+    for k in range(len(f.trucks)):
+        route = f.trucks[k].route
+        assert route[0] == route[-1] == 'Toronto'
+        assert set(route[1:-1]) == destinations[k]
+        assert len(route[1:-1]) == len(destinations[k])
+
+    config = dict(test_arguments[0][1])
+    config['optimize_routes'] = True
+    results = SchedulingExperiment(config).run()
+    assert results['distance_after_routing'] \
+        <= results['distance_before_routing']
+    assert results['avg_distance'] * 3 \
+        == pytest.approx(results['distance_after_routing'])
+
+
 ################################################################################
 # The test below uses pytest.mark.parametrize.
 #